@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# actions - Concurrent action pipeline with per-action deadlines
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Concurrent action pipeline with per-action deadlines
+
+Actions, such as notifiers and DDNS provider updates, run at the same time
+on a bounded number of threads, so the total time is that of the slowest
+action instead of the sum of all of them. An action still running past its
+timeout is reported as failed and abandoned: its thread is daemonic, as
+Python threads can't be killed.
+"""
+
+import time
+import logging
+import threading
+import collections
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+
+WORKERS = 4
+TIMEOUT = 60  # seconds, per action
+
+log = logging.getLogger(__name__)
+
+Result = collections.namedtuple('Result', 'name ok value error elapsed')
+
+
+class Action(object):
+    """A named callable, run as func(*args, **kwargs) within timeout seconds
+
+    Any exception raised by func marks the action as failed.
+    """
+    def __init__(self, name, func, args=(), kwargs=None, timeout=TIMEOUT):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "<Action %s>" % self.name
+
+
+def run(actions, workers=WORKERS, clock=time.time):
+    """Run actions concurrently, return a list of Result in the same order"""
+    actions = list(actions)
+    done = queue.Queue()
+    pending = list(actions)
+    running = {}  # name: (action, start)
+    results = {}
+
+    def worker(action, start):
+        try:
+            value, error = action.func(*action.args, **action.kwargs), None
+        except Exception as e:
+            log.debug("%s failed", action.name, exc_info=True)
+            value, error = None, e
+        done.put((action.name, start, value, error, clock()))
+
+    while pending or running:
+        while pending and len(running) < workers:
+            action = pending.pop(0)
+            start = clock()
+            running[action.name] = (action, start)
+            thread = threading.Thread(target=worker, args=(action, start),
+                                      name="action-%s" % action.name)
+            thread.daemon = True
+            thread.start()
+
+        deadline = min(start + action.timeout for action, start in running.values())
+        try:
+            name, start, value, error, end = done.get(timeout=max(deadline - clock(), 0))
+        except queue.Empty:
+            now = clock()
+            for name, (action, start) in list(running.items()):
+                if now >= start + action.timeout:
+                    log.warning("%s timed out after %s seconds", name, action.timeout)
+                    results[name] = Result(name, False, None, "timed out", now - start)
+                    del running[name]
+            continue
+
+        if name in running and running[name][1] == start:
+            del running[name]
+            results[name] = Result(name, error is None, value, error, end - start)
+
+    return [results[action.name] for action in actions]
+
+
+def exit_code(results):
+    """Return 0 if all actions succeeded, 1 otherwise"""
+    return 0 if all(result.ok for result in results) else 1
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# digest - Collect events across runs and email them as summaries
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Digest notifications: events collected across runs, emailed as summaries
+
+Instead of one email per event, such as an IP change or a failed provider
+update, events go to a local SQLite store, and are sent as a single summary
+email per set of recipients, grouped by host and event kind. A summary goes
+out once its oldest event is window seconds old, or right away when an
+event reaches the threshold severity. Events at the immediate severity, if
+set, are still emailed on their own, right away.
+
+Severities are logging levels. Pending summaries are only checked for when
+an event is added or flush() is called, so a summary may wait past its
+window until the next run. Every event records its host, so a store shared
+by several hosts gets them all in one summary.
+
+Emails go through mailqueue, so nothing here waits for the mail server.
+"""
+
+import os.path as osp
+import json
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import datetime
+import collections
+
+import xdg.BaseDirectory as xdg
+
+import sendmail
+import mailqueue
+
+
+WINDOW = 24 * 60 * 60  # seconds
+THRESHOLD = logging.CRITICAL  # events that send the summary right away
+
+
+def severity(value):
+    """argparse type for a logging level name, or 'none' for None"""
+    if value == 'none':
+        return None
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise argparse.ArgumentTypeError("invalid severity: %s" % value)
+    return level
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS events (
+        time        REAL NOT NULL,
+        host        TEXT NOT NULL,
+        source      TEXT NOT NULL,
+        kind        TEXT NOT NULL,
+        severity    INTEGER NOT NULL,
+        subject     TEXT NOT NULL,
+        text        TEXT NOT NULL,
+        attachments TEXT NOT NULL,
+        sender      TEXT NOT NULL,
+        recipients  TEXT NOT NULL
+    );
+"""
+
+log = logging.getLogger(__name__)
+
+Event = collections.namedtuple('Event', 'id time host source kind severity'
+                                        ' subject text attachments')
+
+
+class Digest(object):
+    """Store of pending events, sent as summaries per recipients
+
+    immediate is the severity of events emailed on their own, or None.
+    The store is digest.db in sendmail's data dir, unless path is given.
+    """
+    def __init__(self, path=None, window=WINDOW, threshold=THRESHOLD,
+                 immediate=None, host=None, clock=time.time,
+                 send=mailqueue.enqueue):
+        self.path = path or osp.join(xdg.save_data_path('sendmail'), 'digest.db')
+        self.window = window
+        self.threshold = threshold
+        self.immediate = immediate
+        self.host = host or socket.gethostname()
+        self.clock = clock
+        self.send = send
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, sender, recipients, source, kind, subject, text="",
+            severity=logging.INFO, attachments=[]):
+        """Record an event, then send what is due, return the summaries sent
+
+        Events at the immediate severity are emailed right away instead.
+        """
+        if isinstance(recipients, basestring):
+            recipients = [recipients]
+        if isinstance(attachments, (basestring, sendmail.Attachment)):
+            attachments = [attachments]
+
+        if self.immediate is not None and severity >= self.immediate:
+            log.debug("Sending %s event of %s right away", kind, source)
+            self.send(sender, recipients, "%s: %s" % (self.host, subject), text,
+                      attachments)
+            return self.flush()
+
+        with self.db:
+            self.db.execute(
+                "INSERT INTO events (time, host, source, kind, severity, subject,"
+                " text, attachments, sender, recipients)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.clock(), self.host, source, kind, severity, subject, text,
+                 json.dumps([mailqueue.attachment_spec(_) for _ in attachments]),
+                 sender, ",".join(recipients)))
+        log.debug("Recorded %s event of %s for the digest", kind, source)
+        return self.flush()
+
+    def pending(self):
+        """Return a dict of (sender, recipients): list of Event, oldest first"""
+        groups = {}
+        for row in self.db.execute(
+                "SELECT rowid, time, host, source, kind, severity, subject, text,"
+                " attachments, sender, recipients FROM events ORDER BY rowid"):
+            groups.setdefault((row[9], row[10]), []).append(Event(*row[:9]))
+        return groups
+
+    def due(self, events):
+        """True if a summary of events, oldest first, should go out now"""
+        return bool(events) and (
+            self.clock() - events[0].time >= self.window or
+            max(_.severity for _ in events) >= self.threshold)
+
+    def flush(self, force=False):
+        """Send the summaries that are due, or all of them if force
+
+        Return how many were sent.
+        """
+        sent = 0
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")  # so concurrent runs send once
+            for (sender, recipients), events in sorted(self.pending().items()):
+                if not (force or self.due(events)):
+                    continue
+                subject, text = summary(events)
+                attachments = [sendmail.Attachment(*spec) for event in events
+                               for spec in json.loads(event.attachments)]
+                self.send(sender, recipients.split(','), subject, text, attachments)
+                self.db.executemany("DELETE FROM events WHERE rowid = ?",
+                                    [(_.id,) for _ in events])
+                log.info("Sent digest of %d events to %s", len(events), recipients)
+                sent += 1
+        return sent
+
+
+def summary(events):
+    """Return (subject, text) of a summary of Event, oldest first
+
+    The text has a section per host, and within it one per event kind.
+    """
+    def timestamp(t):
+        return datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')
+
+    hosts = sorted(set(_.host for _ in events))
+    worst = max(_.severity for _ in events)
+    subject = "Digest of %d event%s on %s" % (len(events), "" if len(events) == 1 else "s",
+                                             ", ".join(hosts))
+    if worst >= logging.WARNING:
+        subject += " [%s]" % logging.getLevelName(worst)
+
+    lines = ["From %s to %s" % (timestamp(events[0].time), timestamp(events[-1].time))]
+    for host in hosts:
+        lines.extend(("", "== %s ==" % host))
+        kinds = {}
+        for event in events:
+            if event.host == host:
+                kinds.setdefault((event.source, event.kind), []).append(event)
+        for (source, kind), group in sorted(kinds.items()):
+            lines.extend(("", "-- %s: %s (%d) --" % (source, kind, len(group))))
+            for event in group:
+                lines.append("%s %-8s %s" % (timestamp(event.time),
+                                             logging.getLevelName(event.severity),
+                                             event.subject))
+                if event.text and event.text != event.subject:
+                    lines.extend(("    " + _).rstrip() for _ in event.text.splitlines())
+    return subject, "\n".join(lines) + "\n"
@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# dnsquery - Minimal DNS client to check records at authoritative nameservers
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Minimal DNS (RFC 1035) client to check records at authoritative nameservers
+
+Records are asked straight to the nameservers of each hostname's zone, so no
+resolver cache can return a stale answer. The nameservers are found with
+the system resolvers, from /etc/resolv.conf. All queries of a lookup are
+sent at once on a single socket and matched by ID as they arrive, and
+answers are cached for their TTL.
+"""
+
+import time
+import socket
+import struct
+import random
+import select
+import logging
+import threading
+
+
+TIMEOUT = 3  # seconds, overall
+RETRIES = 2  # retransmissions of each query
+PORT = 53
+RESOLV_CONF = '/etc/resolv.conf'
+
+# Record types and classes
+A, NS, CNAME, SOA, AAAA, ANY = 1, 2, 5, 6, 28, 255
+IN = 1
+TYPES = {'A': A, 'NS': NS, 'CNAME': CNAME, 'SOA': SOA, 'AAAA': AAAA, 'ANY': ANY}
+
+# Response codes
+NOERROR, FORMERR, SERVFAIL, NXDOMAIN, NOTIMP, REFUSED = range(6)
+
+log = logging.getLogger(__name__)
+
+
+class DnsError(Exception):
+    pass
+
+
+def encode_name(name):
+    """Return name in DNS wire format, as length-prefixed labels"""
+    data = b''
+    for label in name.strip('.').split('.'):
+        if not label:
+            continue
+        label = label.encode('idna')
+        if len(label) > 63:
+            raise DnsError("Label too long in %s" % name)
+        data += struct.pack('!B', len(label)) + label
+    return data + b'\0'
+
+
+def decode_name(data, pos):
+    """Return (name, position after it) of a possibly compressed name at pos"""
+    labels = []
+    end = None
+    for _ in range(128):  # guard against compression loops
+        if pos >= len(data):
+            raise DnsError("Truncated name")
+        length = struct.unpack('!B', data[pos:pos + 1])[0]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = pos + 2
+            pos = struct.unpack('!H', data[pos:pos + 2])[0] & 0x3FFF
+        elif length:
+            labels.append(data[pos + 1:pos + 1 + length].decode('ascii', 'replace'))
+            pos += 1 + length
+        else:
+            return ".".join(labels).lower(), end if end is not None else pos + 1
+    raise DnsError("Compression loop in name")
+
+
+def build_query(qid, name, qtype, recurse=True):
+    """Return a query message for name and qtype, a type name or number"""
+    qtype = TYPES.get(qtype, qtype)
+    flags = 0x0100 if recurse else 0  # RD
+    return (struct.pack('!HHHHHH', qid, flags, 1, 0, 0, 0) +
+            encode_name(name) + struct.pack('!HH', qtype, IN))
+
+
+def parse_rdata(data, pos, rtype, length):
+    if rtype == A and length == 4:
+        return socket.inet_ntoa(data[pos:pos + 4])
+    if rtype == AAAA and length == 16:
+        return socket.inet_ntop(socket.AF_INET6, data[pos:pos + 16])
+    if rtype in (NS, CNAME):
+        return decode_name(data, pos)[0]
+    if rtype == SOA:
+        return decode_name(data, pos)[0]  # just the primary nameserver
+    return data[pos:pos + length]
+
+
+def parse_message(data):
+    """Return a dict of a DNS message: id, flags, rcode, truncated, question,
+    and the answer, authority and additional lists of
+    (name, type, ttl, data) records
+    """
+    if len(data) < 12:
+        raise DnsError("Truncated message")
+    qid, flags, qdcount, ancount, nscount, arcount = struct.unpack('!HHHHHH', data[:12])
+    message = dict(id=qid, flags=flags, rcode=flags & 0xF,
+                   truncated=bool(flags & 0x0200), question=None)
+
+    pos = 12
+    for _ in range(qdcount):
+        name, pos = decode_name(data, pos)
+        message['question'] = (name,) + struct.unpack('!H', data[pos:pos + 2])
+        pos += 4
+
+    for section, count in (('answer', ancount),
+                           ('authority', nscount),
+                           ('additional', arcount)):
+        records = message[section] = []
+        for _ in range(count):
+            name, pos = decode_name(data, pos)
+            if pos + 10 > len(data):
+                raise DnsError("Truncated record")
+            rtype, _, ttl, length = struct.unpack('!HHLH', data[pos:pos + 10])
+            pos += 10
+            if pos + length > len(data):
+                raise DnsError("Truncated record")
+            records.append((name, rtype, ttl, parse_rdata(data, pos, rtype, length)))
+            pos += length
+    return message
+
+
+def send_tcp(server, data, timeout=TIMEOUT):
+    """Send a DNS message to server over TCP, return the raw reply"""
+    sock = socket.create_connection(server, timeout)
+    try:
+        sock.sendall(struct.pack('!H', len(data)) + data)
+        reply = b''
+        length = None
+        while length is None or len(reply) < length + 2:
+            chunk = sock.recv(65535)
+            if not chunk:
+                raise DnsError("Connection closed by %s" % server[0])
+            reply += chunk
+            if length is None and len(reply) >= 2:
+                length = struct.unpack('!H', reply[:2])[0]
+    finally:
+        sock.close()
+    return reply[2:length + 2]
+
+
+def send_udp(server, data, timeout=TIMEOUT, retries=RETRIES):
+    """Send a DNS message to server over UDP, return the raw reply
+
+    The message is retransmitted up to retries times, evenly spread within
+    timeout. Replies with another ID are ignored.
+    """
+    family = socket.AF_INET6 if ':' in server[0] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    deadline = time.time() + timeout
+    interval = float(timeout) / (retries + 1)
+    try:
+        while time.time() < deadline:
+            sock.sendto(data, server)
+            retry = min(time.time() + interval, deadline)
+            while True:
+                remaining = retry - time.time()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    reply, addr = sock.recvfrom(65535)
+                except socket.timeout:
+                    break
+                if addr[0] == server[0] and reply[:2] == data[:2]:
+                    return reply
+    finally:
+        sock.close()
+    raise DnsError("No reply from %s" % server[0])
+
+
+def query_tcp(server, name, qtype, timeout=TIMEOUT, recurse=True):
+    """Query a single server over TCP, for truncated UDP answers"""
+    qid = random.randint(0, 0xFFFF)
+    message = parse_message(send_tcp(server, build_query(qid, name, qtype, recurse),
+                                     timeout))
+    if message['id'] != qid:
+        raise DnsError("Mismatched reply from %s" % server[0])
+    return message
+
+
+def query_many(queries, timeout=TIMEOUT, retries=RETRIES, recurse=True):
+    """Send all (server, name, qtype) queries at once over UDP
+
+    server is an (address, port) tuple. Unanswered queries are retransmitted
+    up to retries times, evenly spread within timeout. Return a list of
+    parsed messages, or None for unanswered queries, in the same order.
+    Truncated answers are retried over TCP.
+    """
+    queries = list(queries)
+    results = [None] * len(queries)
+    pending = {}  # id: index
+    sockets = {}  # family: socket
+    ids = random.sample(range(0x10000), len(queries))
+    deadline = time.time() + timeout
+    interval = float(timeout) / (retries + 1)
+
+    def send(index):
+        server, name, qtype = queries[index]
+        family = socket.AF_INET6 if ':' in server[0] else socket.AF_INET
+        if family not in sockets:
+            sockets[family] = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            sockets[family].sendto(build_query(ids[index], name, qtype, recurse), server)
+        except socket.error as e:
+            log.debug("Query %s %s to %s failed: %s", name, qtype, server[0], e)
+
+    try:
+        for index in range(len(queries)):
+            pending[ids[index]] = index
+            send(index)
+
+        retry = time.time() + interval
+        while pending:
+            now = time.time()
+            if now >= deadline:
+                break
+            if now >= retry:
+                for index in pending.values():
+                    send(index)
+                retry = now + interval
+            ready = select.select(list(sockets.values()), [], [],
+                                  max(min(retry, deadline) - now, 0))[0]
+            for sock in ready:
+                try:
+                    data, addr = sock.recvfrom(65535)
+                    message = parse_message(data)
+                except (socket.error, DnsError) as e:
+                    log.debug("Invalid DNS reply: %s", e)
+                    continue
+                index = pending.get(message['id'])
+                if index is None or addr[0] != queries[index][0][0]:
+                    continue
+                del pending[message['id']]
+                if message['truncated']:
+                    try:
+                        message = query_tcp(*queries[index], timeout=timeout,
+                                            recurse=recurse)
+                    except (socket.error, DnsError) as e:
+                        log.debug("TCP query %s failed: %s", queries[index], e)
+                        continue
+                results[index] = message
+    finally:
+        for sock in sockets.values():
+            sock.close()
+
+    return results
+
+
+def system_resolvers(path=RESOLV_CONF):
+    """Return the list of (address, port) nameservers in resolv.conf"""
+    servers = []
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    servers.append((fields[1].split('%')[0], PORT))
+    except IOError as e:
+        log.debug("Could not read %s: %s", path, e)
+    return servers or [('127.0.0.1', PORT)]
+
+
+class Cache(object):
+    """Thread-safe cache of values that expire after their TTL"""
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self.entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self.entries[key] = (self.clock() + ttl, value)
+
+    def discard(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+cache = Cache()
+
+
+def parents(hostname):
+    """Yield hostname and each of its parent domains, up to the TLD"""
+    labels = hostname.strip('.').lower().split('.')
+    for i in range(len(labels)):
+        yield ".".join(labels[i:])
+
+
+def nameservers(hostnames, resolvers=None, timeout=TIMEOUT):
+    """Return a dict of hostname: list of (address, port) of its zone's
+    authoritative nameservers, found via the resolvers
+
+    Each hostname and its parent domains are asked for NS records, all at
+    once, and the closest domain that has them is the zone. Both the NS
+    records and the addresses of nameservers without glue are cached.
+    """
+    resolvers = resolvers or system_resolvers()
+    domains = set()
+    for hostname in hostnames:
+        domains.update(parents(hostname))
+
+    zones = {}  # domain: list of (nameserver, glue address or None)
+    todo = [_ for _ in domains if cache.get(('NS', _)) is None]
+    answers = query_many([(resolvers[0], _, NS) for _ in todo], timeout)
+    for domain, message in zip(todo, answers):
+        if not message or message['rcode'] != NOERROR:
+            continue
+        records = [(r[3], r[2]) for r in message['answer']
+                   if r[1] == NS and r[0] == domain]
+        if records:
+            glue = dict((r[0], r[3]) for r in message['additional'] if r[1] == A)
+            zones[domain] = [(_[0], glue.get(_[0])) for _ in records]
+            cache.put(('NS', domain), zones[domain], min(_[1] for _ in records))
+        else:
+            # Cache the absence too, it is not a zone cut
+            cache.put(('NS', domain), [], 60)
+
+    servers = {}  # hostname: nameservers of its zone
+    for hostname in hostnames:
+        for domain in parents(hostname):
+            servers[hostname] = zones.get(domain) or cache.get(('NS', domain))
+            if servers[hostname]:
+                break
+        else:
+            servers[hostname] = []
+
+    # Addresses of the nameservers without glue, fresh or cached ones alike
+    names = set(name for found in servers.values() for name, glue in found if not glue)
+    addresses = {}
+    for name in names:
+        cached = cache.get(('NS address', name))
+        if cached is not None:
+            addresses[name] = cached
+    names = sorted(names - set(addresses))
+    for name, message in zip(names, query_many([(resolvers[0], _, A) for _ in names],
+                                               timeout)):
+        if message:
+            records = [r for r in message['answer'] if r[1] == A]
+            addresses[name] = [r[3] for r in records]
+            if records:
+                cache.put(('NS address', name), addresses[name],
+                          min(r[2] for r in records))
+
+    return dict((hostname, [(address, PORT) for name, glue in servers[hostname]
+                            for address in ([glue] if glue else
+                                            addresses.get(name, []))])
+                for hostname in hostnames)
+
+
+def lookup(hostnames, qtype=A, servers=None, resolvers=None, timeout=TIMEOUT):
+    """Return a dict of hostname: sorted list of its qtype record addresses
+
+    Each hostname is asked to its authoritative nameservers, or to servers
+    if given, all at once. Answers are cached for their TTL. Hostnames
+    whose nameservers could not be found or did not answer map to None, and
+    nonexistent ones to an empty list.
+    """
+    qtype = TYPES.get(qtype, qtype)
+    result = {}
+    todo = []
+    for hostname in hostnames:
+        cached = cache.get((qtype, hostname))
+        if cached is not None:
+            result[hostname] = cached
+        else:
+            todo.append(hostname)
+    if not todo:
+        return result
+
+    if servers:
+        authorities = dict((_, list(servers)) for _ in todo)
+    else:
+        authorities = nameservers(todo, resolvers, timeout)
+
+    # Ask one nameserver per hostname, spreading the load among them
+    queries = []
+    for hostname in todo:
+        if authorities[hostname]:
+            queries.append((random.choice(authorities[hostname]), hostname, qtype))
+        else:
+            log.debug("No nameservers found for %s", hostname)
+            result[hostname] = None
+    messages = query_many(queries, timeout, recurse=False)
+
+    for (server, hostname, _), message in zip(queries, messages):
+        if not message or message['rcode'] not in (NOERROR, NXDOMAIN):
+            log.debug("No usable answer for %s from %s", hostname, server[0])
+            result[hostname] = None
+            continue
+        records = [r for r in message['answer'] if r[1] == qtype]
+        addresses = sorted(set(r[3] for r in records))
+        ttl = min([r[2] for r in records] or [60])
+        cache.put((qtype, hostname), addresses, ttl)
+        result[hostname] = addresses
+    return result
+
+
+def outdated(hostnames, ip, **kwargs):
+    """Return the hostnames whose records are not exactly ip, in the same order
+
+    Hostnames that could not be checked are also returned, to be safe.
+    """
+    qtype = AAAA if ':' in ip else A
+    records = lookup(hostnames, qtype, **kwargs)
+    return [_ for _ in hostnames if records.get(_) != [ip]]
+
+
+def forget(hostnames):
+    """Drop cached records of hostnames, for example after updating them"""
+    for hostname in hostnames:
+        for qtype in (A, AAAA):
+            cache.discard((qtype, hostname))
@@ -19,22 +19,37 @@
 #    along with this program. See <http://www.gnu.org/licenses/gpl.html>
 #
 # "dyndns" is actually a misnomer: it has nothing to do with DynDNS.com
-# For now, actions are to email the new IP and notify NoIP.com DDNS provider
+# Actions are to email the new IP and update the DDNS providers configured in
+# providers.conf, NoIP.com by default. See providers.py for the format.
 
 
 import sys
+import signal
 import os.path as osp
 import logging
 import argparse
 import xdg.BaseDirectory as xdg
 
-import sendmail
-import upnp
+import mailqueue
+import digest
+import actions
+import state
+import resolver
+import scheduler
+import gena
 import noip
+import providers
+import dnsquery
 
 
 myname = __name__
 logger = logging.getLogger(myname)
+http = None  # Shared noip.HttpAuth, see load_providers()
+digests = None  # Shared digest.Digest, see open_digest()
+
+# update() outcomes
+CHANGED, UNCHANGED, PENDING, FAILED = 'changed', 'unchanged', 'pending', 'failed'
+DEFERRED = 'deferred'  # only failed actions still backing off were left
 
 
 def main(args):
@@ -45,51 +60,362 @@ def main(args):
         logger.error("Recipients list is empty. Set them up once using command line arguments")
         return -1
 
-    ipfile = osp.join(xdg.save_config_path(myname), 'ip')
+    if args.watch:
+        return watch(args, recipients)
 
-    try:
-        logger.debug("Reading previous IP file: %s", ipfile)
-        with open(ipfile) as f:
-            oldip = f.read().strip()
-    except IOError as e:
-        logger.warn(e)
-        oldip = ""
+    if args.daemon:
+        return daemon(args, recipients)
 
-    try:
-        newip = upnp.external_ip()
-    except (upnp.UpnpError, upnp.socket.error) as e:
-        logger.error(e)
-        return
-
-    if newip == oldip:
-        logger.info("IP is still %s", oldip)
-        if not args.force:
-            return
-    elif newip == '0.0.0.0':
-        logger.info("IP changed to %s, ignoring", newip)
-        if not args.force:
-            return
-    else:
+    return 1 if update(args, recipients) == FAILED else None
+
+
+def update(args, recipients, newip=None, stats=None, newip6=None):
+    """Check the external IP, or use newip if given, and act if it changed
+
+    A new IP must first settle, see --settle-time and --settle-polls, and
+    only actions not yet synced to the current IP are run, so failed ones
+    are retried on later runs, with backoff. With --ipv6, the IPv6 address,
+    or newip6, is checked at the same time and tracked apart, so a change of
+    one address family does not count as a change of the other. Return
+    CHANGED, UNCHANGED, PENDING while a new IP settles or the gateway
+    reports 0.0.0.0, DEFERRED if all actions left are backing off, or
+    FAILED. Any failed action counts as FAILED.
+
+    With --digest, IP changes and failed provider updates are collected,
+    and emailed as a summary once due, checked on every call.
+    """
+    digests = open_digest(args)
+    if digests:
+        digests.flush()
+    with open_state(args) as store:
+        if not args.ipv6:
+            return _update({4: store}, args, recipients, {4: newip}, stats)
+        with open_state(args, 6) as store6:
+            return _update({4: store, 6: store6}, args, recipients,
+                           {4: newip, 6: newip6}, stats)
+
+
+def resolve(args, families, stats=None):
+    """Find the external IP of each address family at the same time
+
+    Return a dict of family: IP, or None if not found.
+    """
+    todo = []
+    if 4 in families:
+        todo.append(actions.Action(4, resolver.resolve, (args.sources,),
+                                   dict(quorum=args.quorum, stats=stats)))
+    if 6 in families:
+        todo.append(actions.Action(6, resolver.resolve6, (args.ipv6_sources,)))
+    return dict((result.name, result.value) for result in actions.run(todo))
+
+
+def settle(store, args, family, newip):
+    """Debounce and record newip, return (outcome, previous IP, sequence)
+
+    sequence is the list of IPs seen since the previous one settled, or
+    None if newip is not to be acted on.
+    """
+    sources = args.sources if family == 4 else args.ipv6_sources
+    oldip = store.current() or ""
+
+    if not newip:
+        logger.error("Could not get external IPv%d from %s", family, ", ".join(sources))
+        return FAILED, oldip, None
+
+    # Gateways report it while (re)connecting, so check again soon
+    if newip == '0.0.0.0':
+        logger.info("IP is %s, gateway not connected yet", newip)
+        return PENDING, oldip, None
+
+    sequence = [newip]
+    if not args.force:
+        sequence = store.observe(newip, args.settle_time, args.settle_polls)
+        if sequence is None:
+            logger.info("IP %s not settled yet", newip)
+            return PENDING, oldip, None
+        if len(sequence) > 1:
+            logger.info("IP flapped: %s", " -> ".join(sequence))
+
+    if store.record(newip):
         logger.info("IP changed from %s to %s", oldip, newip)
-        logger.debug("Saving new IP file", ipfile)
+    return (CHANGED if newip != oldip else UNCHANGED), oldip, sequence
+
+
+def _update(stores, args, recipients, newips, stats):
+    families = sorted(stores)
+    missing = [_ for _ in families if not newips.get(_)]
+    if missing:
+        newips = dict(newips)
+        newips.update(resolve(args, missing, stats))
+
+    outcomes = {}
+    settled = {}  # family: IP to act on
+    texts = {}  # family: its part of the email
+    for family in families:
+        outcome, oldip, sequence = settle(stores[family], args, family, newips[family])
+        outcomes[family] = outcome
+        if sequence is None:
+            continue
+        newip = settled[family] = sequence[-1]
+        text = newip
+        if len(sequence) > 1:
+            text += "\n\nAddresses seen since the last change: %s\n" % (
+                " -> ".join([oldip or "(none)"] + sequence))
+        texts[family] = text
+
+    if FAILED in outcomes.values():
+        outcome = FAILED
+    elif PENDING in outcomes.values():
+        outcome = PENDING
+    elif CHANGED in outcomes.values():
+        outcome = CHANGED
+    else:
+        outcome = UNCHANGED
+    if not settled:
+        return outcome
+
+    # Providers get both current addresses, so a protocol that would take a
+    # missing one from the request itself is told the known one instead
+    ip = settled.get(4) or stores[4].current()
+    ip6 = settled.get(6) or (stores[6].current() if 6 in stores else None)
+    summary = ", ".join(settled[_] for _ in sorted(settled))
+
+    todo = {'email': None}  # built below, once its families are known
+    for provider in load_providers(args):
+        todo[provider.name] = actions.Action(provider.name, update_provider,
+                                             (provider, ip, ip6, args.dns_check,
+                                              args.nameservers),
+                                             timeout=args.action_timeout)
+
+    # Families each target is out of date for, and those backing off
+    outdated = {}
+    waiting = {}
+    for family, newip in settled.items():
+        store = stores[family]
+        targets = sorted(todo) if args.force else store.outdated(sorted(todo), newip)
+        for target in targets:
+            if args.force or store.outbox.due(target, newip):
+                outdated.setdefault(target, []).append(family)
+            else:
+                waiting.setdefault(target, []).append(family)
+
+    if not (outdated or waiting):
+        logger.info("IP is still %s", summary)
+        return outcome
+
+    # The email only tells about the families it is out of date for
+    digests = open_digest(args)
+    if 'email' in outdated:
+        changed = sorted(outdated['email'])
+        subject = "External public IP changed to %s" % (
+            ", ".join(settled[_] for _ in changed))
+        text = "\n\n".join(texts[_] for _ in changed)
+        if digests:
+            todo['email'] = actions.Action('email', digests.add,
+                                           (myname, recipients, myname, 'ip-change',
+                                            subject, text),
+                                           timeout=args.action_timeout)
+        else:
+            todo['email'] = actions.Action('email', mailqueue.enqueue,
+                                           (myname, recipients, subject, text),
+                                           dict(debug=args.debug),
+                                           timeout=args.action_timeout)
+
+    for target, families in sorted(waiting.items()):
+        logger.info("Backing off retries of %s for %s", target,
+                    ", ".join("IPv%d" % _ for _ in families))
+    if not outdated:
+        return DEFERRED
+
+    logger.info("Syncing %s to %s", ", ".join(sorted(outdated)), summary)
+    results = actions.run(todo[target] for target in sorted(outdated))
+    for result in results:
+        for family in outdated[result.name]:
+            store = stores[family]
+            if result.ok:
+                store.mark_synced(result.name, settled[family])
+                store.outbox.remove(result.name)
+            else:
+                store.outbox.add(result.name, settled[family], result.error)
+        if result.ok:
+            logger.info("%s: done in %.3fs", result.name, result.elapsed)
+        else:
+            logger.error("%s: %s", result.name, result.error)
+            if digests and result.name != 'email':
+                digests.add(myname, recipients, myname, 'provider-failure',
+                            "%s failed to sync to %s: %s" % (result.name, summary,
+                                                             result.error),
+                            severity=logging.ERROR)
+
+    if actions.exit_code(results):
+        return FAILED
+    return outcome
+
+
+def open_state(args, family=4):
+    """Open the state store of an address family
+
+    The IPv4 store imports the legacy 'ip' file on first use.
+    """
+    path = osp.join(xdg.save_data_path(myname),
+                    'state.db' if family == 4 else 'state%d.db' % family)
+    store = state.State(path)
+    if family != 4:
+        return store
+    ipfile = osp.join(xdg.save_config_path(myname), 'ip')
+    if store.current() is None and osp.isfile(ipfile):
         try:
-            with open(ipfile, 'w') as f:
-                f.write('%s\n' % newip)
+            with open(ipfile) as f:
+                ip = f.read().strip()
         except IOError as e:
-            logger.error(e)
+            logger.warn(e)
+        else:
+            if ip:
+                logger.info("Importing previous IP %s from %s", ip, ipfile)
+                store.record(ip)
+                for target in ['email'] + [_.name for _ in load_providers(args)]:
+                    store.mark_synced(target, ip)
+    return store
 
-    try:
-        logger.info("Sending email")
-        sendmail.sendmail(myname,
-                          recipients,
-                          "External public IP changed to %s" % newip,
-                          newip,
-                          debug=args.debug,)
-    except (sendmail.smtplib.SMTPException, sendmail.socket.gaierror) as e:
-        logger.error(e)
 
-    logger.info("Notifying NoIP.com")
-    noip.main(["-v"] if args.debug else [])
+def open_digest(args):
+    """Return the digest.Digest of --digest, or None to email each change"""
+    global digests
+    if not args.digest:
+        return None
+    if digests is None:
+        digests = digest.Digest(window=args.digest,
+                                threshold=args.digest_threshold,
+                                immediate=args.digest_immediate)
+    return digests
+
+
+def load_providers(args):
+    """Load providers.conf, all providers sharing one HTTP connection pool
+
+    The pool lives as long as the process, so --daemon and --watch reuse
+    the connections across updates.
+    """
+    global http
+    if http is None:
+        http = noip.HttpAuth(debug=args.debug)
+    path = osp.join(xdg.save_config_path(myname), 'providers.conf')
+    return providers.load(path, http=http)
+
+
+def update_provider(provider, ip, ip6=None, dnscheck=False, nameservers=None):
+    """Update all hostnames of provider, raise ProviderError if any failed
+
+    With dnscheck, hostnames whose records at their authoritative
+    nameservers, or at nameservers if given, are already ip, and ip6 if
+    given, are skipped.
+    """
+    hostnames = provider.hostnames
+    if dnscheck and hostnames:
+        stale = set()
+        for address in (ip, ip6):
+            if address:
+                stale.update(dnsquery.outdated(hostnames, address, servers=nameservers))
+        hostnames = [_ for _ in hostnames if _ in stale]
+        current = [_ for _ in provider.hostnames if _ not in stale]
+        if current:
+            logger.info("%s: already %s in DNS: %s", provider.name,
+                        ", ".join(_ for _ in (ip, ip6) if _), ", ".join(current))
+        if not hostnames:
+            return
+
+    results = provider.update(hostnames, ip, ip6)
+    dnsquery.forget(hostnames)
+    for result in results:
+        (logger.info if result.ok else logger.error)(
+            "%s: %s: %s", provider.name, result.hostname, result.status)
+    failed = [result.hostname for result in results if not result.ok]
+    if failed:
+        raise providers.ProviderError("failed to update %s" % ", ".join(failed))
+    if not results:
+        raise providers.ProviderError("no hostnames configured")
+
+
+def retry_delay(args):
+    """Return seconds until the soonest failed action is due, or None if none"""
+    dues = []
+    for family in ((4, 6) if args.ipv6 else (4,)):
+        with open_state(args, family) as store:
+            dues.extend(_[3] for _ in store.outbox.entries())
+            now = store.clock()
+    return max(min(dues) - now, 0) if dues else None
+
+
+def watch(args, recipients):
+    """Update whenever the gateway reports an IP change via UPnP events
+
+    Fall back to adaptive polling if the gateway does not support eventing,
+    or if the subscription is lost, and keep trying to subscribe again.
+    """
+    schedule = scheduler.Scheduler(args.min_interval, args.max_interval)
+    while True:
+        try:
+            watcher = gena.Watcher(gena.event_url())
+            watcher.start()
+        except gena.GenaError as e:
+            logger.warn("UPnP eventing unavailable, polling: %s", e)
+            outcome = update(args, recipients)
+            schedule.record(changed=outcome in (CHANGED, PENDING),
+                            failed=outcome == FAILED)
+            schedule.wait()
+            continue
+
+        logger.info("Watching for IP changes via %s", watcher.url)
+        try:
+            # in case it changed while not watching
+            outcome = update(args, recipients)
+            lastip = None
+            while True:
+                # Re-check a pending IP once it may have settled, and retry
+                # failed actions once due, as no event may come for either
+                timeout = None
+                if outcome == PENDING:
+                    timeout = args.settle_time or args.min_interval
+                elif outcome in (FAILED, DEFERRED):
+                    timeout = max(retry_delay(args) or 0, args.min_interval)
+                newip = watcher.wait(timeout)
+                if newip:
+                    logger.debug("Gateway reported IP %s", newip)
+                    lastip = newip
+                outcome = update(args, recipients, lastip)
+        except gena.GenaError as e:
+            logger.warn("Lost UPnP event subscription: %s", e)
+        finally:
+            watcher.stop()
+
+
+def daemon(args, recipients, schedule=None):
+    """Keep running, polling on an adaptive schedule
+
+    Poll often right after a change or failure and back off exponentially
+    while the IP is stable. SIGHUP reloads the config and polls right away.
+    """
+    schedule = schedule or scheduler.Scheduler(args.min_interval, args.max_interval)
+    stats = resolver.Stats()
+    reload_ = []
+
+    def sighup(signum, frame):
+        reload_.append(signum)
+        schedule.wake()
+
+    signal.signal(signal.SIGHUP, sighup)
+    logger.info("Running as daemon, polling every %d to %d seconds",
+                args.min_interval, args.max_interval)
+    while True:
+        if reload_:
+            del reload_[:]
+            logger.info("Reloading config")
+            recipients = args.recipients or read_config(args)['recipients']
+        outcome = update(args, recipients, stats=stats)
+        due = schedule.record(changed=outcome in (CHANGED, PENDING),
+                              failed=outcome == FAILED)
+        logger.debug("Next poll in %.0f seconds", due - schedule.clock())
+        schedule.wait()
 
 
 def read_config(args):
@@ -133,6 +459,123 @@ def parseargs(args=None):
                         action='store_true',
                         help='Force an update even if IP has not changed since last run.')
 
+    def sourcelist(value, known=resolver.SOURCES):
+        sources = value.split(',')
+        unknown = set(sources) - set(known)
+        if unknown:
+            raise argparse.ArgumentTypeError(
+                "invalid source(s): %s" % ", ".join(sorted(unknown)))
+        return sources
+
+    sourcedefault = 'upnp,natpmp'
+    parser.add_argument('--sources', '-s', dest='sources',
+                        default=sourcedefault,
+                        type=sourcelist,
+                        help="Comma-separated external IP sources to query"
+                            " concurrently, among %s. Default is '%s'" % (
+                            ", ".join(sorted(resolver.SOURCES)), sourcedefault))
+
+    parser.add_argument('--quorum', '-q', dest='quorum',
+                        default=1, type=int,
+                        help="Number of sources that must agree on the IP."
+                            " Default is the first valid answer")
+
+    parser.add_argument('--ipv6', '-6', dest='ipv6',
+                        default=False,
+                        action='store_true',
+                        help="Also track the IPv6 address, separately, and"
+                            " update AAAA records along with A records.")
+
+    source6default = 'local'
+    parser.add_argument('--ipv6-sources', dest='ipv6_sources',
+                        default=source6default,
+                        type=lambda _: sourcelist(_, resolver.SOURCES6),
+                        help="Comma-separated IPv6 address sources, among %s."
+                            " Default is '%s'" % (
+                            ", ".join(sorted(resolver.SOURCES6)), source6default))
+
+    parser.add_argument('--watch', '-w', dest='watch',
+                        default=False,
+                        action='store_true',
+                        help="Keep running and update as soon as the gateway"
+                            " reports an IP change via UPnP events, polling"
+                            " if the gateway does not support them.")
+
+    parser.add_argument('--daemon', '-d', dest='daemon',
+                        default=False,
+                        action='store_true',
+                        help="Keep running and poll on an adaptive schedule."
+                            " Send SIGHUP to reload the config.")
+
+    mindefault, maxdefault = 30, 1800
+    parser.add_argument('--min-interval', dest='min_interval',
+                        default=mindefault, type=int,
+                        help="Polling interval in seconds right after a change"
+                            " or failure. Default is %d" % mindefault)
+
+    parser.add_argument('--max-interval', dest='max_interval',
+                        default=maxdefault, type=int,
+                        help="Longest polling interval in seconds while the IP"
+                            " is stable. Default is %d" % maxdefault)
+
+    parser.add_argument('--settle-time', dest='settle_time',
+                        default=0, type=int,
+                        help="Seconds a new IP must stay the same before"
+                            " acting on it, to coalesce link flaps into a"
+                            " single update. Default is to act right away")
+
+    parser.add_argument('--settle-polls', dest='settle_polls',
+                        default=0, type=int,
+                        help="Consecutive polls a new IP must stay the same"
+                            " before acting on it, an alternative to"
+                            " --settle-time. Default is to act right away")
+
+    timeoutdefault = actions.TIMEOUT
+    parser.add_argument('--action-timeout', dest='action_timeout',
+                        default=timeoutdefault, type=int,
+                        help="Seconds each action, like emailing or updating"
+                            " a DDNS provider, may take. Default is %d" % timeoutdefault)
+
+    parser.add_argument('--dns-check', dest='dns_check',
+                        default=False,
+                        action='store_true',
+                        help="Skip hostnames whose records at their"
+                            " authoritative nameservers already are the new"
+                            " IP, even with --force.")
+
+    def nameserver(value):
+        host, _, port = value.partition('#')
+        try:
+            return (host, int(port or dnsquery.PORT))
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid port: %s" % port)
+
+    parser.add_argument('--nameserver', dest='nameservers',
+                        action='append', type=nameserver,
+                        help="Nameserver ADDRESS[#PORT] to ask for --dns-check,"
+                            " instead of each hostname's authoritative ones."
+                            " May be repeated.")
+
+    parser.add_argument('--digest', dest='digest',
+                        default=0, type=int, metavar='SECONDS',
+                        help="Instead of an email per IP change, collect IP"
+                            " changes and provider failures and email a"
+                            " summary once the oldest is this old. Default is"
+                            " an email per change")
+
+    thresholddefault = 'critical'
+    parser.add_argument('--digest-threshold', dest='digest_threshold',
+                        default=digest.severity(thresholddefault),
+                        type=digest.severity,
+                        help="With --digest, email the summary right away once"
+                            " an event is this severe, such as 'error' for"
+                            " provider failures. Default is '%s'" % thresholddefault)
+
+    parser.add_argument('--digest-immediate', dest='digest_immediate',
+                        default=None, type=digest.severity,
+                        help="With --digest, email events this severe on their"
+                            " own, right away. Default is 'none'")
+
     parser.add_argument(nargs="*", dest='recipients',
                         help="Email recipients. Will also be saved in config file for future runs.")
 
@@ -26,9 +26,20 @@
 
 DYNDNS_USERNAME = ""
 DYNDNS_PASSWORD = ""
+LOG_TAIL = 256 * 1024  # bytes of the log file emailed on failure
+LOGIN_URL = "https://account.dyn.com/entrance"
+TIMEOUT = 30  # seconds, per HTTP request
+# Same as the browser login would send, as login pages may reject others
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:115.0) Gecko/20100101 Firefox/115.0"
 
 import sys
 import os.path as osp
+import socket
+import urllib
+import urllib2
+import urlparse
+import cookielib
+import HTMLParser
 import logging
 import argparse
 import time
@@ -37,6 +48,7 @@ import random
 import xdg.BaseDirectory as xdg
 
 import sendmail
+import digest
 
 try:
     import selenium.webdriver, selenium.common.exceptions
@@ -69,9 +81,110 @@ def read_config(save=False, username=None, password=None):
                 password=password)
 
 
-def login(username, password, visible=False, debug=False):
-    loginurl = "https://account.dyn.com/entrance"
-    success = False
+class LoginError(Exception):
+    pass
+
+
+class FormParser(HTMLParser.HTMLParser):
+    """Collect the page title and its forms, with their fields
+
+    Each form is a dict of its attributes plus 'fields', a list of
+    (name, value, type) of its named inputs and buttons.
+    """
+    def __init__(self):
+        HTMLParser.HTMLParser.__init__(self)
+        self.title = ""
+        self.forms = []
+        self._form = None
+        self._intitle = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict((k, v or "") for k, v in attrs)
+        if tag == 'title':
+            self._intitle = True
+        elif tag == 'form':
+            self._form = dict(attrs, fields=[])
+            self.forms.append(self._form)
+        elif tag in ('input', 'button') and self._form is not None and attrs.get('name'):
+            kind = attrs.get('type', 'text' if tag == 'input' else 'submit').lower()
+            if kind in ('checkbox', 'radio') and 'checked' not in attrs:
+                return
+            self._form['fields'].append((attrs['name'], attrs.get('value', ""), kind))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._intitle = False
+        elif tag == 'form':
+            self._form = None
+
+    def handle_data(self, data):
+        if self._intitle:
+            self.title += data
+
+
+def logged_in(title, page):
+    return "My Dyn Account" in title or "Log Out" in page
+
+
+def http_login(username, password, url=LOGIN_URL, timeout=TIMEOUT, pagefile=None):
+    """Login by submitting the login form over plain HTTP, no browser
+
+    Hidden fields, such as CSRF tokens, are sent back as found, and session
+    cookies are kept. The resulting page is saved to pagefile, if given.
+    Return True if logged in, raise LoginError if there is no login form.
+    """
+    opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cookielib.CookieJar()))
+    opener.addheaders = [('User-Agent', USER_AGENT)]
+
+    res = opener.open(url, timeout=timeout)
+    parser = FormParser()
+    parser.feed(res.read().decode('utf-8', 'replace'))
+    parser.close()
+
+    # Same form as the browser login, or else any with a password field
+    forms = ([_ for _ in parser.forms if _.get('id', '').startswith('login')] or
+             [_ for _ in parser.forms if any(f[2] == 'password' for f in _['fields'])])
+    if not forms:
+        raise LoginError("no login form at %s" % url)
+    form = forms[0]
+
+    data = []
+    submitted = False
+    for name, value, kind in form['fields']:
+        if kind == 'password':
+            value = password
+        elif name == 'username' or (kind in ('text', 'email') and 'user' in name):
+            value = username
+        elif kind in ('submit', 'image'):
+            if submitted or kind == 'image':
+                continue  # only the first submit button is clicked
+            submitted = True
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        data.append((name.encode('utf-8'), value))
+
+    action = urlparse.urljoin(res.geturl(), form.get('action', ''))
+    logger.info("login form loaded, posting %d fields to %s", len(data), action)
+    res = opener.open(action, urllib.urlencode(data), timeout=timeout)
+    page = res.read().decode('utf-8', 'replace')
+
+    if pagefile:
+        logger.info("saving resulting page as %s", pagefile)
+        with open(pagefile, 'w') as fd:
+            fd.write(page.encode('utf-8'))
+
+    parser = FormParser()
+    parser.feed(page)
+    parser.close()
+    return logged_in(parser.title, page)
+
+
+def browser_login(username, password, visible=False, debug=False, url=LOGIN_URL):
+    """Login using Firefox via Selenium, return None if it's not available"""
+    success = None
     display = None
     driver = None
 
@@ -86,13 +199,13 @@ def login(username, password, visible=False, debug=False):
                 driver = selenium.webdriver.Firefox()
                 logger.info("using selenium webdriver for Firefox")
             except selenium.common.exceptions.WebDriverException:
-                logger.warn("Firefox not available, reverting to manual parsing")
+                logger.warn("Firefox not available")
                 if debug:
                     logger.debug("selenium traceback:", exc_info=True)
 
         if driver:
 
-            driver.get(loginurl)
+            driver.get(url)
 
             # find the fields
             form = driver.find_element_by_xpath("//form[starts-with(@id, 'login')]")
@@ -128,12 +241,7 @@ def login(username, password, visible=False, debug=False):
             driver.get_screenshot_as_file(screenshot)
 
             # Test login success
-            success = ("My Dyn Account" in driver.title or
-                       "Log Out" in driver.page_source)
-
-        else:
-            #TODO: try manual parsing and sending with urllib2
-            logger.warn("manual parsing not implemented yet")
+            success = logged_in(driver.title, driver.page_source)
 
     finally:
         if driver:  driver.quit()
@@ -142,6 +250,31 @@ def login(username, password, visible=False, debug=False):
     return success
 
 
+def login(username, password, visible=False, debug=False, browser=False,
+          url=LOGIN_URL, pagefile=None):
+    """Login over plain HTTP, falling back to a browser if that fails
+
+    With browser, go straight to the browser. The page resulting from the
+    HTTP login is saved to pagefile, if given. Return True if logged in.
+    """
+    if not browser:
+        try:
+            if http_login(username, password, url, pagefile=pagefile):
+                return True
+            logger.warn("HTTP login failed")
+        except (LoginError, urllib2.URLError, HTMLParser.HTMLParseError,
+                socket.error) as e:
+            logger.warn("HTTP login failed: %s", e)
+        if not selenium:
+            return False
+        logger.info("trying again with a browser")
+
+    success = browser_login(username, password, visible, debug, url)
+    if success is None:
+        logger.warn("no browser available, install selenium and Firefox")
+    return bool(success)
+
+
 def parseargs(args=None):
     parser = argparse.ArgumentParser(
         description="Login at DynDNS website to prevent account deletion.",)
@@ -157,6 +290,12 @@ def parseargs(args=None):
                         action='store_true',
                         help='show browser window. Default is invisible window')
 
+    parser.add_argument('--browser', '-b', dest='browser',
+                        default=False,
+                        action='store_true',
+                        help="login using a browser, via selenium. Default is"
+                             " plain HTTP, using a browser only if that fails")
+
     parser.add_argument('--username', '-u', dest='username',
                         help="Account username, usually an email address")
 
@@ -168,12 +307,30 @@ def parseargs(args=None):
                         action='store_true',
                         help="Saves the given username and password")
 
+    parser.add_argument('--digest', dest='digest',
+                        default=0, type=int, metavar='SECONDS',
+                        help="instead of an email per run, collect login results"
+                             " and email a summary once the oldest is this old."
+                             " Default is an email per run")
+
+    parser.add_argument('--digest-threshold', dest='digest_threshold',
+                        default=logging.CRITICAL, type=digest.severity,
+                        help="with --digest, email the summary right away once a"
+                             " result is this severe, such as 'error' for a"
+                             " failed login. Default is 'critical'")
+
+    parser.add_argument('--digest-immediate', dest='digest_immediate',
+                        default=None, type=digest.severity,
+                        help="with --digest, email results this severe on their"
+                             " own, right away. Default is 'none'")
+
     return parser.parse_args(args)
 
 if __name__ == '__main__':
     myname = osp.basename(osp.splitext(__file__)[0])
     screenshot = osp.join(xdg.xdg_cache_home, "%s_%s.png" % (myname,
                           datetime.datetime.now().strftime('%Y%m%d%H%M%S')))
+    page = osp.splitext(screenshot)[0] + '.html'
     logfile = osp.join(xdg.xdg_cache_home, '%s.log' % myname)
 
     args = parseargs()
@@ -193,7 +350,8 @@ if __name__ == '__main__':
         sys.exit(1)
 
     try:
-        success = login(username, password, args.visible, debug)
+        success = login(username, password, args.visible, debug, args.browser,
+                        pagefile=page)
 
         logger.info("emailing result")
         try:
@@ -204,18 +362,28 @@ if __name__ == '__main__':
             message = "Dyndns automatic web login %s" % ("successful" if success
                                                          else "FAILED!")
             attachments = []
-            if osp.isfile(screenshot):
-                attachments.append(screenshot)
+            for path in (page, screenshot):
+                if osp.isfile(path):
+                    attachments.append(path)
 
             if not success:
-                attachments.append(logfile)
-
-            sendmail.sendmail(myname,
-                              username,
-                              message,
-                              message,
-                              attachments,
-                              debug=debug,)
+                attachments.append(sendmail.Attachment(logfile, tail=LOG_TAIL,
+                                                       compress=True))
+
+            if args.digest:
+                with digest.Digest(window=args.digest,
+                                   threshold=args.digest_threshold,
+                                   immediate=args.digest_immediate) as digests:
+                    digests.add(myname, username, myname, 'login', message, message,
+                                severity=logging.INFO if success else logging.ERROR,
+                                attachments=attachments)
+            else:
+                sendmail.sendmail(myname,
+                                  username,
+                                  message,
+                                  message,
+                                  attachments,
+                                  debug=debug,)
         except sendmail.smtplib.SMTPException as e:
             logger.error(e)
         except Exception as e:
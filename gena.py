@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# gena - Watch external IP changes via UPnP GENA event subscriptions
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+# Instead of polling the gateway, SUBSCRIBE to its WAN*Connection eventSubURL
+# and let it NOTIFY a small local HTTP server whenever ExternalIPAddress
+# changes. The subscription is renewed before it times out.
+
+import sys
+import socket
+import time
+import logging
+import threading
+try:
+    import queue
+    import http.client as httplib
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    # Python 2
+    import Queue as queue
+    import httplib
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import upnp
+import urllib23
+
+
+SUBSCRIBE_TIMEOUT = 1800  # seconds, as requested to the gateway
+RENEW_MARGIN = 0.2  # fraction of the granted timeout left when renewing
+HTTP_TIMEOUT = 10  # seconds
+
+log = logging.getLogger(__name__)
+
+
+class GenaError(Exception):
+    pass
+
+
+def event_url():
+    """Return the eventSubURL of the gateway's WAN*Connection service"""
+    try:
+        gateway = upnp.read_cache()
+        if gateway:
+            location, service, _ = gateway
+        else:
+            location, service = upnp.discover()
+        url = upnp.get_service(location, [service]).get('eventsuburl')
+    except (upnp.UpnpError, IOError, socket.error) as e:
+        raise GenaError(e)
+
+    if not url:
+        raise GenaError("Gateway does not support eventing")
+    return url
+
+
+def parse_propertyset(data):
+    """Return a dict of the state variables in a NOTIFY propertyset body"""
+    try:
+        root = upnp.ElementTree.fromstring(data)
+    except upnp.ElementTree.ParseError as e:
+        log.warning("Invalid event body: %s", e)
+        return {}
+
+    variables = {}
+    for prop in root:
+        for var in prop:
+            variables[upnp.localname(var.tag)] = (var.text or "").strip()
+    return variables
+
+
+class NotifyHandler(BaseHTTPRequestHandler):
+    def do_NOTIFY(self):
+        watcher = self.server.watcher
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        # sid is still unset if the initial event beats the SUBSCRIBE response
+        if (self.headers.get('NT') != 'upnp:event' or
+            self.headers.get('NTS') != 'upnp:propchange'):
+            self.send_response(400)
+        elif watcher.sid and self.headers.get('SID') != watcher.sid:
+            self.send_response(412)  # Precondition Failed
+        else:
+            self.send_response(200)
+            watcher.notify(self.headers.get('SEQ'), parse_propertyset(body))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        log.debug("%s %s", self.client_address[0], fmt % args)
+
+
+class Watcher(object):
+    """Subscription to ExternalIPAddress events of a gateway's eventSubURL"""
+    def __init__(self, url, port=0, timeout=SUBSCRIBE_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.sid = None
+        self.granted = timeout
+        self.expires = 0
+        self.events = queue.Queue()
+
+        parsed = urllib23.urlparse(url)
+        self._netloc = parsed.netloc
+        self._path = parsed.path + ('?' + parsed.query if parsed.query else '')
+
+        # Serve callbacks on the address of the interface facing the gateway
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect((parsed.hostname, parsed.port or 80))
+            host = sock.getsockname()[0]
+            self._server = HTTPServer((host, port), NotifyHandler)
+        except socket.error as e:
+            raise GenaError("Cannot listen for events from %s: %s" % (parsed.netloc, e))
+        finally:
+            sock.close()
+        self._server.watcher = self
+        self.callback = "http://%s:%d/" % self._server.server_address[:2]
+        self._thread = None
+
+    def _request(self, method, headers):
+        conn = httplib.HTTPConnection(self._netloc, timeout=HTTP_TIMEOUT)
+        try:
+            conn.request(method, self._path, headers=headers)
+            res = conn.getresponse()
+            res.read()
+        except (httplib.HTTPException, socket.error) as e:
+            raise GenaError("%s failed: %s" % (method, e))
+        finally:
+            conn.close()
+        if res.status != 200:
+            raise GenaError("%s failed: %d %s" % (method, res.status, res.reason))
+        return res
+
+    def _subscribed(self, res):
+        self.sid = res.getheader('SID') or self.sid
+        timeout = (res.getheader('TIMEOUT') or "").lower()
+        try:
+            granted = int(timeout.replace('second-', ''))
+        except ValueError:  # 'infinite', or garbage
+            granted = self.timeout
+        self.granted = granted
+        self.expires = time.time() + granted
+        log.debug("Subscribed to %s as %s for %d seconds", self.url, self.sid, granted)
+
+    def start(self):
+        """Start the callback server and subscribe"""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="gena-callback")
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            self.subscribe()
+        except GenaError:
+            self.stop()
+            raise
+
+    def subscribe(self):
+        self.sid = None
+        self._subscribed(self._request('SUBSCRIBE', {
+            'CALLBACK': '<%s>' % self.callback,
+            'NT': 'upnp:event',
+            'TIMEOUT': 'Second-%d' % self.timeout,
+        }))
+
+    def renew(self):
+        try:
+            self._subscribed(self._request('SUBSCRIBE', {
+                'SID': self.sid,
+                'TIMEOUT': 'Second-%d' % self.timeout,
+            }))
+        except GenaError as e:
+            # Gateway may have rebooted and forgotten us
+            log.debug("Renewal failed, subscribing again: %s", e)
+            self.subscribe()
+
+    def stop(self):
+        if self.sid:
+            try:
+                self._request('UNSUBSCRIBE', {'SID': self.sid})
+            except GenaError as e:
+                log.debug(e)
+            self.sid = None
+        if self._thread:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def notify(self, seq, variables):
+        """Called by the callback server for each event"""
+        log.debug("Event %s from %s: %s", seq, self.url, variables)
+        ip = variables.get('ExternalIPAddress')
+        if ip:
+            self.events.put(ip)
+
+    def wait(self, timeout=None):
+        """Return the next ExternalIPAddress event, or None after timeout
+
+        The subscription is renewed as needed while waiting.
+        """
+        deadline = timeout is not None and time.time() + timeout
+        while True:
+            renew = self.expires - RENEW_MARGIN * self.granted
+            until = min(renew, deadline) if deadline else renew
+            try:
+                return self.events.get(timeout=max(until - time.time(), 0))
+            except queue.Empty:
+                pass
+            if time.time() >= renew:
+                self.renew()
+            elif deadline and time.time() >= deadline:
+                return None
+
+
+def watch(url=None, port=0):
+    """Yield the external IP whenever the gateway reports a change"""
+    watcher = Watcher(url or event_url(), port)
+    watcher.start()
+    try:
+        while True:
+            yield watcher.wait()
+    finally:
+        watcher.stop()
+
+
+USAGE = """Watch external IP address changes via UPnP events
+Usage: python gena.py
+"""
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(USAGE)
+        sys.exit()
+
+    try:
+        for ip in watch():
+            print(ip)
+            sys.stdout.flush()
+    except GenaError as e:
+        print(e)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ifaddr - Find the global IPv6 address of this host from its interfaces
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+# Addresses and default routes are read from Linux's /proc files, with no
+# network access. With IPv6 there is no NAT, so the global address of an
+# interface is also the external one.
+
+import socket
+import logging
+
+
+IF_INET6 = '/proc/net/if_inet6'
+IPV6_ROUTE = '/proc/net/ipv6_route'
+# Flags of addresses in IF_INET6 not suitable for DNS: temporary (privacy),
+# failed duplicate address detection, deprecated, tentative
+IFA_F_UNSUITABLE = 0x01 | 0x08 | 0x20 | 0x40
+
+log = logging.getLogger(__name__)
+
+
+def default_ipv6_interfaces(path=IPV6_ROUTE):
+    """Return the set of interfaces with a default IPv6 route"""
+    interfaces = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 10 and fields[0] == '0' * 32 and fields[1] == '00':
+                    interfaces.add(fields[9])
+    except IOError as e:
+        log.debug("Could not read IPv6 routes: %s", e)
+    return interfaces
+
+
+def local_ipv6(path=IF_INET6):
+    """Return the global IPv6 address of this host, read from its interfaces
+
+    With IPv6 there is no NAT, so this is also the external address.
+    Temporary, deprecated and not yet usable addresses are skipped, as are
+    unique local ones (fc00::/7). Addresses on an interface with a default
+    route are preferred.
+    """
+    candidates = []
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 6:
+                    continue
+                address, _, _, scope, flags, interface = fields[:6]
+                if (int(scope, 16) != 0 or int(flags, 16) & IFA_F_UNSUITABLE or
+                        int(address[:2], 16) & 0xFE == 0xFC):
+                    continue
+                candidates.append((interface, ":".join(
+                    address[i:i + 4] for i in range(0, 32, 4))))
+    except (IOError, ValueError) as e:
+        raise IOError("Could not read IPv6 addresses: %s" % e)
+
+    routed = default_ipv6_interfaces()
+    candidates.sort(key=lambda _: _[0] not in routed)
+    if not candidates:
+        raise IOError("No global IPv6 address")
+    # Normalize to the compressed form
+    return socket.inet_ntop(socket.AF_INET6,
+                            socket.inet_pton(socket.AF_INET6, candidates[0][1]))
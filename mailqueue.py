@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mailqueue - Spool email and deliver it in the background using sendmail
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+# enqueue() writes the message to a spool directory, one JSON file each, and
+# returns right away. A worker thread delivers it with sendmail's Mailer,
+# whose connection and every read or write have a deadline, so a dead mail
+# hub never holds up the caller. Failed messages are retried with exponential
+# backoff and jitter, and moved to the dead letter directory after a
+# permanent SMTP error, a missing attachment, or MAX_AGE of retries.
+#
+# At exit, the worker is given up to EXIT_TIMEOUT seconds to deliver what
+# is due. Whatever is left stays in the spool, for the next process that
+# enqueues a message, or for 'mailqueue flush'. Attachments are spooled by
+# path, and must still exist when the message is delivered.
+
+import os
+import os.path as osp
+import sys
+import json
+import time
+import fcntl
+import errno
+import random
+import smtplib
+import socket
+import atexit
+import logging
+import argparse
+import binascii
+import threading
+import xdg.BaseDirectory as xdg
+
+import sendmail
+
+
+SPOOL_DIR = osp.join(xdg.xdg_data_home, 'sendmail', 'spool')
+RETRY_MIN = 60  # seconds, after the first failure
+RETRY_MAX = 6 * 60 * 60  # seconds
+RETRY_JITTER = 0.2  # fraction of the delay, either way
+MAX_AGE = 3 * 24 * 60 * 60  # seconds a message is retried before giving up
+EXIT_TIMEOUT = 30  # seconds the worker may keep the process alive at exit
+BUSY_WAIT = 10  # seconds, while another process delivers from the spool
+
+# Keys of a spooled message
+FIELDS = ('id', 'created', 'due', 'attempts', 'error', 'sender', 'recipients',
+          'subject', 'text', 'attachments')
+
+log = logging.getLogger(__name__)
+
+
+class PermanentError(Exception):
+    """A message that will never be delivered, no matter how often retried"""
+
+
+def _str(value):
+    """Turn JSON's unicode strings back into UTF-8 str, recursively"""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_str(_) for _ in value]
+    return value
+
+
+def attachment_spec(attachment):
+    """Return the JSON-able arguments of an attachment path or Attachment
+
+    sendmail.Attachment(*spec) rebuilds it.
+    """
+    if not isinstance(attachment, sendmail.Attachment):
+        attachment = sendmail.Attachment(attachment)
+    name = attachment.name[:-3] if attachment.compress else attachment.name
+    return [osp.abspath(attachment.path), attachment.tail, attachment.compress, name]
+
+
+class Spool(object):
+    """Durable queue of messages, one JSON file per message
+
+    Files are written to a temporary name and renamed into place, so a
+    crash never leaves a partial message. Delivery holds a lock on the
+    spool, so concurrent processes never send the same message twice.
+    Malformed files are renamed to *.bad and left for inspection.
+    """
+    def __init__(self, path=SPOOL_DIR, clock=time.time, rand=random.random):
+        self.path = path
+        self.queue = osp.join(path, 'queue')
+        self.dead = osp.join(path, 'dead')
+        self.clock = clock
+        self.rand = rand
+        for directory in (self.queue, self.dead):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def add(self, sender, recipients, subject="", text="", attachments=[]):
+        """Spool a message, due right away, and return its ID"""
+        if isinstance(recipients, basestring):
+            recipients = [recipients]
+        if isinstance(attachments, (basestring, sendmail.Attachment)):
+            attachments = [attachments]
+        now = self.clock()
+        entry = dict(
+            id="%d-%s" % (now * 1000, binascii.hexlify(os.urandom(4))),
+            created=now, due=now, attempts=0, error=None,
+            sender=sender, recipients=list(recipients),
+            subject=subject, text=text,
+            attachments=[attachment_spec(_) for _ in attachments],
+        )
+        self._write(self.queue, entry)
+        log.debug("Queued message %s to %s", entry['id'], ", ".join(recipients))
+        return entry['id']
+
+    def _write(self, directory, entry):
+        path = osp.join(directory, entry['id'] + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+
+    def entries(self, dead=False):
+        """Return the list of queued, or dead, messages, soonest due first"""
+        directory = self.dead if dead else self.queue
+        entries = []
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(osp.join(directory, filename)) as f:
+                    entry = json.load(f)
+            except IOError as e:  # possibly just sent by another process
+                log.warning("Unreadable spooled message %s: %s", filename, e)
+                continue
+            except ValueError as e:
+                self.set_aside(directory, filename, e)
+                continue
+            if not (isinstance(entry, dict) and all(_ in entry for _ in FIELDS)
+                    and entry['id'] == filename[:-len('.json')]):
+                self.set_aside(directory, filename, "missing or mismatched fields")
+                continue
+            entries.append(entry)
+        return sorted(entries, key=lambda _: (_['due'], _['id']))
+
+    def set_aside(self, directory, filename, error):
+        """Rename a malformed message file out of the spool's way"""
+        path = osp.join(directory, filename)
+        log.error("Malformed spooled message %s, renamed to %s.bad: %s",
+                  path, filename, error)
+        try:
+            os.rename(path, path + '.bad')
+        except OSError as e:
+            log.warning("Could not rename %s: %s", path, e)
+
+    def next_due(self):
+        """Return when the soonest queued message is due, or None if empty"""
+        entries = self.entries()
+        return entries[0]['due'] if entries else None
+
+    def _move(self, entry, source, target):
+        os.rename(osp.join(source, entry['id'] + '.json'),
+                  osp.join(target, entry['id'] + '.json'))
+
+    def remove(self, entry, dead=False):
+        os.remove(osp.join(self.dead if dead else self.queue, entry['id'] + '.json'))
+
+    def revive(self, entry):
+        """Move a dead message back to the queue, due right away"""
+        entry.update(due=self.clock(), attempts=0, created=self.clock())
+        self._write(self.dead, entry)
+        self._move(entry, self.dead, self.queue)
+
+    def lock(self, blocking=False):
+        """Lock the spool for delivery, return the lock file or None if busy"""
+        fp = open(osp.join(self.path, 'lock'), 'a')
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except IOError as e:
+            fp.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return None
+            raise
+        return fp
+
+    def deliver(self, mailer, force=False, blocking=False):
+        """Send all due messages, or all of them if force, over one session
+
+        Return (sent, failed) counts, or None if another process is already
+        delivering from this spool, unless blocking to wait for it.
+        """
+        lock = self.lock(blocking)
+        if lock is None:
+            log.debug("Spool %s busy, leaving it to its other user", self.path)
+            return None
+        sent = failed = 0
+        try:
+            for entry in self.entries():
+                if not force and entry['due'] > self.clock():
+                    continue
+                try:
+                    ok = self.send(mailer, entry)
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    self.set_aside(self.queue, entry['id'] + '.json', repr(e))
+                    ok = False
+                if ok:
+                    sent += 1
+                else:
+                    failed += 1
+        finally:
+            lock.close()
+        return sent, failed
+
+    def send(self, mailer, entry):
+        """Send a single spooled message, return True on success
+
+        On failure the message is rescheduled, or moved to the dead letters.
+        """
+        attachments = [sendmail.Attachment(*_str(_)) for _ in entry['attachments']]
+        try:
+            refused = mailer.send(_str(entry['sender']), _str(entry['recipients']),
+                                  _str(entry['subject']), _str(entry['text']),
+                                  attachments)
+        except IOError as e:
+            if isinstance(e, socket.error):  # IOError subclass since 2.6
+                return self.fail(entry, e)
+            return self.fail(entry, PermanentError("missing attachment: %s" % e))
+        except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            if e.smtp_code >= 500:
+                e = PermanentError("%s %s" % (e.smtp_code, e.smtp_error))
+            return self.fail(entry, e)
+        except smtplib.SMTPRecipientsRefused as e:
+            if all(code >= 500 for code, _ in e.recipients.values()):
+                e = PermanentError("all recipients refused: %s" % e.recipients)
+            return self.fail(entry, e)
+        except (smtplib.SMTPException, socket.error) as e:
+            return self.fail(entry, e)
+
+        if refused:
+            log.warning("Message %s refused by %s", entry['id'], refused)
+        log.debug("Sent message %s after %d retries", entry['id'], entry['attempts'])
+        self.remove(entry)
+        return True
+
+    def fail(self, entry, error):
+        """Reschedule a failed message with backoff, or bury it, return False"""
+        now = self.clock()
+        entry['attempts'] += 1
+        entry['error'] = str(error) or error.__class__.__name__
+        if isinstance(error, PermanentError) or now - entry['created'] >= MAX_AGE:
+            log.error("Giving up on message %s to %s: %s", entry['id'],
+                      ", ".join(entry['recipients']), entry['error'])
+            self._write(self.queue, entry)
+            self._move(entry, self.queue, self.dead)
+            return False
+        delay = min(RETRY_MIN * 2 ** (entry['attempts'] - 1), RETRY_MAX)
+        entry['due'] = now + delay * (1 + RETRY_JITTER * (2 * self.rand() - 1))
+        self._write(self.queue, entry)
+        log.warning("Could not send message %s, retry #%d in %.0f seconds: %s",
+                    entry['id'], entry['attempts'], entry['due'] - now, entry['error'])
+        return False
+
+
+class Worker(threading.Thread):
+    """Daemon thread delivering a Spool's messages as they become due"""
+    def __init__(self, spool, mailer, clock=time.time):
+        super(Worker, self).__init__(name="mailqueue")
+        self.daemon = True
+        self.spool = spool
+        self.mailer = mailer
+        self.clock = clock
+        self.stopping = False
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if self.spool.deliver(self.mailer) is None:
+                    if self.stopping:
+                        return  # the other process delivers
+                    due = self.clock() + BUSY_WAIT
+                else:
+                    due = self.spool.next_due()
+            except (IOError, OSError) as e:
+                log.error("Mail spool error: %s", e)
+                due = self.clock() + RETRY_MIN
+            except Exception:
+                # A bug must not silently end delivery for the process
+                log.exception("Unexpected error delivering mail")
+                due = self.clock() + RETRY_MIN
+            self.mailer.close()
+            if self.stopping and (due is None or due > self.clock()):
+                return
+            if due is None:
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(max(due - self.clock(), 0))
+
+    def stop(self, timeout=EXIT_TIMEOUT):
+        """Deliver what is due, for up to timeout seconds, then stop
+
+        Return True if the worker is done.
+        """
+        self.stopping = True
+        self.wake()
+        self.join(timeout)
+        if self.is_alive():
+            log.warning("Mail delivery still running after %s seconds,"
+                        " leaving the rest in the spool", timeout)
+        return not self.is_alive()
+
+
+worker = None  # Worker of enqueue(), see default_worker()
+
+
+def default_worker(debug=False):
+    """Return the Worker of enqueue() calls, started on first use
+
+    At exit, it may deliver for EXIT_TIMEOUT seconds more.
+    """
+    global worker
+    if worker is None:
+        worker = Worker(Spool(), sendmail.Mailer(debug=debug))
+        worker.start()
+        atexit.register(worker.stop)
+    worker.mailer.debug = debug
+    return worker
+
+
+def enqueue(sender, recipients, subject="", text="", attachments=[],
+            debug=False):
+    """Spool a message for background delivery, return its ID right away
+
+    Same arguments as sendmail.sendmail(). Raise IOError or OSError only if
+    the spool can't be written.
+    """
+    worker = default_worker(debug)
+    qid = worker.spool.add(sender, recipients, subject, text, attachments)
+    worker.wake()
+    return qid
+
+
+def list_entries(spool, dead=False):
+    now = spool.clock()
+    for entry in spool.entries(dead):
+        due = "dead" if dead else ("now" if entry['due'] <= now else
+                                   "in %ds" % (entry['due'] - now))
+        print("%s  %-8s  %d tries  %s  %s" % (
+            entry['id'], due, entry['attempts'], ", ".join(entry['recipients']),
+            entry['subject']))
+        if entry['error']:
+            print("    %s" % entry['error'])
+
+
+def parseargs(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Inspect and flush the mail spool of background email."
+                    " Without a command, list the queued messages.")
+
+    parser.add_argument('-v', '--verbose', dest='debug', action='store_true',
+                        help="Output the SMTP dialog and other debug messages")
+
+    parser.add_argument('--spool', default=SPOOL_DIR,
+                        help="Spool directory. [Default: %(default)s]")
+
+    parser.add_argument('command', nargs='?', default='list',
+                        choices=('list', 'dead', 'flush', 'retry', 'purge'),
+                        help="list: show queued messages."
+                             " dead: show messages given up on."
+                             " flush: send all queued messages now, due or not."
+                             " retry: queue the dead messages again, and flush."
+                             " purge: delete the dead messages.")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseargs(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(levelname)s: %(message)s')
+    spool = Spool(args.spool)
+
+    if args.command in ('list', 'dead'):
+        list_entries(spool, args.command == 'dead')
+        return
+
+    if args.command == 'purge':
+        for entry in spool.entries(dead=True):
+            spool.remove(entry, dead=True)
+        return
+
+    if args.command == 'retry':
+        for entry in spool.entries(dead=True):
+            spool.revive(entry)
+
+    with sendmail.Mailer(debug=args.debug) as mailer:
+        sent, failed = spool.deliver(mailer, force=True, blocking=True)
+    log.info("%d sent, %d failed", sent, failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log.critical(e, exc_info=True)
+        sys.exit(1)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# natpmp - Find external IP address querying NAT Router/Gateway via NAT-PMP/PCP
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+# NAT-PMP: RFC 6886, PCP: RFC 6887
+# NAT-PMP gets the external address in a single 2-byte request, 12-byte
+# response UDP exchange with the default gateway. Gateways that only speak
+# PCP answer it with an Unsupported Version error, and are then asked via a
+# short-lived PCP MAP request, which is deleted right after.
+
+import sys
+import os
+import socket
+import struct
+import time
+import logging
+
+
+PORT = 5351
+TIMEOUT = 2  # seconds, overall
+PCP_LIFETIME = 60  # seconds
+
+NATPMP_VERSION = 0
+PCP_VERSION = 2
+PCP_OPCODE_MAP = 1
+UNSUPP_VERSION = 1  # Same result code for NAT-PMP and PCP
+
+log = logging.getLogger(__name__)
+
+
+class NatPmpError(Exception):
+    pass
+
+
+def default_gateway():
+    """Return the IPv4 default gateway address, read from /proc/net/route"""
+    try:
+        with open('/proc/net/route') as f:
+            next(f)  # header
+            for line in f:
+                fields = line.split()
+                # Destination 0.0.0.0 with RTF_UP | RTF_GATEWAY flags
+                if fields[1] == '00000000' and int(fields[3], 16) & 0x3 == 0x3:
+                    return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+    except (IOError, OSError, StopIteration, IndexError, ValueError) as e:
+        log.debug("Could not read routing table: %s", e)
+
+    raise NatPmpError("No default gateway found")
+
+
+def exchange(sock, data, addr, deadline, check):
+    """Send data to addr until check(response) is not None or deadline
+
+    Retransmit with doubling intervals starting at 250ms, as RFC 6886
+    recommends. Return check()'s result.
+    """
+    interval = 0.25
+    while True:
+        sock.sendto(data, addr)
+        retry = min(time.time() + interval, deadline)
+        while True:
+            remaining = retry - time.time()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                response, peer = sock.recvfrom(1100)
+            except socket.timeout:
+                break
+            if peer[0] != addr[0]:
+                continue
+            result = check(response)
+            if result is not None:
+                return result
+        if time.time() >= deadline:
+            raise NatPmpError("No response from %s" % addr[0])
+        interval *= 2
+
+
+def natpmp_external_ip(sock, addr, deadline):
+    """Return the external IP via NAT-PMP, or None if gateway speaks only PCP"""
+    def check(data):
+        if len(data) < 4:
+            return None
+        version, opcode, result = struct.unpack('!BBH', data[:4])
+        if result == UNSUPP_VERSION:
+            return ""
+        if version != NATPMP_VERSION or opcode != 128:
+            return None
+        if result:
+            raise NatPmpError("NAT-PMP error, result code %d" % result)
+        if len(data) < 12:
+            return None
+        return socket.inet_ntoa(data[8:12])
+
+    return exchange(sock, struct.pack('!BB', NATPMP_VERSION, 0), addr, deadline,
+                    check) or None
+
+
+def pcp_map_request(client, port, lifetime, nonce):
+    mapped = b'\0' * 10 + b'\xff\xff' + socket.inet_aton(client)
+    return (struct.pack('!BBHL', PCP_VERSION, PCP_OPCODE_MAP, 0, lifetime) + mapped +
+            nonce + struct.pack('!B3xHH', socket.IPPROTO_UDP, port, 0) + b'\0' * 16)
+
+
+def pcp_external_ip(sock, addr, deadline):
+    """Return the external IP via a short-lived PCP MAP of sock's own port"""
+    client, port = sock.getsockname()
+    nonce = os.urandom(12)
+
+    def check(data):
+        if len(data) < 60:
+            return None
+        version, opcode, result = struct.unpack('!BBxB', data[:4])
+        if version != PCP_VERSION or opcode != 0x80 | PCP_OPCODE_MAP or data[24:36] != nonce:
+            return None
+        if result:
+            raise NatPmpError("PCP error, result code %d" % result)
+        external = data[44:60]
+        if external[:12] != b'\0' * 10 + b'\xff\xff':
+            raise NatPmpError("PCP assigned a non-IPv4 external address")
+        return socket.inet_ntoa(external[12:])
+
+    ip = exchange(sock, pcp_map_request(client, port, PCP_LIFETIME, nonce),
+                  addr, deadline, check)
+
+    # Best-effort delete of the mapping, it expires anyway
+    try:
+        sock.sendto(pcp_map_request(client, port, 0, nonce), addr)
+    except socket.error:
+        pass
+
+    return ip
+
+
+def external_ip(gateway=None, timeout=TIMEOUT, port=PORT):
+    """Return the external IP address reported by the gateway via NAT-PMP/PCP
+
+    gateway defaults to the IPv4 default gateway.
+    """
+    addr = (gateway or default_gateway(), port)
+    deadline = time.time() + timeout
+
+    # Address of the interface facing the gateway, needed as PCP client IP
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(addr)
+        client = sock.getsockname()[0]
+    finally:
+        sock.close()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind((client, 0))
+        ip = natpmp_external_ip(sock, addr, deadline)
+        if ip is None:
+            log.debug("Gateway %s does not support NAT-PMP, trying PCP", addr[0])
+            ip = pcp_external_ip(sock, addr, deadline)
+    finally:
+        sock.close()
+
+    return ip
+
+
+USAGE = """Find external IP address via NAT-PMP or PCP
+Usage: python natpmp.py [GATEWAY]
+"""
+if __name__ == "__main__":
+    if len(sys.argv) > 2 or sys.argv[1:2] in (['-h'], ['--help']):
+        print(USAGE)
+        sys.exit()
+
+    try:
+        print(external_ip(*sys.argv[1:]))
+        sys.exit(0)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
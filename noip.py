@@ -24,6 +24,30 @@ USERNAME = ""
 PASSWORD = ""
 HOSTNAMES = []
 SERVER = "https://dynupdate.no-ip.com/nic/update"
+USER_AGENT = "MestreLion ddns-tools/1.0 linux@rodrigosilva.com"
+CONNECT_TIMEOUT = 10  # seconds
+TIMEOUT = 30  # seconds, for each read
+BATCH_SIZE = 20  # hostnames per request
+JOBS = 4  # accounts updated concurrently
+RATE = 2.0  # requests per second, over all accounts
+ACCOUNT_RATE = 1.0  # requests per second, per account
+BACKOFF = 30 * 60  # seconds, after a 911 response, as the protocol mandates
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')  # methods safe to resend
+
+# Response codes of the update protocol
+CODES = {
+    'good':     "DNS hostname update successful",
+    'nochg':    "IP address is current, no update performed",
+    'nohost':   "Hostname does not exist under the account",
+    'badauth':  "Invalid username and password combination",
+    'badagent': "Client disabled",
+    '!donator': "Feature not available for the account",
+    'abuse':    "Username is blocked due to abuse",
+    '911':      "Fatal error on the server side",
+}
+OK_CODES = ('good', 'nochg')
+BLOCK_CODES = ('nohost', 'badauth', 'badagent', '!donator', 'abuse')
+ACCOUNT_CODES = ('badauth', 'badagent', 'abuse')  # block the whole account
 
 
 import sys
@@ -33,56 +57,252 @@ import argparse
 import xdg.BaseDirectory as xdg
 import urllib
 import urllib2
+import urlparse
+import httplib
+import socket
+import errno
+import ssl
+import threading
+import time
 import base64
+import hashlib
+import hmac
+import json
+import collections
 import cStringIO
 
+import actions
+import ifaddr
+
 
 myname = os.path.basename(os.path.splitext(__file__)[0])
 log = logging.getLogger(myname)
 
+STATUS_FILE = os.path.join(xdg.xdg_cache_home, '%s.status' % myname)
+SECRET_FILE = os.path.join(xdg.xdg_config_home, myname, 'status.key')
+
+
+class UpdateError(Exception):
+    pass
+
+
+class Response(collections.namedtuple('Response', 'hostname code ip line')):
+    """Parsed response line of a hostname update"""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.code in OK_CODES
+
+    @property
+    def description(self):
+        return CODES.get(self.code, "Unknown response")
+
+
+def parse_response(hostname, line):
+    """Return a Response for a hostname update response line
+
+    Lines are a code, such as 'good' or 'nohost', optionally followed by
+    the IP. Unknown codes are kept as they are, but are never ok.
+    """
+    words = line.split()
+    code = words[0] if words else ""
+    ip = words[1] if len(words) > 1 else None
+    return Response(hostname, code, ip, line)
+
+
+class TracingMixin:
+    """Log the HTTP dialog of each connection to the module logger
+
+    Unlike httplib's debuglevel, which prints to the process-wide stdout,
+    this is safe with concurrent requests in several threads.
+    """
+    trace = False
+
+    def send(self, data):
+        if self.trace:
+            log.debug("%s send: %r", self.host, data)
+        httplib.HTTPConnection.send(self, data)
+
+    def getresponse(self):
+        res = httplib.HTTPConnection.getresponse(self)
+        if self.trace:
+            log.debug("%s reply: %d %s", self.host, res.status, res.reason)
+            for header in res.getheaders():
+                log.debug("%s header: %s: %s", self.host, *header)
+        return res
+
+
+class HTTPConnection(TracingMixin, httplib.HTTPConnection):
+    pass
+
+
+class HTTPSConnection(TracingMixin, httplib.HTTPSConnection):
+    pass
+
+
+def stale(error):
+    """True if error shows a kept-alive connection closed by the server
+
+    That is, reset while sending the request, or closed before any byte
+    of the response arrived.
+    """
+    if isinstance(error, httplib.BadStatusLine):
+        # Older 2.7 releases give an empty line, newer ones say so
+        return error.line in ("", repr("")) or error.line.startswith("No status line")
+    return (isinstance(error, socket.error) and not isinstance(error, socket.timeout)
+            and error.errno in (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED))
 
-class HttpAuth(object):
-    """Simplified version of HttpBot with HTTP Basic Authentication"""
-    def __init__(self, debug=False):
-        hh  = urllib2.HTTPHandler( debuglevel=1 if debug else 0)
-        hsh = urllib2.HTTPSHandler(debuglevel=1 if debug else 0)
-        self._opener = urllib2.build_opener(hh, hsh)
 
-    def get(self, url, querydata=None, postdata=None, username="", password=""):
+class HttpAuth(object):
+    """Simplified version of HttpBot with HTTP Basic Authentication
+
+    Keeps a pool of keep-alive connections per host, shared by all threads,
+    so repeated requests skip the TCP and TLS handshakes. Redirects are not
+    followed. Proxies are taken from the http_proxy, https_proxy and
+    no_proxy environment variables, unless given, as urllib2 does. HTTPS
+    goes through the proxy in a CONNECT tunnel.
+    """
+    def __init__(self, debug=False, timeout=TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT, context=None, proxies=None):
+        self.debug = debug
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.context = context or ssl.create_default_context()
+        self.proxies = urllib.getproxies() if proxies is None else proxies
+        self.connects = 0  # new connections made, for statistics
+        self._idle = {}  # (scheme, netloc): [connection, ...]
+        self._lock = threading.Lock()
+
+    def _proxy(self, scheme, netloc):
+        """Return (proxy netloc, Proxy-Authorization headers) for netloc, or None"""
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.proxy_bypass(netloc.rsplit(':', 1)[0]):
+            return None
+        parsed = urlparse.urlparse(proxy if '//' in proxy else '//' + proxy)
+        headers = {}
+        if parsed.username:
+            auth = "%s:%s" % (urllib.unquote(parsed.username),
+                              urllib.unquote(parsed.password or ""))
+            headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(auth)
+        return parsed.hostname + (':%d' % parsed.port if parsed.port else ''), headers
+
+    def _connect(self, scheme, netloc):
+        proxy = self._proxy(scheme, netloc)
+        if scheme == 'https':
+            conn = HTTPSConnection(proxy[0] if proxy else netloc,
+                                   timeout=self.connect_timeout, context=self.context)
+            if proxy:
+                conn.set_tunnel(netloc, headers=proxy[1])
+        else:
+            conn = HTTPConnection(proxy[0] if proxy else netloc,
+                                  timeout=self.connect_timeout)
+        # Plain HTTP via a proxy asks for absolute URLs, with the proxy's auth
+        conn.proxy_headers = proxy[1] if proxy and scheme != 'https' else None
+        conn.trace = self.debug
+        conn.connect()
+        conn.sock.settimeout(self.timeout)
+        with self._lock:
+            self.connects += 1
+        log.debug("Connected to %s://%s%s", scheme, netloc,
+                  " via proxy %s" % proxy[0] if proxy else "")
+        return conn
+
+    def _acquire(self, scheme, netloc):
+        """Return (connection, reused), reusing an idle one if possible"""
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+        return self._connect(scheme, netloc), False
+
+    def _release(self, scheme, netloc, conn):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def _request(self, method, url, data, headers):
+        """Send a request, return (response, body)
+
+        A request failing on a reused connection is sent again on a new one
+        only if it is idempotent and the server closed the connection before
+        answering anything, as it may do with idle keep-alive connections.
+        """
+        parsed = urlparse.urlparse(url)
+        scheme, netloc = parsed.scheme, parsed.netloc
+        path = urlparse.urlunparse(('', '', parsed.path or '/', parsed.params,
+                                    parsed.query, ''))
+        while True:
+            try:
+                conn, reused = self._acquire(scheme, netloc)
+            except (httplib.HTTPException, socket.error) as e:
+                raise urllib2.URLError(e)
+            try:
+                if conn.proxy_headers is not None:
+                    conn.request(method, urlparse.urlunparse(parsed[:5] + ('',)), data,
+                                 dict(headers, **conn.proxy_headers))
+                else:
+                    conn.request(method, path, data, headers)
+                res = conn.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if reused and method in IDEMPOTENT and stale(e):
+                    log.debug("Stale connection to %s: %r", netloc, e)
+                    continue
+                raise urllib2.URLError(e)
+            try:
+                body = res.read()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                raise urllib2.URLError(e)
+            if res.will_close:
+                conn.close()
+            else:
+                self._release(scheme, netloc, conn)
+            return res, body
+
+    def get(self, url, querydata=None, postdata=None, username="", password="",
+            headers=None, method=None):
+        """Open url, POSTing postdata if any, and return the response
+
+        postdata is either a dict to be urlencoded or an already encoded
+        string. method overrides the HTTP method, e.g. 'PATCH'. Raise
+        urllib2.HTTPError for HTTP error statuses, urllib2.URLError if the
+        connection fails.
+        """
         if querydata:
             url = "%s?%s" % (url, urllib.urlencode(querydata))
 
-        if postdata:
+        if isinstance(postdata, dict):
             data = urllib.urlencode(postdata)
         else:
-            data = None
+            data = postdata or None
 
         log.debug("Opening '%s'", url)
 
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', USER_AGENT)
+        if data is not None:
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
         if username and password:
             log.debug("Using HTTP Basic Authentication")
             auth = ("%s:%s" % (username, password)).encode("UTF-8")
-            headers = {'Authorization': b'Basic ' + base64.b64encode(auth)}
-            req = urllib2.Request(url, headers=headers)
-        else:
-            req = url
+            headers['Authorization'] = b'Basic ' + base64.b64encode(auth)
 
-        # Redirect stdout so urllib's debug data gets properly logged
-        stdout_ = sys.stdout
-        stream = cStringIO.StringIO()
-        sys.stdout = stream
+        res, body = self._request(method or ('POST' if data else 'GET'),
+                                  url, data, headers)
 
-        # Open the URL
-        res = self._opener.open(req, data)
-
-        # Restore stdout and log output, if any
-        sys.stdout = stdout_
-        output = stream.getvalue().strip()
-        if output:
-            for line in output.split('\n'):
-                log.debug(line)
-
-        return res
+        if res.status >= 400:
+            raise urllib2.HTTPError(url, res.status, res.reason, res.msg,
+                                    cStringIO.StringIO(body))
+        return urllib2.addinfourl(cStringIO.StringIO(body), res.msg, url,
+                                  res.status)
 
 
 def main(argv=None):
@@ -94,76 +314,342 @@ def main(argv=None):
     log.debug(args)
     config = read_config(args)
 
-    username  = args.username  or config['username']  or USERNAME
-    password  = args.password  or config['password']  or PASSWORD
-    hostnames = args.hostnames or config['hostnames'] or HOSTNAMES
-
-    if not (username and password):
-        log.error("Missing credentials."
-                  " Set them up once with --username and --password")
+    if args.username or args.password or args.hostnames:
+        accounts = [(args.username  or config['username']  or USERNAME,
+                     args.password  or config['password']  or PASSWORD,
+                     args.hostnames or config['hostnames'] or HOSTNAMES)]
+    else:
+        accounts = config['accounts'] or [(USERNAME, PASSWORD, HOSTNAMES)]
+
+    for username, password, hostnames in accounts:
+        if not (username and password):
+            log.error("Missing credentials."
+                      " Set them up once with --username and --password")
+            return -1
+
+        if not hostnames:
+            log.error("No hosts to update for %s."
+                      " Set them up once using command line arguments", username)
+            return -1
+
+    ip6 = None
+    if args.ipv6 is not None:
+        try:
+            ip6 = args.ipv6 or ifaddr.local_ipv6()
+        except IOError as e:
+            log.error(e)
+            return -1
+
+    http = HttpAuth(debug=args.debug)
+    failed = False
+    for result in update_accounts(accounts, http=http, jobs=args.jobs,
+                                  rate=args.rate, status=Status(), ip6=ip6):
+        if not result.ok:
+            failed = True
+            if isinstance(result.error, urllib2.HTTPError) and result.error.code == 401:
+                log.error("%s: Unauthorized, check your login and password",
+                          result.name)
+            else:
+                log.error("%s: %s", result.name, result.error)
+            continue
+
+        for response in result.value:
+            if response.ok:
+                log.info("%s: %s: %s", result.name, response.hostname, response.line)
+            else:
+                log.error("%s: %s: %s (%s)", result.name, response.hostname,
+                          response.line, response.description)
+                failed = True
+
+        if any(response.code == 'badauth' for response in result.value):
+            log.error("%s: Bad authentication, check your login and password",
+                      result.name)
+
+    if failed:
         return -1
 
-    if not hostnames:
-        log.error("No hosts to update."
-                  " Set them up once using command line arguments")
-        return -1
 
-    try:
-        http = HttpAuth(debug=args.debug)
-        res = http.get(SERVER,
-                       querydata={'hostname': ",".join(hostnames)},
-                       username=username,
-                       password=password)
-    except urllib2.HTTPError as e:
-        if e.code != 401:  # Unauthorized
-            raise
-        log.error("Unauthorized, check your login and password")
-        return -1
+class TokenBucket(object):
+    """Thread-safe token bucket rate limiter
+
+    Allows rate requests per second on average, in bursts of up to burst.
+    """
+    def __init__(self, rate, burst=1, clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.stamp = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting for one if needed"""
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def update_accounts(accounts, ip=None, http=None, server=SERVER, jobs=JOBS,
+                    rate=RATE, account_rate=ACCOUNT_RATE, status=None, ip6=None):
+    """Update many (username, password, hostnames) accounts concurrently
+
+    Up to jobs accounts are updated at a time. Hostnames are sent in batches
+    of BATCH_SIZE, limited to rate requests per second overall and
+    account_rate per account, and checked against status, a Status. Return
+    a list of actions.Result, one per account in the same order, named after
+    the username, and with the list of Response as value.
+    """
+    http = http or HttpAuth()
+    status = status or Status(None)
+    limiter = TokenBucket(rate, burst=max(1, jobs))
+
+    def update_account(username, password, hostnames):
+        limiters = (limiter, TokenBucket(account_rate))
+        responses = []
+        for i in range(0, len(hostnames), BATCH_SIZE):
+            responses.extend(status.update(hostnames[i:i + BATCH_SIZE], ip,
+                                           username, password, http, server,
+                                           limiters, ip6))
+        return responses
+
+    todo = []
+    names = [account[0] for account in accounts]
+    for i, account in enumerate(accounts):
+        name = account[0] if names.count(account[0]) == 1 else "%s#%d" % (account[0], i + 1)
+        requests = max(1, -(-len(account[2]) // BATCH_SIZE))
+        todo.append(actions.Action(name, update_account, account,
+                                   timeout=requests * actions.TIMEOUT))
+    return actions.run(todo, workers=jobs)
+
+
+class Status(object):
+    """Last response of each hostname, and the blocks and backoff they imply
+
+    Hostnames that got a response in BLOCK_CODES are not updated again
+    until the config changes, that is, until their username, password or
+    the hostname itself change. badauth, badagent and abuse block the whole
+    account. A 911 response holds all updates for BACKOFF seconds.
+    Persisted as JSON in path, readable only by the user, and saved after
+    every recorded response.
+
+    Blocks are keyed by an HMAC of the credentials under a random secret,
+    kept apart in secret_path, so the status file alone can't be used to
+    guess the password offline.
+    """
+    def __init__(self, path=STATUS_FILE, clock=time.time, secret_path=SECRET_FILE):
+        self.path = path
+        self.clock = clock
+        self.data = dict(backoff=0, blocked={}, hostnames={})
+        self._lock = threading.Lock()
+        self.secret = load_secret(secret_path if path else None)
+        if path:
+            try:
+                with open(path) as f:
+                    self.data.update(json.load(f))
+            except (IOError, ValueError) as e:
+                log.debug("No usable update status: %s", e)
+            # Unsalted SHA1 keys of older versions
+            legacy = [_ for _ in self.data['blocked'] if len(_) == 40]
+            if legacy:
+                for key in legacy:
+                    del self.data['blocked'][key]
+                self.save()
+
+    def key(self, username, password, hostname=""):
+        """Fingerprint of a config entry, so no password is stored"""
+        return hmac.new(self.secret, "\t".join((username, password, hostname))
+                        .encode('UTF-8'), hashlib.sha256).hexdigest()
+
+    def backoff(self):
+        """Return the seconds left before updates are allowed again, or 0"""
+        return max(self.data['backoff'] - self.clock(), 0)
+
+    def blocked(self, username, password, hostname):
+        """Return the code that blocked hostname, or None"""
+        blocked = self.data['blocked']
+        entry = (blocked.get(self.key(username, password)) or
+                 blocked.get(self.key(username, password, hostname)))
+        return entry and entry['code']
+
+    def record(self, username, password, responses):
+        now = self.clock()
+        with self._lock:
+            for response in responses:
+                self.data['hostnames']["%s/%s" % (username, response.hostname)] = dict(
+                    code=response.code, ip=response.ip, line=response.line, time=now)
+                if response.code in BLOCK_CODES:
+                    hostname = "" if response.code in ACCOUNT_CODES else response.hostname
+                    log.error("%s: %s: %s (%s), blocked until the config changes",
+                              username, response.hostname, response.code,
+                              response.description)
+                    self.data['blocked'][self.key(username, password, hostname)] = dict(
+                        code=response.code, time=now)
+                elif response.code == '911':
+                    log.error("%s: %s: %s (%s), holding updates for %d seconds",
+                              username, response.hostname, response.code,
+                              response.description, BACKOFF)
+                    self.data['backoff'] = now + BACKOFF
+            self.save()
+
+    def update(self, hostnames, ip=None, username=USERNAME, password=PASSWORD,
+               http=None, server=SERVER, limiters=(), ip6=None):
+        """Like update(), but honoring blocks and backoff, and recording responses
+
+        Return a list of Response, in the same order as hostnames, where
+        blocked hostnames are not ok and have their blocking code, but no
+        IP. Raise UpdateError while backing off.
+        """
+        backoff = self.backoff()
+        if backoff:
+            raise UpdateError("server asked to back off, retry in %d seconds" % backoff)
+
+        blocked = dict((hostname, self.blocked(username, password, hostname))
+                       for hostname in hostnames)
+        allowed = [_ for _ in hostnames if not blocked[_]]
+        responses = {}
+        if allowed:
+            results = update(allowed, ip, username, password, http, server,
+                             limiters, ip6)
+            responses = dict((hostname, parse_response(hostname, line))
+                             for hostname, line in results)
+            self.record(username, password, responses.values())
+
+        return [responses.get(hostname) or
+                Response(hostname, blocked[hostname], None,
+                         "%s (blocked)" % blocked[hostname])
+                for hostname in hostnames]
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with private_file(self.path) as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+        except (IOError, OSError) as e:
+            log.error("Could not save update status: %s", e)
 
-    body = res.read().strip()
-    for line in body.split('\n'):
-        log.info(line)
 
-    if body.startswith("badauth"):
-        log.error("Bad authentication, check your login and password")
-        return -1
+def private_file(path):
+    """Open path for writing, creating it, or making it, readable only by the user"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    os.fchmod(fd, 0600)
+    return os.fdopen(fd, 'w')
 
 
-def read_config(args):
+def load_secret(path):
+    """Return the secret in path, created at random if missing, or a new one if None"""
+    if path:
+        try:
+            with open(path, 'rb') as f:
+                secret = f.read()
+            if secret:
+                return secret
+        except IOError:
+            pass
+    secret = os.urandom(32)
+    if path:
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with private_file(path) as f:
+                f.write(secret)
+        except (IOError, OSError) as e:
+            log.error("Could not save status secret: %s", e)
+    return secret
+
+
+def update(hostnames, ip=None, username=USERNAME, password=PASSWORD,
+           http=None, server=SERVER, limiters=(), ip6=None):
+    """Update hostnames to ip, or to the IP seen by the server if None
+
+    Their IPv6 address is also updated to ip6, if given. Return a list of
+    (hostname, response line), in the same order.
+    Works with any server speaking NoIP's (and DynDNS') update protocol.
+    A token is taken from each TokenBucket in limiters before the request.
+    """
+    querydata = {'hostname': ",".join(hostnames)}
+    if ip:
+        querydata['myip'] = ip
+    if ip6:
+        querydata['myipv6'] = ip6
+
+    for limiter in limiters:
+        limiter.acquire()
+
+    res = (http or HttpAuth()).get(server,
+                                   querydata=querydata,
+                                   username=username,
+                                   password=password)
+
+    lines = [line.strip() for line in res.read().strip().split('\n')]
+    # A single line, such as 'badauth', applies to all hostnames
+    if len(lines) == 1:
+        lines *= len(hostnames)
+    lines += [""] * (len(hostnames) - len(lines))
+    return zip(hostnames, lines)
+
+
+def read_config(args=None):
+    """Read, and save if args has any settings, the config file
+
+    The file has one or more accounts, each a 'username<TAB>password' line
+    followed by one hostname per line. The first account is also returned
+    as username, password and hostnames, and is the one saved from args.
+    """
     config = os.path.join(xdg.save_config_path(myname), "%s.conf" % myname)
 
-    username = ""
-    password = ""
-    hostnames = []
+    accounts = []
 
     # Read
     log.debug("Reading settings from '%s'", config)
     try:
         with open(config, 'r') as fd:
-            username, password = fd.readline().strip().split('\t')
-            for line in fd:
-                hostnames.append(line.strip())
+            for i, line in enumerate(fd):
+                line = line.strip()
+                if '\t' in line:
+                    username, password = line.split('\t')
+                    accounts.append((username, password, []))
+                elif not accounts:
+                    raise ValueError("Missing credentials at line %d" % (i + 1))
+                elif line:
+                    accounts[-1][2].append(line)
     except IOError as e:
         log.warn(e)
     except ValueError as e:
         log.error("Error in config file, check credentials at '%s'", config)
 
+    username, password, hostnames = accounts[0] if accounts else ("", "", [])
+
     # Save
-    if args.username or args.password or args.hostnames:
+    if args and (args.username or args.password or args.hostnames):
         log.info("Saving settings to '%s'", config)
+        username  = args.username  or username
+        password  = args.password  or password
+        hostnames = args.hostnames or hostnames
+        accounts[:1] = [(username, password, hostnames)]
         try:
             with open(config, 'w') as fd:
-                fd.write("%s\t%s\n" % (args.username or username,
-                                       args.password or password,))
-                for hostname in (args.hostnames or hostnames):
-                    fd.write("%s\n" % hostname)
+                for account in accounts:
+                    fd.write("%s\t%s\n" % account[:2])
+                    for hostname in account[2]:
+                        fd.write("%s\n" % hostname)
             os.chmod(config, 0600)
         except IOError as e:
             log.error(e)
 
     return dict(username=username,
                 password=password,
-                hostnames=hostnames)
+                hostnames=hostnames,
+                accounts=accounts)
 
 
 def parse_args(argv=None):
@@ -190,6 +676,18 @@ def parse_args(argv=None):
     group.add_argument('-u', '--username', help="Account username or email")
     group.add_argument('-p', '--password', help="Account password")
 
+    parser.add_argument('-j', '--jobs', default=JOBS, type=int,
+                        help="Accounts to update concurrently."
+                            " Default is %(default)s")
+
+    parser.add_argument('-r', '--rate', default=RATE, type=float,
+                        help="Maximum update requests per second, over all"
+                            " accounts. Default is %(default)s")
+
+    parser.add_argument('-6', '--ipv6', nargs='?', const='', metavar='ADDRESS',
+                        help="Also update the IPv6 address of the hostnames,"
+                            " by default the global one of this host.")
+
     parser.add_argument(nargs="*", dest='hostnames',
                         help="Hostnames to update."
                             " Will also be saved in config file for future runs.")
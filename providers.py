@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# providers - Pluggable DDNS providers with batched multi-hostname updates
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Pluggable DDNS providers with batched multi-hostname updates
+
+Every provider implements update(hostnames, ip), returning one Result per
+hostname. Each provider class declares how many hostnames fit in a single
+request, and hostnames are grouped accordingly, so updating many of them
+takes the fewest HTTP calls.
+
+Providers are configured in an INI file, one section per provider instance.
+The section name is also the provider type, unless a 'type' option says
+otherwise. Options are passed to the provider, and 'hostnames' is a
+whitespace or comma separated list:
+
+    [noip]
+    # username, password and hostnames default to noip's own config
+
+    [dnsomatic]
+    username = me
+    password = secret
+    hostnames = all.dnsomatic.com
+
+    [myserver]
+    type = dyndns2
+    url = https://dyn.example.com/nic/update
+    username = me
+    password = secret
+    hostnames = home.example.com, office.example.com
+
+    [cloudflare]
+    token = API token with DNS edit permission
+    zone = zone ID
+    hostnames = home.example.com
+
+    [rfc2136]
+    server = 192.0.2.53
+    key_name = ddns-key
+    key_secret = base64 secret, as in BIND's or Knot's key file
+    key_algorithm = hmac-sha256
+    hostnames = home.example.com
+
+Without a config file, there is one NoIP provider per account in noip's own
+config.
+"""
+
+import re
+import json
+import socket
+import urllib2
+import logging
+import collections
+import ConfigParser
+
+import noip
+import rfc2136
+import dnsquery
+
+
+log = logging.getLogger(__name__)
+
+Result = collections.namedtuple('Result', 'hostname ok status')
+
+
+class ProviderError(Exception):
+    pass
+
+
+def batches(items, size):
+    """Split items in lists of at most size items, or a single list if None"""
+    items = list(items)
+    if not size:
+        return [items] if items else []
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class Provider(object):
+    """Base DDNS provider, subclasses implement update_batch()"""
+    batch_size = 1  # hostnames per request, None for unlimited
+
+    def __init__(self, name=None, hostnames=(), http=None, **options):
+        self.name = name or self.__class__.__name__.lower()
+        if isinstance(hostnames, basestring):
+            hostnames = re.split(r'[\s,]+', hostnames.strip())
+        self.hostnames = [_ for _ in hostnames if _]
+        self.http = http or noip.HttpAuth()
+        self.options = options
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+    def update(self, hostnames, ip, ip6=None):
+        """Update all hostnames to ip, and to ip6 if given and supported
+
+        Both addresses go in the same request, where the provider allows.
+        Return a list of Result in the same order.
+        """
+        results = []
+        for batch in batches(hostnames, self.batch_size):
+            log.debug("%s: updating %s to %s", self.name, ", ".join(batch),
+                      ", ".join(_ for _ in (ip, ip6) if _))
+            results.extend(self.update_batch(batch, ip, ip6))
+        return results
+
+    def update_batch(self, hostnames, ip, ip6=None):
+        """Update up to batch_size hostnames in a single request"""
+        raise NotImplementedError
+
+
+class DynDNS2(Provider):
+    """Generic provider for the DynDNS2 update protocol"""
+    batch_size = 20  # as in the protocol specification
+    url = ""
+
+    def __init__(self, name=None, hostnames=(), http=None,
+                 url="", username="", password="", **options):
+        super(DynDNS2, self).__init__(name, hostnames, http, **options)
+        self.url = url or self.url
+        self.username = username
+        self.password = password
+        if not self.url:
+            raise ProviderError("%s: missing url" % self.name)
+
+    def update_batch(self, hostnames, ip, ip6=None):
+        return [Result(hostname, line.split(' ')[0] in ('good', 'nochg'), line)
+                for hostname, line in noip.update(hostnames, ip,
+                                                  self.username, self.password,
+                                                  self.http, self.url, ip6=ip6)]
+
+
+class NoIP(DynDNS2):
+    """NoIP, rate limited per account and over all accounts
+
+    Blocked hostnames and 911 backoffs are tracked in noip's status file.
+    """
+    batch_size = noip.BATCH_SIZE
+    url = noip.SERVER
+    limiter = noip.TokenBucket(noip.RATE, burst=noip.JOBS)  # shared by all
+    status = None  # noip.Status, shared by all, loaded on first use
+
+    def __init__(self, name=None, hostnames=(), http=None,
+                 url="", username="", password="", **options):
+        if not (username and password and hostnames):
+            config = noip.read_config()
+            username  = username  or config['username']
+            password  = password  or config['password']
+            hostnames = hostnames or config['hostnames']
+        super(NoIP, self).__init__(name, hostnames, http,
+                                   url, username, password, **options)
+        self.limiters = (self.limiter, noip.TokenBucket(noip.ACCOUNT_RATE))
+        if NoIP.status is None:
+            NoIP.status = noip.Status()
+
+    def update_batch(self, hostnames, ip, ip6=None):
+        try:
+            responses = self.status.update(hostnames, ip,
+                                           self.username, self.password,
+                                           self.http, self.url, self.limiters,
+                                           ip6)
+        except noip.UpdateError as e:
+            raise ProviderError("%s: %s" % (self.name, e))
+        return [Result(_.hostname, _.ok, _.line) for _ in responses]
+
+
+class DnsOMatic(DynDNS2):
+    batch_size = 1  # one hostname, or 'all.dnsomatic.com', per request
+    url = "https://updates.dnsomatic.com/nic/update"
+
+    def update_batch(self, hostnames, ip, ip6=None):
+        # No IPv6 support
+        return super(DnsOMatic, self).update_batch(hostnames, ip)
+
+
+class Cloudflare(Provider):
+    """Cloudflare API v4, all records of a zone patched in a single batch
+
+    Only existing records are patched: with ip6, hostnames without AAAA
+    records get just their A records updated, and vice versa.
+    """
+    batch_size = 200
+    api = "https://api.cloudflare.com/client/v4"
+
+    def __init__(self, name=None, hostnames=(), http=None,
+                 token="", zone="", api="", **options):
+        super(Cloudflare, self).__init__(name, hostnames, http, **options)
+        self.token = token
+        self.zone = zone
+        self.api = api or self.api
+        if not (token and zone):
+            raise ProviderError("%s: missing token or zone" % self.name)
+        self._records = None
+
+    def request(self, path, data=None, method=None, querydata=None):
+        headers = {'Authorization': 'Bearer %s' % self.token,
+                   'Content-Type': 'application/json'}
+        try:
+            res = self.http.get("%s/zones/%s/%s" % (self.api, self.zone, path),
+                                querydata=querydata,
+                                postdata=data and json.dumps(data),
+                                headers=headers, method=method)
+        except urllib2.HTTPError as e:
+            res = e  # API errors come with a JSON body as well
+        except urllib2.URLError as e:
+            raise ProviderError("%s: %s" % (self.name, e.reason))
+        try:
+            reply = json.load(res)
+        except ValueError:
+            raise ProviderError("%s: invalid reply from %s" % (self.name, self.api))
+        if not reply.get('success'):
+            raise ProviderError("%s: %s" % (self.name, reply.get('errors')))
+        return reply['result']
+
+    def update(self, hostnames, ip, ip6=None):
+        # Fetch all A and AAAA records once, instead of once per batch
+        self._records = dict(((record['name'], record['type']), record)
+                             for record in self.request('dns_records',
+                                                        querydata={'per_page': 5000})
+                             if record['type'] in ('A', 'AAAA'))
+        try:
+            return super(Cloudflare, self).update(hostnames, ip, ip6)
+        finally:
+            self._records = None
+
+    def update_batch(self, hostnames, ip, ip6=None):
+        results = {}
+        patches = []
+        for hostname in hostnames:
+            records = [(self._records.get((hostname, rtype)), address)
+                       for rtype, address in (('A', ip), ('AAAA', ip6))
+                       if address and (hostname, rtype) in self._records]
+            addresses = ",".join(address for _, address in records)
+            if not records:
+                results[hostname] = Result(hostname, False, "nohost")
+            elif all(record['content'] == address for record, address in records):
+                results[hostname] = Result(hostname, True, "nochg %s" % addresses)
+            else:
+                patches.extend({'id': record['id'], 'content': address}
+                               for record, address in records
+                               if record['content'] != address)
+                results[hostname] = Result(hostname, True, "good %s" % addresses)
+
+        if patches:
+            self.request('dns_records/batch', {'patches': patches}, 'POST')
+
+        return [results[hostname] for hostname in hostnames]
+
+
+class RFC2136(Provider):
+    """DNS dynamic updates, TSIG signed, straight to the zone's primary server
+
+    server is ADDRESS[#PORT]. zone is found at the server if not given, and
+    hostnames of several zones are updated in one message per zone.
+    """
+    batch_size = None
+
+    def __init__(self, name=None, hostnames=(), http=None,
+                 server="", zone="", key_name="", key_secret="",
+                 key_algorithm=rfc2136.ALGORITHM, ttl=rfc2136.TTL, **options):
+        super(RFC2136, self).__init__(name, hostnames, http, **options)
+        host, _, port = server.partition('#')
+        if not host:
+            raise ProviderError("%s: missing server" % self.name)
+        try:
+            self.server = (host, int(port or dnsquery.PORT))
+        except ValueError:
+            raise ProviderError("%s: invalid server port: %s" % (self.name, port))
+        self.zone = zone
+        try:
+            self.ttl = int(ttl)
+        except ValueError:
+            raise ProviderError("%s: invalid ttl: %s" % (self.name, ttl))
+        self.key = None
+        if key_name or key_secret:
+            try:
+                self.key = rfc2136.Key(key_name, key_secret, key_algorithm)
+            except (rfc2136.UpdateError, TypeError, ValueError) as e:
+                raise ProviderError("%s: invalid key: %s" % (self.name, e))
+
+    def update_batch(self, hostnames, ip, ip6=None):
+        try:
+            address = socket.getaddrinfo(self.server[0], self.server[1],
+                                         0, socket.SOCK_DGRAM)[0][4][:2]
+            lines = rfc2136.update(address, hostnames, ip, self.key,
+                                   self.zone, self.ttl, ip6=ip6)
+        except (rfc2136.UpdateError, dnsquery.DnsError, socket.error) as e:
+            raise ProviderError("%s: %s" % (self.name, e))
+        return [Result(hostname, line.split(' ')[0] in ('good', 'nochg'), line)
+                for hostname, line in lines]
+
+
+# Provider types by config name
+PROVIDERS = {
+    'noip':       NoIP,
+    'dnsomatic':  DnsOMatic,
+    'dyndns2':    DynDNS2,
+    'cloudflare': Cloudflare,
+    'rfc2136':    RFC2136,
+}
+
+
+def load(path, http=None):
+    """Return the list of providers configured in path, or NoIP if none"""
+    cp = ConfigParser.RawConfigParser()
+    if not cp.read(path):
+        log.debug("No providers config at '%s', using NoIP", path)
+        accounts = noip.read_config()['accounts']
+        if not accounts:
+            return [NoIP(http=http)]
+        # One provider per NoIP account, the first keeps the plain name
+        return [NoIP('noip' if i == 0 else 'noip-%s' % username, hostnames, http,
+                     username=username, password=password)
+                for i, (username, password, hostnames) in enumerate(accounts)]
+
+    providers = []
+    for section in cp.sections():
+        options = dict(cp.items(section))
+        kind = options.pop('type', section)
+        try:
+            providers.append(PROVIDERS[kind](section, http=http, **options))
+        except KeyError:
+            log.error("Unknown provider type '%s' in '%s'", kind, path)
+        except (TypeError, ProviderError) as e:
+            log.error("Invalid provider '%s' in '%s': %s", section, path, e)
+    return providers
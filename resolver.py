@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# resolver - Racing multi-source external IP resolver
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Racing multi-source external IP resolver
+
+All sources are queried at the same time, each in its own thread. The first
+valid answer wins, or, with a quorum, the first address reported by that
+many sources. Sources still running by then are abandoned: their threads are
+daemonic and their late answers discarded.
+
+Per-source latency and success statistics are kept across runs, and used to
+order sources and to skip the ones that keep failing for a while.
+"""
+
+import os.path as osp
+import time
+import json
+import socket
+import logging
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+import xdg.BaseDirectory as xdg
+
+import upnp
+import natpmp
+import stun
+import ifaddr
+import urllib23
+
+
+HTTP_ECHO_URL = "https://api.ipify.org"
+HTTP_ECHO_URL6 = "https://api6.ipify.org"  # IPv6 only, so reached over IPv6
+TIMEOUT = 15  # seconds, overall
+
+STATS_FILE = osp.join(xdg.xdg_cache_home, 'resolver.stats')
+STATS_FILE6 = osp.join(xdg.xdg_cache_home, 'resolver6.stats')
+MAX_FAILURES = 5  # in a row, before a source is skipped
+RETRY_AFTER = 24 * 60 * 60  # seconds, before a skipped source is tried again
+EWMA_WEIGHT = 0.3  # of the newest sample in the average latency
+
+log = logging.getLogger(__name__)
+
+
+def http_external_ip(url=HTTP_ECHO_URL, timeout=TIMEOUT):
+    """Return the external IP as echoed in plain text by a web service"""
+    res = urllib23.build_opener().open(url, timeout=timeout)
+    try:
+        data = res.read(64).strip()
+    finally:
+        res.close()
+    return data.decode('ascii') if not isinstance(data, str) else data
+
+
+def http_external_ipv6(url=HTTP_ECHO_URL6, timeout=TIMEOUT):
+    return http_external_ip(url, timeout)
+
+
+# Callables returning the external IP as a string, by name
+SOURCES = {
+    'upnp':   upnp.external_ip,
+    'natpmp': natpmp.external_ip,
+    'stun':   stun.external_ip,
+    'http':   http_external_ip,
+}
+
+# Same for the IPv6 address
+SOURCES6 = {
+    'local':  ifaddr.local_ipv6,
+    'http':   http_external_ipv6,
+}
+
+
+def valid_ip(ip):
+    try:
+        return len(ip.split('.')) == 4 and bool(socket.inet_aton(ip))
+    except (socket.error, AttributeError, TypeError, ValueError):
+        return False
+
+
+def valid_ipv6(ip):
+    try:
+        return ':' in ip and bool(socket.inet_pton(socket.AF_INET6, ip))
+    except (socket.error, AttributeError, TypeError, ValueError):
+        return False
+
+
+class Stats(object):
+    """Per-source latency and success statistics, persisted across runs"""
+    def __init__(self, path=STATS_FILE, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.sources = {}
+        if path:
+            try:
+                with open(path) as f:
+                    self.sources = json.load(f)
+            except (IOError, ValueError) as e:
+                log.debug("No usable resolver stats: %s", e)
+
+    def get(self, name):
+        return self.sources.setdefault(name, dict(successes=0, failures=0,
+                                                  failstreak=0, latency=None,
+                                                  last=0))
+
+    def record(self, name, success, latency):
+        stats = self.get(name)
+        stats['last'] = self.clock()
+        if success:
+            stats['successes'] += 1
+            stats['failstreak'] = 0
+            if stats['latency'] is None:
+                stats['latency'] = latency
+            else:
+                stats['latency'] += EWMA_WEIGHT * (latency - stats['latency'])
+        else:
+            stats['failures'] += 1
+            stats['failstreak'] += 1
+
+    def skipped(self, name):
+        """True if source keeps failing and should not be tried for a while"""
+        stats = self.get(name)
+        return (stats['failstreak'] >= MAX_FAILURES and
+                self.clock() - stats['last'] < RETRY_AFTER)
+
+    def order(self, names):
+        """Return names sorted by average latency, then unknown, then skipped
+
+        Skipped sources are only kept if all sources would be skipped.
+        """
+        def key(name):
+            latency = self.get(name)['latency']
+            return (latency is None, latency)
+
+        names = sorted(names, key=key)
+        active = [_ for _ in names if not self.skipped(_)]
+        for name in set(names) - set(active):
+            log.debug("Skipping source %s, failed %d times in a row",
+                      name, self.get(name)['failstreak'])
+        return active or names
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(self.sources, f, indent=1, sort_keys=True)
+        except IOError as e:
+            log.warning(e)
+
+
+def resolve(sources, quorum=1, timeout=TIMEOUT, stats=None, clock=time.time,
+            validate=valid_ip):
+    """Query sources concurrently, return the first IP agreed by quorum sources
+
+    sources is a dict of name: callable, or a list of names in SOURCES.
+    Answers not passing validate(ip) count as failures. Return None if no
+    address reaches the quorum within timeout seconds.
+    """
+    if not isinstance(sources, dict):
+        sources = dict((name, SOURCES[name]) for name in sources)
+    if stats is None:
+        stats = Stats()
+
+    results = queue.Queue()
+
+    def worker(name, func, start):
+        try:
+            ip = func()
+            error = None if validate(ip) else "invalid answer %r" % (ip,)
+        except Exception as e:
+            ip, error = None, e
+        results.put((name, ip, error, clock() - start))
+
+    names = stats.order(sources)
+    start = clock()
+    deadline = start + timeout
+    for name in names:
+        thread = threading.Thread(target=worker, args=(name, sources[name], start),
+                                  name="resolver-%s" % name)
+        thread.daemon = True
+        thread.start()
+
+    votes = {}
+    winner = None
+    pending = set(names)
+    while pending and not winner:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            break
+        try:
+            name, ip, error, elapsed = results.get(timeout=remaining)
+        except queue.Empty:
+            break
+        pending.discard(name)
+        stats.record(name, not error, elapsed)
+        if error:
+            log.warning("%s: %s", name, error)
+            continue
+        log.debug("%s answered %s in %.3fs", name, ip, elapsed)
+        votes.setdefault(ip, []).append(name)
+        if len(votes[ip]) >= quorum:
+            winner = ip
+
+    if not winner:
+        for name in pending:
+            log.warning("%s: timed out", name)
+            stats.record(name, False, timeout)
+    elif pending:
+        log.debug("Abandoning slower sources: %s", ", ".join(sorted(pending)))
+
+    if len(votes) > 1:
+        log.warning("Sources disagree: %s", "; ".join(
+            "%s from %s" % (ip, ", ".join(voters)) for ip, voters in votes.items()))
+
+    stats.save()
+    return winner
+
+
+def resolve6(sources, quorum=1, timeout=TIMEOUT, stats=None, clock=time.time):
+    """Like resolve(), for the IPv6 address
+
+    sources is a dict or a list of names in SOURCES6. Statistics are kept
+    apart from the IPv4 ones.
+    """
+    if not isinstance(sources, dict):
+        sources = dict((name, SOURCES6[name]) for name in sources)
+    if stats is None:
+        stats = Stats(STATS_FILE6)
+    return resolve(sources, quorum, timeout, stats, clock, validate=valid_ipv6)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# rfc2136 - DNS dynamic updates (RFC 2136) with TSIG authentication
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+DNS dynamic updates (RFC 2136) with TSIG authentication (RFC 8945)
+
+Records are updated straight at a zone's primary nameserver, no DDNS service
+involved. The current records are read from the server first, and only the
+hostnames that differ go in the update, one message per zone. Each of them
+carries a prerequisite on the records just read, so a concurrent change
+makes the server reject the update instead of being silently overwritten,
+and the update is then retried on fresh records.
+
+Results are in the DynDNS2 style of noip.update(): 'good <ip>', 'nochg <ip>',
+or an error such as 'NOTAUTH'.
+"""
+
+import hmac
+import time
+import base64
+import socket
+import struct
+import random
+import hashlib
+import logging
+
+import dnsquery
+
+
+TTL = 60  # seconds, of updated records
+FUDGE = 300  # seconds of clock skew allowed by TSIG
+ATTEMPTS = 2  # when prerequisites fail due to a concurrent change
+UDP_SIZE = 512  # bytes, larger messages go over TCP
+
+UPDATE = 5  # opcode
+TSIG = 250  # record type
+ANY, NONE = 255, 254  # classes with special meaning in updates
+
+# Response codes
+RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN',
+          4: 'NOTIMP', 5: 'REFUSED', 6: 'YXDOMAIN', 7: 'YXRRSET',
+          8: 'NXRRSET', 9: 'NOTAUTH', 10: 'NOTZONE',
+          16: 'BADSIG', 17: 'BADKEY', 18: 'BADTIME', 22: 'BADTRUNC'}
+PREREQ_FAILED = (7, 8)  # YXRRSET, NXRRSET
+
+# TSIG algorithms: name in wire format, hash
+ALGORITHM = 'hmac-sha256'
+ALGORITHMS = {
+    'hmac-md5':    ('hmac-md5.sig-alg.reg.int', hashlib.md5),
+    'hmac-sha1':   ('hmac-sha1', hashlib.sha1),
+    'hmac-sha224': ('hmac-sha224', hashlib.sha224),
+    'hmac-sha256': ('hmac-sha256', hashlib.sha256),
+    'hmac-sha384': ('hmac-sha384', hashlib.sha384),
+    'hmac-sha512': ('hmac-sha512', hashlib.sha512),
+}
+
+log = logging.getLogger(__name__)
+
+
+class UpdateError(Exception):
+    pass
+
+
+def rr(name, rtype, rclass, ttl, rdata=b''):
+    """Return a resource record in wire format"""
+    return (dnsquery.encode_name(name) +
+            struct.pack('!HHLH', rtype, rclass, ttl, len(rdata)) + rdata)
+
+
+def address_rdata(ip):
+    if ':' in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return socket.inet_aton(ip)
+
+
+class Key(object):
+    """TSIG key, secret in base64 as in BIND's and Knot's key files"""
+    def __init__(self, name, secret, algorithm=ALGORITHM, clock=time.time):
+        if algorithm not in ALGORITHMS:
+            raise UpdateError("Unknown TSIG algorithm: %s" % algorithm)
+        self.name = name.lower().strip('.')
+        self.secret = base64.b64decode(secret)
+        self.algorithm, self.digest = ALGORITHMS[algorithm]
+        self.clock = clock
+
+    def variables(self, signed, fudge=FUDGE, error=0, other=b''):
+        """TSIG variables covered by the MAC, in wire format"""
+        return (dnsquery.encode_name(self.name) + struct.pack('!HL', ANY, 0) +
+                dnsquery.encode_name(self.algorithm) +
+                struct.pack('!HLHHH', signed >> 32, signed & 0xFFFFFFFF, fudge,
+                            error, len(other)) + other)
+
+    def mac(self, data):
+        return hmac.new(self.secret, data, self.digest).digest()
+
+    def sign(self, message):
+        """Return (message with a TSIG record appended, its MAC)"""
+        signed = int(self.clock())
+        mac = self.mac(message + self.variables(signed))
+        qid = struct.unpack('!H', message[:2])[0]
+        arcount = struct.unpack('!H', message[10:12])[0]
+        rdata = (dnsquery.encode_name(self.algorithm) +
+                 struct.pack('!HLHH', signed >> 32, signed & 0xFFFFFFFF, FUDGE, len(mac)) +
+                 mac + struct.pack('!HHH', qid, 0, 0))
+        return (message[:10] + struct.pack('!H', arcount + 1) + message[12:] +
+                rr(self.name, TSIG, ANY, 0, rdata)), mac
+
+    def verify(self, reply, request_mac):
+        """Check the TSIG record of a reply to a request signed with request_mac
+
+        Return the TSIG error code, raise UpdateError if the reply is not
+        properly signed.
+        """
+        start = tsig_offset(reply)
+        if start is None:
+            raise UpdateError("Reply is not signed")
+        name, pos = dnsquery.decode_name(reply, start)
+        pos += 10  # type, class, ttl, rdlength
+        algorithm, pos = dnsquery.decode_name(reply, pos)
+        high, low, fudge, size = struct.unpack('!HLHH', reply[pos:pos + 10])
+        pos += 10
+        mac = reply[pos:pos + size]
+        pos += size
+        qid, error, otherlen = struct.unpack('!HHH', reply[pos:pos + 6])
+        other = reply[pos + 6:pos + 6 + otherlen]
+
+        if name != self.name or algorithm != self.algorithm:
+            raise UpdateError("Reply signed with another key")
+        if error in (16, 17):  # BADSIG, BADKEY: reply is not signed
+            return error
+        arcount = struct.unpack('!H', reply[10:12])[0]
+        unsigned = (struct.pack('!H', qid) + reply[2:10] +
+                    struct.pack('!H', arcount - 1) + reply[12:start])
+        expected = self.mac(struct.pack('!H', len(request_mac)) + request_mac +
+                            unsigned + self.variables((high << 32) + low, fudge,
+                                                      error, other))
+        if not hmac.compare_digest(mac, expected):
+            raise UpdateError("Invalid reply signature")
+        return error
+
+
+def tsig_offset(data):
+    """Return the offset of the TSIG record, the last one of a message, or None"""
+    counts = struct.unpack('!HHHH', data[4:12])
+    if not counts[3]:
+        return None
+    pos = 12
+    for _ in range(counts[0]):
+        pos = dnsquery.decode_name(data, pos)[1] + 4
+    start = None
+    for _ in range(sum(counts[1:])):
+        start = pos
+        pos = dnsquery.decode_name(data, pos)[1]
+        rtype, _, _, length = struct.unpack('!HHLH', data[pos:pos + 10])
+        pos += 10 + length
+    return start if rtype == TSIG else None
+
+
+def build_update(qid, zone, changes, ttl=TTL):
+    """Return an UPDATE message for zone
+
+    changes is a list of (hostname, rtype, current records, new address).
+    Each change requires the current records to still be exactly the same,
+    or to not exist if empty, and replaces them with the new address.
+    """
+    prereqs = []
+    updates = []
+    for hostname, rtype, current, ip in changes:
+        if current:
+            prereqs.extend(rr(hostname, rtype, dnsquery.IN, 0, address_rdata(_))
+                           for _ in current)
+        else:
+            prereqs.append(rr(hostname, rtype, NONE, 0))
+        updates.append(rr(hostname, rtype, ANY, 0))
+        updates.append(rr(hostname, rtype, dnsquery.IN, ttl, address_rdata(ip)))
+
+    return (struct.pack('!HHHHHH', qid, UPDATE << 11, 1, len(prereqs), len(updates), 0) +
+            dnsquery.encode_name(zone) + struct.pack('!HH', dnsquery.SOA, dnsquery.IN) +
+            b''.join(prereqs) + b''.join(updates))
+
+
+def send(server, message, timeout=dnsquery.TIMEOUT):
+    """Send message over UDP, or TCP if too large or truncated, return the reply"""
+    if len(message) > UDP_SIZE:
+        return dnsquery.send_tcp(server, message, timeout)
+    reply = dnsquery.send_udp(server, message, timeout)
+    if struct.unpack('!H', reply[2:4])[0] & 0x0200:  # TC
+        reply = dnsquery.send_tcp(server, message, timeout)
+    return reply
+
+
+def query(server, hostnames, rtype, timeout=dnsquery.TIMEOUT):
+    """Ask server for rtype records of all hostnames at once
+
+    Return a dict of hostname: parsed message. Raise UpdateError if any is
+    unanswered.
+    """
+    messages = dnsquery.query_many([(server, _, rtype) for _ in hostnames],
+                                   timeout, recurse=False)
+    missing = [h for h, m in zip(hostnames, messages) if m is None]
+    if missing:
+        raise UpdateError("No answer from %s for %s" % (server[0], ", ".join(missing)))
+    return dict(zip(hostnames, messages))
+
+
+def zones(server, hostnames, timeout=dnsquery.TIMEOUT):
+    """Return a dict of hostname: zone, as told by the SOA records at server
+
+    Hostnames the server is not authoritative for map to None.
+    """
+    result = {}
+    for hostname, message in query(server, hostnames, dnsquery.SOA, timeout).items():
+        soa = [r[0] for r in message['answer'] + message['authority']
+               if r[1] == dnsquery.SOA]
+        result[hostname] = soa[0] if soa and message['flags'] & 0x0400 else None  # AA
+    return result
+
+
+def current(server, hostnames, rtype, timeout=dnsquery.TIMEOUT):
+    """Return a dict of hostname: sorted list of its rtype records at server"""
+    return dict((hostname, sorted(set(r[3] for r in message['answer'] if r[1] == rtype)))
+                for hostname, message in query(server, hostnames, rtype, timeout).items())
+
+
+def update(server, hostnames, ip, key=None, zone=None, ttl=TTL,
+           timeout=dnsquery.TIMEOUT, ip6=None):
+    """Update the A records of hostnames at server to ip, and AAAA to ip6
+
+    Either address may be None to leave those records alone. server is an
+    (address, port) tuple and key a Key, or None for unsigned updates.
+    Hostnames are grouped by zone, found at the server unless given, and
+    each zone is updated in a single message, both record types included.
+    Return a list of (hostname, result), in the same order.
+    """
+    hostnames = [_.lower().strip('.') for _ in hostnames]
+    addresses = [(rtype, address) for rtype, address in ((dnsquery.A, ip),
+                                                         (dnsquery.AAAA, ip6))
+                 if address]
+    if zone:
+        zone = zone.lower().strip('.')
+        found = dict((_, zone if _ == zone or _.endswith('.' + zone) else None)
+                     for _ in hostnames)
+    else:
+        found = zones(server, hostnames, timeout)
+
+    results = {}
+    byzone = {}
+    for hostname in hostnames:
+        if found[hostname]:
+            byzone.setdefault(found[hostname], []).append(hostname)
+        else:
+            results[hostname] = 'NOTZONE'
+
+    for zone, names in sorted(byzone.items()):
+        results.update(update_zone(server, zone, names, addresses, key, ttl, timeout))
+
+    return [(hostname, results[hostname]) for hostname in hostnames]
+
+
+def update_zone(server, zone, hostnames, addresses, key, ttl, timeout):
+    """Update hostnames of a single zone to the (rtype, address) in addresses
+
+    Return a dict of hostname: result.
+    """
+    text = ",".join(address for _, address in addresses)
+    results = {}
+    for attempt in range(ATTEMPTS):
+        changes = []
+        for rtype, address in addresses:
+            records = current(server, hostnames, rtype, timeout)
+            changes.extend((hostname, rtype, records[hostname], address)
+                           for hostname in hostnames
+                           if records[hostname] != [address])
+        changed = set(_[0] for _ in changes)
+        for hostname in hostnames:
+            if hostname not in changed:
+                results[hostname] = 'nochg %s' % text
+        if not changes:
+            break
+
+        qid = random.randint(0, 0xFFFF)
+        message = build_update(qid, zone, changes, ttl)
+        mac = None
+        if key:
+            message, mac = key.sign(message)
+        log.debug("Updating %s in zone %s at %s", ", ".join(sorted(changed)),
+                  zone, server[0])
+        reply = send(server, message, timeout)
+
+        rcode = struct.unpack('!H', reply[2:4])[0] & 0xF
+        # Servers may reject with an unsigned reply, such as REFUSED
+        if key and not (rcode and tsig_offset(reply) is None):
+            rcode = key.verify(reply, mac) or rcode
+        if rcode in PREREQ_FAILED and attempt < ATTEMPTS - 1:
+            log.debug("Records in zone %s changed meanwhile, retrying", zone)
+            continue
+
+        status = 'good %s' % text if rcode == 0 else RCODES.get(rcode, 'rcode %d' % rcode)
+        for hostname in changed:
+            results[hostname] = status
+        break
+    return results
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# scheduler - Adaptive polling scheduler
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Adaptive polling scheduler
+
+Poll at the minimum interval right after a change or a failure, and back off
+exponentially up to the maximum interval while nothing changes. A random
+jitter avoids a fleet of hosts polling in lockstep.
+
+Clock, sleep and random functions are injectable, so the schedule can be
+driven by a fake clock. sleep(seconds) must return True if woken up early.
+"""
+
+import time
+import random
+import threading
+
+
+class Scheduler(object):
+    def __init__(self, minimum=30, maximum=1800, factor=2, jitter=0.1,
+                 clock=time.time, rand=random.random, sleep=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.clock = clock
+        self.rand = rand
+        self.interval = minimum
+        self.due = clock()
+        self.wakeup = threading.Event()
+        self.sleep = sleep or self.wakeup.wait
+
+    def record(self, changed=False, failed=False):
+        """Schedule the next poll according to the outcome of the last one"""
+        if changed or failed:
+            self.interval = self.minimum
+        else:
+            self.interval = min(self.interval * self.factor, self.maximum)
+        jitter = self.jitter * (2 * self.rand() - 1)
+        self.due = self.clock() + self.interval * (1 + jitter)
+        return self.due
+
+    def wake(self):
+        """Make a pending wait() return right away, for example from a signal handler"""
+        self.wakeup.set()
+
+    def wait(self):
+        """Wait until the next poll is due, or wake() is called
+
+        Return True if woken up early.
+        """
+        woken = self.sleep(max(self.due - self.clock(), 0))
+        self.wakeup.clear()
+        return bool(woken)
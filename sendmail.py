@@ -18,23 +18,61 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program. See <http://www.gnu.org/licenses/gpl.html>
 
+import os
 import os.path as osp
 import smtplib
 import ConfigParser
 import StringIO
 import socket
 import logging
+import threading
+import atexit
+import base64
+import binascii
+import zlib
+import email.header
+import email.utils
 
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from email.mime.text import MIMEText
 
+CHUNK_SIZE = 64 * 1024  # bytes read, and sent, at a time
+TIMEOUT = 30  # seconds, to connect and for each read or write
+CRLF = '\r\n'
 
 log = logging.getLogger(__name__)
 
 
-# TODO: make this a class with all attributes with default values
-def ssmtp_config():
+class TracingMixin:
+    """Log the SMTP dialog to the module logger
+
+    Unlike smtplib's debuglevel, which prints to the module-wide stderr,
+    this is safe with concurrent sessions in several threads.
+    """
+    trace = False
+
+    def send(self, str):
+        if self.trace:
+            log.debug("send: %r", str)
+        smtplib.SMTP.send(self, str)
+
+    def getreply(self):
+        code, msg = smtplib.SMTP.getreply(self)
+        if self.trace:
+            log.debug("reply: %d %r", code, msg)
+        return code, msg
+
+
+class SMTP(TracingMixin, smtplib.SMTP):
+    pass
+
+
+class SMTP_SSL(TracingMixin, smtplib.SMTP_SSL):
+    pass
+
+
+CONFIG_FILES = ('/etc/ssmtp/ssmtp.conf', '~/.config/ssmtp/ssmtp.conf')
+
+
+def ssmtp_config(files=CONFIG_FILES):
     def addsection(filename):
         config = StringIO.StringIO()
         config.write('[default]\n')
@@ -48,8 +86,8 @@ def ssmtp_config():
 
     cp = ConfigParser.ConfigParser()
     # For Python 3, use cp.read_string() and modify addsection() accordingly
-    cp.readfp(addsection('/etc/ssmtp/ssmtp.conf'))
-    cp.readfp(addsection(osp.expanduser('~/.config/ssmtp/ssmtp.conf')))
+    for filename in files:
+        cp.readfp(addsection(osp.expanduser(filename)))
 
     config = {}
     for item in cp.items('default'):
@@ -58,79 +96,344 @@ def ssmtp_config():
     return config
 
 
-def sendmail(sender, recipients, subject="", text="", attachments=[],
-             debug=False):
+class Attachment(object):
+    """A file to attach, optionally only its last tail bytes, or gzipped
 
-    # read and handle ssmtp's settings
-    # TODO: add **kwargs to override ssmtp settings
-    # TODO: emulate the heuristics of RewriteDomain, FromLineOverride, etc
-    ssmtp = ssmtp_config()
-    mailhub  = ssmtp.get('mailhub', 'localhost')
-    usetls   = ssmtp.get('usetls', 'no').lower() == 'yes'
-    hostname = ssmtp.get('hostname', socket.gethostname())
-    authuser = ssmtp.get('authuser', '')
-    authpass = ssmtp.get('authpass', '')
+    The tail starts at a line boundary, so it suits log files. Files are
+    read in chunks as the message is sent, never whole.
+    """
+    def __init__(self, path, tail=None, compress=False, name=None):
+        self.path = path
+        self.tail = tail
+        self.compress = compress
+        self.name = (name or osp.basename(path)) + ('.gz' if compress else '')
+        self.ctype = 'application/gzip' if compress else 'application/octet-stream'
+
+    def __repr__(self):
+        return "<Attachment %s>" % self.path
+
+    def open(self):
+        """Open the file, positioned at the start of the tail if any
 
+        Return (file, bytes skipped).
+        """
+        fp = open(self.path, 'rb')
+        size = os.fstat(fp.fileno()).st_size
+        if not self.tail or size <= self.tail:
+            return fp, 0
+        fp.seek(size - self.tail)
+        fp.readline()  # partial line
+        return fp, fp.tell()
+
+    def chunks(self, fp, skipped=0):
+        """Yield the content read from fp, compressed if so requested"""
+        compressor = self.compress and zlib.compressobj(9, zlib.DEFLATED,
+                                                        16 + zlib.MAX_WBITS)
+        if skipped:
+            note = "[... %d bytes skipped ...]\n" % skipped
+            yield compressor.compress(note) if compressor else note
+        while True:
+            data = fp.read(CHUNK_SIZE)
+            if not data:
+                break
+            yield compressor.compress(data) if compressor else data
+        if compressor:
+            yield compressor.flush()
+
+
+def base64_lines(chunks):
+    """Yield base64 encoded lines of up to 76 characters, as MIME requires"""
+    buf = b''
+    for chunk in chunks:
+        buf += chunk
+        size = len(buf) - len(buf) % 57
+        for i in range(0, size, 57):
+            yield base64.b64encode(buf[i:i + 57]) + CRLF
+        buf = buf[size:]
+    if buf:
+        yield base64.b64encode(buf) + CRLF
+
+
+def text_lines(text):
+    """Yield text as CRLF terminated lines, UTF-8 encoded"""
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    for line in text.splitlines():
+        yield line + CRLF
+
+
+def message(sender, recipients, subject="", text="", attachments=[],
+            hostname=None):
+    """Return (sender, recipients, message chunks) ready for SMTP
+
+    Message chunks are an iterator of CRLF terminated lines, generated as
+    they are consumed, so attachments of any size are never fully in
+    memory. Attachments are file paths or Attachment, and are all opened
+    right away, so a missing one fails before sending anything. A sender
+    without domain gets hostname's, by default the local one.
+    """
     # handle arguments
-    if isinstance(attachments, basestring):
+    if isinstance(attachments, (basestring, Attachment)):
         attachments = [attachments]
 
     if isinstance(recipients, basestring):
         recipients = [recipients]
 
     if not len(sender.split('@', 1)) == 2:
-        sender = "%s@%s" % (sender, hostname)
-
-    # Create the container (outer) email message.
-    msg = MIMEMultipart()
-    msg['From']    = sender
-    msg['To']      = ', '.join(recipients)
-    msg['Subject'] = subject
-
-    # Add body
-    msg.attach(MIMEText(text))
-
-    # Add attachments
-    for attachment in attachments:
-        with open(attachment) as fp:
-            part = MIMEApplication(fp.read())
-            part.add_header('Content-Disposition', 'attachment',
-                              filename=osp.basename(attachment))
-            msg.attach(part)
-
-    if usetls:
-        smtp = smtplib.SMTP_SSL()
-    else:
-        smtp = smtplib.SMTP()
-
-    if debug:
-        # Redirect stderr so smtplib's debug data gets properly logged
-        logging.basicConfig(level=logging.DEBUG)
-        stderr_ = smtplib.stderr
-        stream = StringIO.StringIO()
-        smtplib.stderr = stream
-        smtp.set_debuglevel(1)
+        sender = "%s@%s" % (sender, hostname or socket.gethostname())
 
+    attachments = [_ if isinstance(_, Attachment) else Attachment(_)
+                   for _ in attachments]
+    files = []
     try:
-        # Connect
-        smtp.connect(mailhub)
-        # Authenticate
-        if authuser and authpass:
-            smtp.login(authuser, authpass)
-        # Send
-        smtp.sendmail(sender, recipients, msg.as_string())
-    finally:
+        for attachment in attachments:
+            files.append(attachment.open())
+    except IOError:
+        for fp, _ in files:
+            fp.close()
+        raise
+
+    def lines():
+        boundary = "===============%s==" % binascii.hexlify(os.urandom(12))
+        try:
+            # Container (outer) email message
+            yield "From: %s%s" % (sender, CRLF)
+            yield "To: %s%s" % (', '.join(recipients), CRLF)
+            yield "Subject: %s%s" % (email.header.Header(subject, 'utf-8').encode()
+                                     if isinstance(subject, unicode) else subject, CRLF)
+            yield "Date: %s%s" % (email.utils.formatdate(localtime=True), CRLF)
+            yield "MIME-Version: 1.0" + CRLF
+            yield 'Content-Type: multipart/mixed; boundary="%s"%s' % (boundary, CRLF)
+            yield CRLF
+
+            # Body
+            body = list(text_lines(text))
+            ascii = all(ord(c) < 128 for line in body for c in line)
+            yield "--%s%s" % (boundary, CRLF)
+            yield 'Content-Type: text/plain; charset="%s"%s' % (
+                'us-ascii' if ascii else 'utf-8', CRLF)
+            yield "Content-Transfer-Encoding: %s%s" % (
+                '7bit' if ascii else 'base64', CRLF)
+            yield CRLF
+            for line in (body if ascii else base64_lines(body)):
+                yield line
+
+            # Attachments
+            for attachment, (fp, skipped) in zip(attachments, files):
+                yield "--%s%s" % (boundary, CRLF)
+                yield "Content-Type: %s%s" % (attachment.ctype, CRLF)
+                yield "Content-Transfer-Encoding: base64" + CRLF
+                yield 'Content-Disposition: attachment; filename="%s"%s' % (
+                    attachment.name, CRLF)
+                yield CRLF
+                for line in base64_lines(attachment.chunks(fp, skipped)):
+                    yield line
+            yield "--%s--%s" % (boundary, CRLF)
+        finally:
+            for fp, _ in files:
+                fp.close()
+
+    return sender, recipients, lines()
+
+
+class Mailer(object):
+    """Send email using ssmtp's settings over a persistent SMTP session
+
+    The settings are read again only when a config file changes, and the
+    authenticated connection is kept open across messages. It is checked
+    with NOOP before use, and reopened if the server has closed it.
+    Thread-safe: messages are sent one at a time.
+    """
+    def __init__(self, files=CONFIG_FILES, debug=False, timeout=TIMEOUT):
+        self.files = [osp.expanduser(_) for _ in files]
+        self.debug = debug
+        self.timeout = timeout
+        self._config = None
+        self._mtimes = None
+        self._smtp = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def config(self):
+        """ssmtp's settings, parsed again if any config file changed"""
+        mtimes = []
+        for filename in self.files:
+            try:
+                mtimes.append(os.stat(filename).st_mtime)
+            except OSError:
+                mtimes.append(None)
+        if mtimes != self._mtimes:
+            if self._mtimes is not None:
+                log.debug("ssmtp config changed, reloading")
+                self.close()
+            self._config = ssmtp_config(self.files)
+            self._mtimes = mtimes
+        return self._config
+
+    def connect(self):
+        # TODO: emulate the heuristics of RewriteDomain, FromLineOverride, etc
+        config = self.config
+        mailhub  = config.get('mailhub', 'localhost')
+        usetls   = config.get('usetls', 'no').lower() == 'yes'
+        authuser = config.get('authuser', '')
+        authpass = config.get('authpass', '')
+
+        if usetls:
+            smtp = SMTP_SSL(timeout=self.timeout)
+        else:
+            smtp = SMTP(timeout=self.timeout)
+        smtp.trace = self.debug
+
         try:
-            smtp.quit()
-        except smtplib.SMTPException as e:
-            log.warn(e)
-        if debug:
-            # Restore stderr and log output, if any
-            smtplib.stderr = stderr_
-            output = stream.getvalue().strip()
-            if output:
-                for line in output.split('\n'):
-                    log.debug(line)
+            # Connect
+            smtp.connect(mailhub)
+            # Authenticate
+            if authuser and authpass:
+                smtp.login(authuser, authpass)
+        except:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        return smtp
+
+    def session(self):
+        """Return the open SMTP session, connecting if needed"""
+        self.config  # closes a session with outdated settings
+        if self._smtp:
+            self._smtp.trace = self.debug
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, socket.error) as e:
+                log.debug("SMTP session lost: %s", e)
+            self._smtp.close()
+            self._smtp = None
+        return self.connect()
+
+    def close(self):
+        with self._lock:
+            if not self._smtp:
+                return
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, socket.error) as e:
+                log.warn(e)
+                self._smtp.close()
+            self._smtp = None
+
+    def deliver(self, sender, recipients, lines):
+        """Send a message, given as an iterable of CRLF terminated lines
+
+        Lines are dot-stuffed and streamed to the server in chunks. If the
+        session turns out dropped before the message data is sent, it is
+        reopened and the message sent again. Return smtplib's dict of
+        refused recipients.
+        """
+        with self._lock:
+            smtp = self.session()
+            try:
+                return self._transaction(smtp, sender, recipients, lines)
+            except (smtplib.SMTPServerDisconnected, socket.error) as e:
+                smtp.close()
+                self._smtp = None
+                if getattr(e, 'streaming', False):
+                    raise
+                # Closed between NOOP and sending
+                log.debug("SMTP session lost, reconnecting: %s", e)
+                return self._transaction(self.session(), sender, recipients, lines)
+
+    def _transaction(self, smtp, sender, recipients, lines):
+        """Like smtplib's sendmail(), but streaming the message data"""
+        smtp.ehlo_or_helo_if_needed()
+        code, resp = smtp.mail(sender)
+        if code != 250:
+            smtp.rset()
+            raise smtplib.SMTPSenderRefused(code, resp, sender)
+        refused = {}
+        for recipient in recipients:
+            code, resp = smtp.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, resp)
+        if len(refused) == len(recipients):
+            smtp.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, resp = smtp.docmd('data')
+        if code != 354:
+            smtp.rset()
+            raise smtplib.SMTPDataError(code, resp)
+        try:
+            size = 0
+            chunk = []
+            for line in lines:
+                if line.startswith('.'):
+                    line = '.' + line
+                chunk.append(line)
+                size += len(line)
+                if size >= CHUNK_SIZE:
+                    smtplib.SMTP.send(smtp, ''.join(chunk))  # untraced
+                    size, chunk = 0, []
+            chunk.append('.' + CRLF)
+            smtplib.SMTP.send(smtp, ''.join(chunk))
+        except (smtplib.SMTPServerDisconnected, socket.error) as e:
+            e.streaming = True
+            raise
+        code, resp = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
+    def send(self, sender, recipients, subject="", text="", attachments=[]):
+        """Send a message, return smtplib's dict of refused recipients"""
+        hostname = self.config.get('hostname', socket.gethostname())
+        return self.deliver(*message(sender, recipients, subject, text,
+                                     attachments, hostname))
+
+    def send_many(self, messages):
+        """Send (sender, recipients, subject, text, attachments) messages
+
+        All are sent over the same session. Return a list with, for each
+        message, the exception it failed with, or None, in the same order.
+        """
+        errors = []
+        with self._lock:
+            for args in messages:
+                try:
+                    self.send(*args)
+                    errors.append(None)
+                except (smtplib.SMTPException, socket.error, IOError) as e:
+                    log.warn("Could not send to %s: %s", args[1], e)
+                    errors.append(e)
+        return errors
+
+
+mailer = None  # Shared Mailer of sendmail(), see default_mailer()
+
+
+def default_mailer():
+    """Return the Mailer shared by sendmail() calls, closed at exit"""
+    global mailer
+    if mailer is None:
+        mailer = Mailer()
+        atexit.register(mailer.close)
+    return mailer
+
+
+def sendmail(sender, recipients, subject="", text="", attachments=[],
+             debug=False):
+    """Send a message using ssmtp's settings, over a persistent session"""
+    # TODO: add **kwargs to override ssmtp settings
+    mailer = default_mailer()
+    if debug:
+        logging.basicConfig(level=logging.DEBUG)
+    mailer.debug = debug
+    mailer.send(sender, recipients, subject, text, attachments)
 
 
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ssdp - Targeted SSDP discovery of UPnP Internet Gateway Devices
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Targeted SSDP discovery of UPnP Internet Gateway Devices
+
+Instead of an 'ssdp:all' search, which every media server, printer and TV on
+the LAN answers, send one M-SEARCH per WAN*Connection service type and
+return as soon as the first usable answer arrives.
+"""
+
+import socket
+import time
+
+
+MCAST_ADDR = ("239.255.255.250", 1900)
+
+RCVBUF = 1024 * 1024
+
+# In order of preference
+WAN_SERVICES = (
+    "urn:schemas-upnp-org:service:WANIPConnection:2",
+    "urn:schemas-upnp-org:service:WANIPConnection:1",
+    "urn:schemas-upnp-org:service:WANPPPConnection:1",
+)
+
+
+def msearch(st, mx=2, addr=MCAST_ADDR):
+    """Return an M-SEARCH request datagram for search target st"""
+    return ('M-SEARCH * HTTP/1.1\r\n'
+            'HOST: %s:%d\r\n'
+            'MAN: "ssdp:discover"\r\n'
+            'MX: %d\r\n'
+            'ST: %s\r\n'
+            '\r\n' % (addr[0], addr[1], mx, st)).encode('ascii')
+
+
+def parse_headers(data):
+    """Parse an SSDP response datagram into a dict of lowercase header names
+
+    Return None if data is not a successful HTTP response.
+    """
+    if not isinstance(data, str):
+        data = data.decode('latin-1')  # Python 3
+
+    lines = data.splitlines()
+    if not lines:
+        return None
+
+    status = lines[0].split(None, 2)
+    if len(status) < 2 or not status[0].upper().startswith('HTTP/') or status[1] != '200':
+        return None
+
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    return headers
+
+
+def discover(services=WAN_SERVICES, mx=2, timeout=5, addr=MCAST_ADDR):
+    """Return the headers of the first response for one of services, or None
+
+    One M-SEARCH is sent per service type, with MX set to mx seconds.
+    Responses are read until a matching one with a Location arrives or
+    timeout seconds have passed since the search was sent, whichever comes
+    first. addr may be overridden to query a single host via unicast.
+    """
+    deadline = time.time() + timeout
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        # Room for bursts of unrelated replies on busy LANs
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+        for st in services:
+            sock.sendto(msearch(st, mx, addr), addr)
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(2048)
+            except socket.timeout:
+                return None
+
+            headers = parse_headers(data)
+            if headers and headers.get('st') in services and headers.get('location'):
+                return headers
+    finally:
+        sock.close()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#
+# ssdp3 - Asyncio SSDP discovery of UPnP gateways on all interfaces
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Asyncio SSDP discovery of UPnP Internet Gateway Devices on all interfaces
+
+Multi-homed hosts only see the gateway reached by the default multicast
+route when using a single unbound socket. Here an M-SEARCH is sent from every
+local IPv4 interface at once, and all answers are gathered within a single
+deadline, so a multi-WAN box is fully scanned in one timeout window.
+"""
+
+import sys
+import socket
+import struct
+import asyncio
+import logging
+import collections
+
+import ssdp
+
+
+SIOCGIFADDR = 0x8915  # Linux
+
+MAX_RESPONSES = 32  # Against floods of distinct, if valid, answers
+
+log = logging.getLogger(__name__)
+
+Response = collections.namedtuple('Response', 'interface address headers elapsed')
+Response.__doc__ = """SSDP answer from gateway address received on interface,
+elapsed seconds after the searches were sent"""
+
+
+def local_interfaces():
+    """Return a list of (name, IPv4 address) of non-loopback local interfaces
+
+    Only the primary address of each interface is listed. Where interfaces
+    can't be enumerated, return the wildcard address, so the default
+    multicast route is still used.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        return [('', '0.0.0.0')]
+
+    interfaces = []
+    for _, name in socket.if_nameindex():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            packed = fcntl.ioctl(sock.fileno(), SIOCGIFADDR,
+                                 struct.pack('256s', name[:15].encode()))
+        except OSError:  # No IPv4 address
+            continue
+        finally:
+            sock.close()
+        address = socket.inet_ntoa(packed[20:24])
+        if not address.startswith('127.'):
+            interfaces.append((name, address))
+
+    return interfaces or [('', '0.0.0.0')]
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, interface, services, results, done, start, wanted, limit):
+        self.interface = interface
+        self.services  = services
+        self.results   = results
+        self.done      = done
+        self.start     = start
+        self.wanted    = wanted
+        self.limit     = limit
+        self.seen      = set()
+
+    def datagram_received(self, data, addr):
+        if len(self.results) >= self.limit:
+            return
+        headers = ssdp.parse_headers(data)
+        if not (headers and headers.get('st') in self.services and headers.get('location')):
+            return
+        key = (headers['location'], headers['st'])
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        elapsed = asyncio.get_running_loop().time() - self.start
+        self.results.append(Response(self.interface, addr[0], headers, elapsed))
+        if len(self.results) >= self.wanted:
+            self.done.set()
+
+    def error_received(self, exc):
+        log.debug("SSDP error on %s: %s", self.interface, exc)
+
+
+async def discover_all(services=ssdp.WAN_SERVICES, mx=2, timeout=5,
+                       interfaces=None, first=False, addr=ssdp.MCAST_ADDR,
+                       limit=MAX_RESPONSES):
+    """Search for services on all interfaces, return a list of Response
+
+    Responses are in order of arrival, so the first one tells which
+    interface and gateway answered first. Repeated answers, same location
+    and service, are dropped. Gathering stops after timeout seconds, once
+    limit responses arrived, or at the first one if first is True.
+    interfaces is a list of (name, address), by default all from
+    local_interfaces().
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = []
+    done = asyncio.Event()
+    wanted = 1 if first else limit
+    transports = []
+
+    try:
+        for name, address in (interfaces or local_interfaces()):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                socket.inet_aton(address))
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ssdp.RCVBUF)
+                sock.bind((address, 0))
+                sock.setblocking(False)
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _Protocol(name, services, results, done, start,
+                                      wanted, limit),
+                    sock=sock)
+            except OSError as e:
+                log.warning("Skipping interface %s (%s): %s", name, address, e)
+                sock.close()
+                continue
+            transports.append(transport)
+            for st in services:
+                transport.sendto(ssdp.msearch(st, mx, addr), addr)
+
+        remaining = timeout - (loop.time() - start)
+        try:
+            await asyncio.wait_for(done.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        for transport in transports:
+            transport.close()
+
+    return results
+
+
+def discover(*args, **kwargs):
+    """Synchronous wrapper for discover_all()"""
+    return asyncio.run(discover_all(*args, **kwargs))
+
+
+USAGE = """Find UPnP gateways on all local interfaces via SSDP
+Usage: python3 ssdp3.py
+"""
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(USAGE)
+        sys.exit()
+
+    responses = discover()
+    if not responses:
+        print("No UPnP gateway found")
+        sys.exit(1)
+
+    for response in responses:
+        print(f"{response.elapsed:6.3f}s\t{response.interface}\t{response.address}"
+              f"\t{response.headers['st']}\t{response.headers['location']}")
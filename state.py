@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# state - Transactional store of IP history and per-target sync status
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Transactional state store for external IP history and per-target sync status
+
+Backed by SQLite in WAL mode, so every write is atomic and survives crashes.
+Besides the IP history, it records the last IP each target (a DDNS provider
+or notifier) was successfully synced to, so a run only redoes the actions
+that are actually out of date, and failed ones heal on their own later.
+
+Failed actions also go to an outbox, where they are retried with
+exponential backoff and jitter instead of on every single run.
+
+Observed IPs can be debounced, so a new IP only counts once it has been
+stable for a while, and link flaps are reported as a single change.
+"""
+
+import time
+import random
+import sqlite3
+import logging
+
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS history (
+        time    REAL NOT NULL,
+        ip      TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sync (
+        target  TEXT PRIMARY KEY,
+        ip      TEXT NOT NULL,
+        time    REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS observed (
+        time    REAL NOT NULL,
+        ip      TEXT NOT NULL,
+        polls   INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS outbox (
+        target  TEXT PRIMARY KEY,
+        ip      TEXT NOT NULL,
+        created REAL NOT NULL,
+        attempts INTEGER NOT NULL,
+        due     REAL NOT NULL,
+        error   TEXT
+    );
+"""
+
+RETRY_MIN = 60  # seconds, after the first failure
+RETRY_MAX = 6 * 60 * 60  # seconds
+RETRY_JITTER = 0.2  # fraction of the delay, either way
+OUTBOX_SIZE = 100  # entries
+
+
+class State(object):
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.outbox = Outbox(self.db, clock)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def current(self):
+        """Return the latest IP in history, or None"""
+        row = self.db.execute(
+            "SELECT ip FROM history ORDER BY rowid DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def history(self, limit=None):
+        """Return a list of (time, ip), newest first"""
+        return self.db.execute(
+            "SELECT time, ip FROM history ORDER BY rowid DESC LIMIT ?",
+            (-1 if limit is None else limit,)).fetchall()
+
+    def record(self, ip):
+        """Append ip to history if it differs from the current one
+
+        Return True if it was appended.
+        """
+        with self.db:
+            if self.current() == ip:
+                return False
+            self.db.execute("INSERT INTO history (time, ip) VALUES (?, ?)",
+                            (self.clock(), ip))
+        return True
+
+    def observe(self, ip, settle_time=0, settle_polls=0):
+        """Debounce an observed IP, return the sequence of IPs once it settles
+
+        ip settles once it has been observed for settle_time seconds or in
+        settle_polls consecutive observations, whichever comes first. With
+        neither set, it settles right away. Return the list of all IPs
+        observed since the previous one settled, ending with ip, or None if
+        ip has not settled yet. The current IP, when nothing else was
+        observed in between, is always settled.
+        """
+        now = self.clock()
+        with self.db:
+            rows = self.db.execute("SELECT rowid, time, ip, polls FROM observed"
+                                   " ORDER BY rowid").fetchall()
+            if not rows and ip == self.current():
+                return [ip]
+
+            if rows and rows[-1][2] == ip:
+                rowid, since, _, polls = rows[-1]
+                polls += 1
+                self.db.execute("UPDATE observed SET polls = ? WHERE rowid = ?",
+                                (polls, rowid))
+            else:
+                since, polls = now, 1
+                self.db.execute("INSERT INTO observed (time, ip, polls)"
+                                " VALUES (?, ?, ?)", (since, ip, polls))
+                rows.append((None, since, ip, polls))
+
+            settled = (not (settle_time or settle_polls) or
+                       (settle_time  and now - since >= settle_time) or
+                       (settle_polls and polls >= settle_polls))
+            if not settled:
+                return None
+
+            self.db.execute("DELETE FROM observed")
+        return [row[2] for row in rows]
+
+    def synced(self, target):
+        """Return the IP target was last successfully synced to, or None"""
+        row = self.db.execute("SELECT ip FROM sync WHERE target = ?",
+                              (target,)).fetchone()
+        return row[0] if row else None
+
+    def mark_synced(self, target, ip):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO sync (target, ip, time)"
+                            " VALUES (?, ?, ?)", (target, ip, self.clock()))
+
+    def outdated(self, targets, ip):
+        """Return the targets not yet synced to ip, in the same order"""
+        return [target for target in targets if self.synced(target) != ip]
+
+
+class Outbox(object):
+    """Durable queue of failed actions, one entry per target
+
+    A newer IP for the same target replaces the older entry, and restarts
+    its backoff. When full, the oldest entries are dropped.
+    """
+    def __init__(self, db, clock=time.time, rand=random.random,
+                 size=OUTBOX_SIZE):
+        self.db = db
+        self.clock = clock
+        self.rand = rand
+        self.size = size
+
+    def add(self, target, ip, error=None):
+        """Queue a failed action for target, return when it is due again"""
+        now = self.clock()
+        with self.db:
+            row = self.db.execute("SELECT ip, created, attempts FROM outbox"
+                                  " WHERE target = ?", (target,)).fetchone()
+            if row and row[0] == ip:
+                created, attempts = row[1], row[2] + 1
+            else:
+                created, attempts = now, 1
+            delay = min(RETRY_MIN * 2 ** (attempts - 1), RETRY_MAX)
+            due = now + delay * (1 + RETRY_JITTER * (2 * self.rand() - 1))
+            self.db.execute("INSERT OR REPLACE INTO outbox"
+                            " (target, ip, created, attempts, due, error)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (target, ip, created, attempts, due,
+                             error and str(error)))
+            self.db.execute("DELETE FROM outbox WHERE target NOT IN (SELECT target"
+                            " FROM outbox ORDER BY created DESC LIMIT ?)",
+                            (self.size,))
+        log.debug("%s queued for retry #%d in %.0f seconds", target, attempts, due - now)
+        return due
+
+    def remove(self, target):
+        with self.db:
+            self.db.execute("DELETE FROM outbox WHERE target = ?", (target,))
+
+    def due(self, target, ip):
+        """True unless target has a failed action for ip still backing off"""
+        row = self.db.execute("SELECT due FROM outbox WHERE target = ? AND ip = ?",
+                              (target, ip)).fetchone()
+        return not row or row[0] <= self.clock()
+
+    def entries(self):
+        """Return a list of (target, ip, attempts, due, error), soonest first"""
+        return self.db.execute("SELECT target, ip, attempts, due, error"
+                               " FROM outbox ORDER BY due").fetchall()
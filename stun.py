@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# stun - Minimal STUN (RFC 5389) client to find the external IPv4 address
+#
+#    Copyright (C) 2026 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Minimal STUN (RFC 5389) client to find the external IPv4 address
+
+A single Binding Request is sent, and the XOR-MAPPED-ADDRESS (or the legacy
+MAPPED-ADDRESS) attribute of the response is the address as seen by the
+STUN server.
+"""
+
+import os
+import socket
+import struct
+import time
+
+
+SERVER = ("stun.l.google.com", 19302)
+TIMEOUT = 3  # seconds
+
+MAGIC_COOKIE = 0x2112A442
+BINDING_REQUEST = 0x0001
+BINDING_SUCCESS = 0x0101
+MAPPED_ADDRESS = 0x0001
+XOR_MAPPED_ADDRESS = 0x0020
+
+
+class StunError(Exception):
+    pass
+
+
+def parse_response(data, transaction):
+    """Return the mapped IPv4 address in a Binding Success response, or None
+
+    None means data is not a response for this transaction.
+    """
+    if len(data) < 20:
+        return None
+    msgtype, length, cookie = struct.unpack('!HHL', data[:8])
+    if msgtype != BINDING_SUCCESS or cookie != MAGIC_COOKIE or data[8:20] != transaction:
+        return None
+
+    mapped = None
+    pos, end = 20, min(20 + length, len(data))
+    while pos + 4 <= end:
+        attrtype, attrlen = struct.unpack('!HH', data[pos:pos + 4])
+        value = data[pos + 4:pos + 4 + attrlen]
+        if attrtype in (XOR_MAPPED_ADDRESS, MAPPED_ADDRESS) and len(value) >= 8:
+            family = struct.unpack('!B', value[1:2])[0]
+            if family == 0x01:  # IPv4
+                address = struct.unpack('!L', value[4:8])[0]
+                if attrtype == XOR_MAPPED_ADDRESS:
+                    return socket.inet_ntoa(struct.pack('!L', address ^ MAGIC_COOKIE))
+                mapped = socket.inet_ntoa(value[4:8])
+        pos += 4 + attrlen + (-attrlen % 4)  # attributes are 32-bit aligned
+
+    if not mapped:
+        raise StunError("No mapped address in STUN response")
+    return mapped
+
+
+def external_ip(server=SERVER, timeout=TIMEOUT):
+    """Return the external IPv4 address as seen by a STUN server"""
+    transaction = os.urandom(12)
+    request = struct.pack('!HHL', BINDING_REQUEST, 0, MAGIC_COOKIE) + transaction
+    deadline = time.time() + timeout
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(request, server)
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise StunError("No response from STUN server %s:%d" % server)
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(2048)
+            except socket.timeout:
+                continue
+            ip = parse_response(data, transaction)
+            if ip:
+                return ip
+    finally:
+        sock.close()
@@ -0,0 +1,118 @@
+import socket
+import struct
+import unittest
+import threading
+
+import dnsquery
+
+
+def record(name, rtype, ttl, rdata):
+    return (dnsquery.encode_name(name) +
+            struct.pack('!HHLH', rtype, dnsquery.IN, ttl, len(rdata)) + rdata)
+
+
+class StubServer(object):
+    """UDP DNS server answering from a dict of (name, type): (answer, additional)
+
+    Records are (name, type, ttl, rdata in wire format). Every question
+    asked is appended to queries.
+    """
+    def __init__(self, zone):
+        self.zone = zone
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except socket.error:
+                return
+            self.sock.sendto(self.reply(data), addr)
+
+    def reply(self, data):
+        question = dnsquery.parse_message(data)['question']
+        self.queries.append(question)
+        answer, additional = self.zone.get(question, ([], []))
+        return (data[:2] + struct.pack('!HHHHH', 0x8180, 1, len(answer), 0,
+                                       len(additional)) +
+                data[12:] + b''.join(record(*_) for _ in answer + additional))
+
+    def close(self):
+        self.sock.close()
+
+
+class ParseMessageTest(unittest.TestCase):
+    def test_records(self):
+        ip6 = socket.inet_pton(socket.AF_INET6, '2001:db8::1')
+        data = (struct.pack('!HHHHHH', 0x1234, 0x8583, 1, 2, 1, 0) +
+                dnsquery.encode_name('www.example.com') + struct.pack('!HH', 1, 1) +
+                # answers with the name compressed, pointing to the question
+                b'\xc0\x0c' + struct.pack('!HHLH', dnsquery.A, 1, 300, 4) +
+                socket.inet_aton('192.0.2.7') +
+                b'\xc0\x0c' + struct.pack('!HHLH', dnsquery.AAAA, 1, 60, 16) + ip6 +
+                record('example.com', dnsquery.NS, 3600,
+                       dnsquery.encode_name('ns1.example.net')))
+        message = dnsquery.parse_message(data)
+        self.assertEqual(message['id'], 0x1234)
+        self.assertEqual(message['rcode'], dnsquery.NXDOMAIN)
+        self.assertFalse(message['truncated'])
+        self.assertEqual(message['question'], ('www.example.com', dnsquery.A))
+        self.assertEqual(message['answer'],
+                         [('www.example.com', dnsquery.A, 300, '192.0.2.7'),
+                          ('www.example.com', dnsquery.AAAA, 60, '2001:db8::1')])
+        self.assertEqual(message['authority'],
+                         [('example.com', dnsquery.NS, 3600, 'ns1.example.net')])
+        self.assertEqual(message['additional'], [])
+
+    def test_truncated(self):
+        data = (struct.pack('!HHHHHH', 1, 0x8180, 0, 1, 0, 0) +
+                record('example.com', dnsquery.A, 60, socket.inet_aton('192.0.2.7')))
+        self.assertRaises(dnsquery.DnsError, dnsquery.parse_message, data[:-2])
+        self.assertRaises(dnsquery.DnsError, dnsquery.parse_message, data[:8])
+
+
+class NameserversTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        dnsquery.cache = dnsquery.Cache(clock=lambda: self.now)
+        ns = dnsquery.encode_name('ns1.example.net')
+        self.server = StubServer({
+            # No glue, so the nameserver has to be resolved on its own
+            ('example.com', dnsquery.NS): ([('example.com', dnsquery.NS, 3600, ns)], []),
+            ('ns1.example.net', dnsquery.A): (
+                [('ns1.example.net', dnsquery.A, 300, socket.inet_aton('192.0.2.1'))], []),
+        })
+
+    def tearDown(self):
+        self.server.close()
+        dnsquery.cache = dnsquery.Cache()
+
+    def nameservers(self):
+        return dnsquery.nameservers(['home.example.com'], [self.server.address],
+                                    timeout=1)
+
+    def test_cached(self):
+        expected = {'home.example.com': [('192.0.2.1', dnsquery.PORT)]}
+        self.assertEqual(self.nameservers(), expected)
+        asked = len(self.server.queries)
+        self.assertEqual(self.nameservers(), expected)
+        self.assertEqual(len(self.server.queries), asked)
+
+    def test_address_expired(self):
+        expected = {'home.example.com': [('192.0.2.1', dnsquery.PORT)]}
+        self.assertEqual(self.nameservers(), expected)
+        del self.server.queries[:]
+        self.now += 600  # NS records still cached, the address is not
+        self.assertEqual(self.nameservers(), expected)
+        self.assertIn(('ns1.example.net', dnsquery.A), self.server.queries)
+        self.assertNotIn(('example.com', dnsquery.NS), self.server.queries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import threading
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest("dyndns_weblogin requires Python 2")
+
+import urlparse
+import BaseHTTPServer
+
+import dyndns_weblogin
+
+
+PAGE = """<html><head><title>Log In</title></head><body>
+<form id="search" action="/search"><input name="q"></form>
+<form id="loginForm" method="post" action="/entrance/submit">
+  <input type="hidden" name="csrf" value="token123">
+  <input type="text" name="username">
+  <input type="password" name="password">
+  <input type="checkbox" name="remember">
+  <input type="checkbox" name="terms" value="yes" checked>
+  <input type="submit" name="submit" value="Log in">
+  <button name="forgot">Forgot password</button>
+</form></body></html>"""
+
+WELCOME = "<html><head><title>My Dyn Account</title></head><body>Log Out</body></html>"
+
+
+class LoginServer(object):
+    """Local stand-in for the login site
+
+    The form POST succeeds only with the session cookie set by the login
+    page, its hidden token, and the right password. Every POST is appended
+    to posts as a list of (name, value).
+    """
+    def __init__(self, password='right', page=PAGE, cookie='session=s1; Path=/'):
+        self.posts = []
+        site = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body, cookie=None):
+                self.send_response(200)
+                if cookie:
+                    self.send_header('Set-Cookie', cookie)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.reply(page, cookie)
+
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                data = urlparse.parse_qsl(self.rfile.read(length), keep_blank_values=True)
+                site.posts.append(data)
+                fields = dict(data)
+                ok = ('session=s1' in (self.headers.get('Cookie') or '') and
+                      fields.get('csrf') == 'token123' and
+                      fields.get('password') == password)
+                self.reply(WELCOME if ok else PAGE)
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/entrance' % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HttpLoginTest(unittest.TestCase):
+    def site(self, **kwargs):
+        site = LoginServer(**kwargs)
+        self.addCleanup(site.close)
+        return site
+
+    def test_login(self):
+        site = self.site()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        pagefile = os.path.join(tmp, 'page.html')
+        self.assertTrue(dyndns_weblogin.http_login('me', 'right', site.url,
+                                                   pagefile=pagefile))
+        # hidden token carried over, only the first submit button clicked
+        self.assertEqual(site.posts, [[('csrf', 'token123'), ('username', 'me'),
+                                       ('password', 'right'), ('terms', 'yes'),
+                                       ('submit', 'Log in')]])
+        with open(pagefile) as f:
+            self.assertEqual(f.read(), WELCOME)
+
+    def test_cookie_required(self):
+        # Without the session cookie set by the login page the POST is refused
+        site = self.site(cookie=None)
+        self.assertFalse(dyndns_weblogin.http_login('me', 'right', site.url))
+        self.assertEqual(dict(site.posts[0])['password'], 'right')
+
+    def test_wrong_password(self):
+        site = self.site()
+        self.assertFalse(dyndns_weblogin.http_login('me', 'wrong', site.url))
+        self.assertEqual(len(site.posts), 1)
+
+    def test_no_form(self):
+        site = self.site(page="<html><title>Maintenance</title></html>")
+        self.assertRaises(dyndns_weblogin.LoginError, dyndns_weblogin.http_login,
+                          'me', 'right', site.url)
+        self.assertEqual(site.posts, [])
+
+    def test_unreachable(self):
+        site = self.site()
+        site.close()
+        selenium, dyndns_weblogin.selenium = dyndns_weblogin.selenium, None
+        try:
+            self.assertFalse(dyndns_weblogin.login('me', 'right', url=site.url))
+        finally:
+            dyndns_weblogin.selenium = selenium
+
+
+class LoggedInTest(unittest.TestCase):
+    def test_logged_in(self):
+        self.assertTrue(dyndns_weblogin.logged_in("My Dyn Account", ""))
+        self.assertTrue(dyndns_weblogin.logged_in("Dyn", "<a>Log Out</a>"))
+        self.assertFalse(dyndns_weblogin.logged_in("Log In", "<form></form>"))
+
+
+if __name__ == '__main__':
+    unittest.main()
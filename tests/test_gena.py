@@ -0,0 +1,44 @@
+import socket
+import unittest
+
+import gena
+
+
+PROPERTYSET = b"""<?xml version="1.0"?>
+<e:propertyset xmlns:e="urn:schemas-upnp-org:event-1-0">
+  <e:property><ExternalIPAddress> 192.0.2.1 </ExternalIPAddress></e:property>
+  <e:property><ConnectionStatus>Connected</ConnectionStatus></e:property>
+</e:propertyset>"""
+
+
+class ParsePropertysetTest(unittest.TestCase):
+    def test_variables(self):
+        self.assertEqual(gena.parse_propertyset(PROPERTYSET),
+                         {'ExternalIPAddress': '192.0.2.1',
+                          'ConnectionStatus': 'Connected'})
+
+    def test_invalid(self):
+        self.assertEqual(gena.parse_propertyset(b"<e:propertyset"), {})
+
+
+class WatcherTest(unittest.TestCase):
+    def test_port_in_use(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(1)
+            self.assertRaises(gena.GenaError, gena.Watcher,
+                              'http://127.0.0.1:5000/event', sock.getsockname()[1])
+        finally:
+            sock.close()
+
+    def test_callback(self):
+        watcher = gena.Watcher('http://127.0.0.1:5000/event')
+        try:
+            self.assertTrue(watcher.callback.startswith('http://127.0.0.1:'))
+        finally:
+            watcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest("mailqueue requires Python 2")
+
+import mailqueue
+
+
+class FakeMailer(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, sender, recipients, subject, text, attachments):
+        self.sent.append(subject)
+        return {}
+
+    def close(self):
+        pass
+
+
+class BuggyMailer(FakeMailer):
+    """Fails the first message with an unexpected error"""
+    def __init__(self):
+        super(BuggyMailer, self).__init__()
+        self.called = threading.Event()
+
+    def send(self, *args):
+        if not self.called.is_set():
+            self.called.set()
+            raise RuntimeError("bug")
+        return super(BuggyMailer, self).send(*args)
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.now = 1000.0
+        self.spool = mailqueue.Spool(self.dir, clock=lambda: self.now, rand=lambda: 0.5)
+        self.mailer = FakeMailer()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, filename, data):
+        with open(os.path.join(self.spool.queue, filename), 'w') as f:
+            f.write(data)
+
+    def files(self):
+        return sorted(os.listdir(self.spool.queue))
+
+    def test_deliver(self):
+        self.spool.add('me', 'you@example.com', "hello", "text")
+        self.assertEqual(self.spool.deliver(self.mailer), (1, 0))
+        self.assertEqual(self.mailer.sent, ["hello"])
+        self.assertEqual(self.files(), [])
+
+    def test_malformed_set_aside(self):
+        self.spool.add('me', 'you@example.com', "hello", "text")
+        entry = dict(self.spool.entries()[0], id='2-bad')
+        del entry['subject']
+        self.write('1-json.json', '{"id": "1-json", ')
+        self.write('2-bad.json', json.dumps(entry))
+        self.write('3-list.json', '[]')
+
+        self.assertEqual(self.spool.deliver(self.mailer), (1, 0))
+        self.assertEqual(self.mailer.sent, ["hello"])
+        self.assertEqual(self.files(), ['1-json.json.bad', '2-bad.json.bad',
+                                        '3-list.json.bad'])
+        self.assertEqual(self.spool.entries(), [])
+
+    def test_unsendable_set_aside(self):
+        self.spool.add('me', 'you@example.com', "first", "text")
+        self.now += 1
+        qid = self.spool.add('me', 'you@example.com', "second", "text")
+        entry = [_ for _ in self.spool.entries() if _['id'] == qid][0]
+        entry['attachments'] = [["path", "too", "many", "arguments", "here"]]
+        self.write(qid + '.json', json.dumps(entry))
+
+        self.assertEqual(self.spool.deliver(self.mailer), (1, 1))
+        self.assertEqual(self.mailer.sent, ["first"])
+        self.assertEqual(self.files(), [qid + '.json.bad'])
+
+    def test_worker_survives(self):
+        self.write('1-json.json', 'not json')
+        self.spool.add('me', 'you@example.com', "hello", "text")
+        worker = mailqueue.Worker(self.spool, self.mailer, clock=lambda: self.now)
+        worker.start()
+        self.assertTrue(worker.stop(timeout=5))
+        self.assertEqual(self.mailer.sent, ["hello"])
+
+    def test_worker_survives_bug(self):
+        self.spool.add('me', 'you@example.com', "hello", "text")
+        mailer = BuggyMailer()
+        worker = mailqueue.Worker(self.spool, mailer, clock=lambda: self.now)
+        worker.start()
+        self.assertTrue(mailer.called.wait(5))
+        self.assertTrue(worker.is_alive())
+        # Woken up by stop(), it delivers what is still due
+        self.assertTrue(worker.stop(timeout=5))
+        self.assertEqual(mailer.sent, ["hello"])
+
+
+if __name__ == '__main__':
+    unittest.main()
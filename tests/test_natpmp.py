@@ -0,0 +1,115 @@
+import time
+import socket
+import struct
+import unittest
+import threading
+
+import natpmp
+
+
+class StubGateway(object):
+    """UDP stand-in for a NAT-PMP/PCP gateway
+
+    respond(request) returns the list of datagrams to answer a request
+    with. Every request received is appended to requests.
+    """
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(1100)
+                self.requests.append(data)
+                for reply in self.respond(data):
+                    self.sock.sendto(reply, addr)
+            except socket.error:
+                return
+
+    def close(self):
+        self.sock.close()
+
+
+def natpmp_reply(ip, result=0):
+    return struct.pack('!BBHL', 0, 128, result, 1234) + socket.inet_aton(ip)
+
+
+def pcp_reply(request, ip, result=0, nonce=None):
+    nonce = nonce or request[24:36]
+    return (struct.pack('!BBxBLL', 2, 0x81, result, 60, 1234) + b'\0' * 12 +
+            # protocol and internal port as requested, mapped to the same port
+            nonce + request[36:42] + request[40:42] +
+            b'\0' * 10 + b'\xff\xff' + socket.inet_aton(ip))
+
+
+def pcp_only(ip, result=0):
+    """Gateway answering NAT-PMP with Unsupported Version, and PCP MAP with ip"""
+    def respond(request):
+        if request[0:1] == b'\x00':
+            return [struct.pack('!BBH', 2, 128, natpmp.UNSUPP_VERSION) + b'\0' * 20]
+        if struct.unpack('!L', request[4:8])[0] == 0:
+            return []  # mapping deleted
+        return [pcp_reply(request, '198.51.100.1', nonce=b'x' * 12),  # not ours
+                pcp_reply(request, ip, result)]
+    return respond
+
+
+class ExternalIpTest(unittest.TestCase):
+    def gateway(self, respond):
+        self.stub = StubGateway(respond)
+        self.addCleanup(self.stub.close)
+        return self.stub.port
+
+    def test_natpmp(self):
+        port = self.gateway(lambda request: [natpmp_reply('203.0.113.7')])
+        self.assertEqual(natpmp.external_ip('127.0.0.1', timeout=2, port=port),
+                         '203.0.113.7')
+        self.assertEqual(self.stub.requests, [b'\x00\x00'])
+
+    def test_natpmp_error(self):
+        port = self.gateway(lambda request: [natpmp_reply('0.0.0.0', result=3)])
+        self.assertRaises(natpmp.NatPmpError, natpmp.external_ip,
+                          '127.0.0.1', timeout=2, port=port)
+
+    def test_pcp_fallback(self):
+        port = self.gateway(pcp_only('203.0.113.9'))
+        self.assertEqual(natpmp.external_ip('127.0.0.1', timeout=2, port=port),
+                         '203.0.113.9')
+        time.sleep(0.1)  # for the deletion to arrive
+        natpmp_request, map_request, delete = self.stub.requests
+        self.assertEqual(natpmp_request, b'\x00\x00')
+        self.assertEqual(len(map_request), 60)
+        self.assertEqual(struct.unpack('!BBHL', map_request[:8]),
+                         (2, natpmp.PCP_OPCODE_MAP, 0, natpmp.PCP_LIFETIME))
+        self.assertEqual(map_request[8:24], b'\0' * 10 + b'\xff\xff' +
+                         socket.inet_aton('127.0.0.1'))
+        # the mapping is deleted right after, with the same nonce
+        self.assertEqual(struct.unpack('!L', delete[4:8])[0], 0)
+        self.assertEqual(delete[24:36], map_request[24:36])
+
+    def test_pcp_error(self):
+        port = self.gateway(pcp_only('203.0.113.9', result=2))
+        self.assertRaises(natpmp.NatPmpError, natpmp.external_ip,
+                          '127.0.0.1', timeout=2, port=port)
+
+    def test_timeout(self):
+        port = self.gateway(lambda request: [])
+        start = time.time()
+        self.assertRaises(natpmp.NatPmpError, natpmp.external_ip,
+                          '127.0.0.1', timeout=1, port=port)
+        elapsed = time.time() - start
+        self.assertGreaterEqual(elapsed, 1)
+        self.assertLess(elapsed, 1.5)
+        # sent at 0, 0.25 and 0.75 seconds
+        self.assertEqual(self.stub.requests, [b'\x00\x00'] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
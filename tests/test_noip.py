@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest("noip requires Python 2")
+
+import StringIO
+
+import noip
+
+
+# Canned response lines: code, IP, ok
+CORPUS = [
+    ("good 192.0.2.1",  'good',     '192.0.2.1', True),
+    ("nochg 192.0.2.1", 'nochg',    '192.0.2.1', True),
+    ("good 2001:db8::1", 'good',    '2001:db8::1', True),
+    ("nohost",          'nohost',   None, False),
+    ("badauth",         'badauth',  None, False),
+    ("badagent",        'badagent', None, False),
+    ("!donator",        '!donator', None, False),
+    ("abuse",           'abuse',    None, False),
+    ("911",             '911',      None, False),
+    ("",                '',         None, False),
+    ("dnserr",          'dnserr',   None, False),
+]
+
+
+class ParseResponseTest(unittest.TestCase):
+    def test_corpus(self):
+        for line, code, ip, ok in CORPUS:
+            response = noip.parse_response('home.example.com', line)
+            self.assertEqual(response, ('home.example.com', code, ip, line))
+            self.assertEqual(response.ok, ok, line)
+
+    def test_description(self):
+        self.assertEqual(noip.parse_response('h', "nohost").description,
+                         noip.CODES['nohost'])
+        self.assertEqual(noip.parse_response('h', "dnserr").description,
+                         "Unknown response")
+
+
+class CannedHttp(object):
+    """Answers every update request with the next canned body"""
+    def __init__(self, *bodies):
+        self.bodies = list(bodies)
+        self.requests = []
+
+    def get(self, url, querydata=None, username="", password="", **kwargs):
+        self.requests.append(querydata['hostname'].split(','))
+        return StringIO.StringIO(self.bodies.pop(0))
+
+
+class StatusTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'noip.status')
+        self.secret = os.path.join(self.dir, 'status.key')
+        self.now = 1000.0
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def status(self):
+        return noip.Status(self.path, clock=lambda: self.now, secret_path=self.secret)
+
+    def test_911_backoff(self):
+        status = self.status()
+        http = CannedHttp("911", "good 192.0.2.1")
+        responses = status.update(['a'], '192.0.2.1', 'user', 'pass', http)
+        self.assertEqual([_.code for _ in responses], ['911'])
+        self.assertEqual(status.backoff(), noip.BACKOFF)
+
+        # Held, even across runs, without asking the server
+        self.now += noip.BACKOFF - 1
+        self.assertRaises(noip.UpdateError, self.status().update,
+                          ['a'], '192.0.2.1', 'user', 'pass', http)
+        self.assertEqual(len(http.requests), 1)
+
+        self.now += 1
+        responses = self.status().update(['a'], '192.0.2.1', 'user', 'pass', http)
+        self.assertEqual([_.code for _ in responses], ['good'])
+
+    def test_nohost_blocks_hostname(self):
+        http = CannedHttp("nohost\ngood 192.0.2.1", "good 192.0.2.1",
+                          "good 192.0.2.1\ngood 192.0.2.1")
+        self.status().update(['a', 'b'], '192.0.2.1', 'user', 'pass', http)
+
+        responses = self.status().update(['a', 'b'], '192.0.2.1', 'user', 'pass', http)
+        self.assertEqual(http.requests[1], ['b'])
+        self.assertEqual([(_.code, _.ok) for _ in responses],
+                         [('nohost', False), ('good', True)])
+
+        # A config change lifts the block
+        self.status().update(['a', 'b'], '192.0.2.1', 'user', 'newpass', http)
+        self.assertEqual(http.requests[2], ['a', 'b'])
+
+    def test_abuse_blocks_account(self):
+        http = CannedHttp("abuse")
+        self.status().update(['a', 'b'], '192.0.2.1', 'user', 'pass', http)
+        responses = self.status().update(['a', 'b', 'c'], '192.0.2.1',
+                                         'user', 'pass', http)
+        self.assertEqual(len(http.requests), 1)
+        self.assertEqual([_.code for _ in responses], ['abuse'] * 3)
+        self.assertFalse(any(_.ok for _ in responses))
+
+    def test_private(self):
+        self.status().update(['a'], '192.0.2.1', 'user', 'secretpass', CannedHttp("nohost"))
+        for path in (self.path, self.secret):
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        with open(self.path) as f:
+            data = f.read()
+        self.assertNotIn('secretpass', data)
+        self.assertNotIn(hashlib.sha1("user\tsecretpass\ta").hexdigest(), data)
+
+    def test_legacy_keys_dropped(self):
+        legacy = hashlib.sha1("user\tpass\t").hexdigest()
+        with open(self.path, 'w') as f:
+            json.dump(dict(backoff=0, hostnames={},
+                           blocked={legacy: dict(code='badauth', time=0)}), f)
+        self.assertEqual(self.status().data['blocked'], {})
+        with open(self.path) as f:
+            self.assertNotIn(legacy, f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import base64
+import tempfile
+import unittest
+import threading
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest("providers requires Python 2")
+
+import urlparse
+import SocketServer
+import BaseHTTPServer
+
+import noip
+import providers
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True  # kept-alive connections don't block shutdown
+
+
+class StandIn(object):
+    """Local HTTP server standing in for a provider's API
+
+    handle(method, path, query, body) returns (status, body) for each
+    request, which is appended to requests as (method, path, query, body,
+    Authorization header), with query a dict of lists.
+    """
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        standin = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse.urlparse(self.path)
+                query = urlparse.parse_qs(url.query)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else None
+                standin.requests.append((self.command, url.path, query, body,
+                                         self.headers.get('Authorization')))
+                status, reply = standin.handle(self.command, url.path, query, body)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            do_POST = do_GET
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def http():
+    return noip.HttpAuth(timeout=5, proxies={})
+
+
+class DynDNS2Test(unittest.TestCase):
+    def setUp(self):
+        def handle(method, path, query, body):
+            hostnames = query['hostname'][0].split(',')
+            addresses = ",".join(query['myip'] + query.get('myipv6', []))
+            return 200, "\n".join("nohost" if _.startswith('gone') else
+                                  "good %s" % addresses for _ in hostnames)
+        self.server = StandIn(handle)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_batches(self):
+        hostnames = ['h%02d.example.com' % i for i in range(25)] + ['gone.example.com']
+        provider = providers.DynDNS2('mine', hostnames, http(), url=self.server.url +
+                                     '/nic/update', username='me', password='secret')
+        results = provider.update(provider.hostnames, '192.0.2.1', '2001:db8::1')
+
+        self.assertEqual([len(_[2]['hostname'][0].split(','))
+                          for _ in self.server.requests], [20, 6])
+        self.assertEqual([_.hostname for _ in results], hostnames)
+        self.assertEqual(results[0], ('h00.example.com', True, "good 192.0.2.1,2001:db8::1"))
+        self.assertEqual(results[-1], ('gone.example.com', False, "nohost"))
+        method, path, query, body, auth = self.server.requests[0]
+        self.assertEqual((method, path), ('GET', '/nic/update'))
+        self.assertEqual(query['myipv6'], ['2001:db8::1'])
+        self.assertEqual(auth, 'Basic ' + base64.b64encode('me:secret'))
+
+    def test_dnsomatic(self):
+        provider = providers.DnsOMatic('dnsomatic', 'a.example.com b.example.com', http(),
+                                       url=self.server.url, username='me', password='x')
+        results = provider.update(provider.hostnames, '192.0.2.1', '2001:db8::1')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertFalse(any('myipv6' in _[2] for _ in self.server.requests))
+        self.assertTrue(all(_.ok for _ in results))
+
+
+class CloudflareTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            dict(id='1', name='home.example.com',   type='A',    content='192.0.2.1'),
+            dict(id='2', name='home.example.com',   type='AAAA', content='2001:db8::1'),
+            dict(id='3', name='office.example.com', type='A',    content='192.0.2.9'),
+            dict(id='4', name='office.example.com', type='MX',   content='mail'),
+        ]
+
+        def handle(method, path, query, body):
+            if path == '/zones/zone1/dns_records' and method == 'GET':
+                return 200, json.dumps(dict(success=True, result=self.records))
+            if path == '/zones/zone1/dns_records/batch' and method == 'POST':
+                patches = json.loads(body)['patches']
+                for record in self.records:
+                    for patch in patches:
+                        if record['id'] == patch['id']:
+                            record['content'] = patch['content']
+                return 200, json.dumps(dict(success=True, result={}))
+            return 404, json.dumps(dict(success=False, errors=[dict(code=7003)]))
+        self.server = StandIn(handle)
+
+    def tearDown(self):
+        self.server.close()
+
+    def provider(self, zone='zone1'):
+        return providers.Cloudflare('cloudflare', 'home.example.com office.example.com'
+                                    ' none.example.com', http(), token='tok',
+                                    zone=zone, api=self.server.url)
+
+    def test_patch_changed_only(self):
+        provider = self.provider()
+        results = provider.update(provider.hostnames, '192.0.2.9', '2001:db8::1')
+        self.assertEqual(results, [
+            ('home.example.com', True, "good 192.0.2.9,2001:db8::1"),
+            ('office.example.com', True, "nochg 192.0.2.9"),
+            ('none.example.com', False, "nohost"),
+        ])
+        self.assertEqual([_[:2] for _ in self.server.requests],
+                         [('GET', '/zones/zone1/dns_records'),
+                          ('POST', '/zones/zone1/dns_records/batch')])
+        self.assertEqual(json.loads(self.server.requests[1][3]),
+                         {'patches': [{'id': '1', 'content': '192.0.2.9'}]})
+        self.assertEqual(self.server.requests[0][4], 'Bearer tok')
+
+    def test_nothing_to_patch(self):
+        provider = self.provider()
+        results = provider.update(['home.example.com'], '192.0.2.1')
+        self.assertEqual(results, [('home.example.com', True, "nochg 192.0.2.1")])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_api_error(self):
+        provider = self.provider('nozone')
+        with self.assertRaises(providers.ProviderError) as cm:
+            provider.update(provider.hostnames, '192.0.2.1')
+        self.assertIn('7003', str(cm.exception))
+
+    def test_unreachable(self):
+        provider = self.provider()
+        self.server.close()
+        self.assertRaises(providers.ProviderError, provider.update,
+                          provider.hostnames, '192.0.2.1')
+
+
+class LoadTest(unittest.TestCase):
+    def test_bad_values_skipped(self):
+        path = tempfile.mktemp()
+        try:
+            with open(path, 'w') as f:
+                f.write("[badport]\ntype = rfc2136\nserver = 192.0.2.53#dns\n\n"
+                        "[badttl]\ntype = rfc2136\nserver = 192.0.2.53\nttl = 5m\n\n"
+                        "[good]\ntype = rfc2136\nserver = 192.0.2.53#5353\n")
+            loaded = providers.load(path, http())
+        finally:
+            os.remove(path)
+        self.assertEqual([_.name for _ in loaded], ['good'])
+        self.assertEqual(loaded[0].server, ('192.0.2.53', 5353))
+
+
+if __name__ == '__main__':
+    unittest.main()
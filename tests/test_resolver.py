@@ -0,0 +1,136 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+
+import resolver
+
+
+def source(ip, delay=0, error=None):
+    """Stub source answering ip after delay seconds, or raising error"""
+    def external_ip():
+        time.sleep(delay)
+        if error:
+            raise error
+        return ip
+    return external_ip
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = resolver.Stats(None)
+
+    def resolve(self, sources, **kwargs):
+        start = time.time()
+        ip = resolver.resolve(sources, stats=self.stats, **kwargs)
+        return ip, time.time() - start
+
+    def test_fastest_wins(self):
+        ip, elapsed = self.resolve({'slow': source('192.0.2.2', 1),
+                                    'fast': source('192.0.2.1', 0.05)}, timeout=5)
+        self.assertEqual(ip, '192.0.2.1')
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.stats.get('fast')['successes'], 1)
+        self.assertEqual(self.stats.get('slow')['successes'], 0)  # abandoned
+
+    def test_failures_skipped(self):
+        ip, _ = self.resolve({'error': source(None, error=IOError("down")),
+                              'invalid': source('<html>'),
+                              'good': source('192.0.2.1', 0.1)}, timeout=5)
+        self.assertEqual(ip, '192.0.2.1')
+        self.assertEqual(self.stats.get('error')['failures'], 1)
+        self.assertEqual(self.stats.get('invalid')['failures'], 1)
+
+    def test_quorum(self):
+        ip, _ = self.resolve({'odd': source('192.0.2.9'),
+                              'a': source('192.0.2.1', 0.05),
+                              'b': source('192.0.2.1', 0.1)}, quorum=2, timeout=5)
+        self.assertEqual(ip, '192.0.2.1')
+
+    def test_quorum_not_reached(self):
+        ip, elapsed = self.resolve({'a': source('192.0.2.1'), 'b': source('192.0.2.2')},
+                                   quorum=2, timeout=5)
+        self.assertIsNone(ip)
+        self.assertLess(elapsed, 1)  # no source left to wait for
+
+    def test_timeout(self):
+        blocked = threading.Event()
+        self.addCleanup(blocked.set)
+        ip, elapsed = self.resolve({'hung': lambda: blocked.wait(10)}, timeout=0.3)
+        self.assertIsNone(ip)
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(self.stats.get('hung')['failstreak'], 1)
+
+    def test_ipv6(self):
+        ip = resolver.resolve6({'v4': source('192.0.2.1'),
+                                'v6': source('2001:db8::1', 0.05)},
+                               stats=self.stats, timeout=5)
+        self.assertEqual(ip, '2001:db8::1')
+        self.assertEqual(self.stats.get('v4')['failures'], 1)
+
+
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = resolver.Stats(None, clock=self.clock)
+
+    def test_order_by_latency(self):
+        self.stats.record('slow', True, 2.0)
+        self.stats.record('fast', True, 0.1)
+        self.assertEqual(self.stats.order(['new', 'slow', 'fast']),
+                         ['fast', 'slow', 'new'])
+
+    def test_latency_average(self):
+        self.stats.record('a', True, 1.0)
+        self.stats.record('a', True, 2.0)
+        self.assertAlmostEqual(self.stats.get('a')['latency'],
+                               1.0 + resolver.EWMA_WEIGHT * 1.0)
+        self.stats.record('a', False, 10.0)  # failures don't count
+        self.assertAlmostEqual(self.stats.get('a')['latency'],
+                               1.0 + resolver.EWMA_WEIGHT * 1.0)
+
+    def test_skipped_after_failures(self):
+        for i in range(resolver.MAX_FAILURES):
+            self.assertEqual(self.stats.order(['bad', 'good']), ['bad', 'good'])
+            self.stats.record('bad', False, 1.0)
+        self.assertTrue(self.stats.skipped('bad'))
+        self.assertEqual(self.stats.order(['bad', 'good']), ['good'])
+
+        self.clock.now += resolver.RETRY_AFTER
+        self.assertFalse(self.stats.skipped('bad'))
+        self.assertEqual(self.stats.order(['bad', 'good']), ['bad', 'good'])
+
+        # a success resets the streak
+        self.stats.record('bad', True, 1.0)
+        self.stats.record('bad', False, 1.0)
+        self.assertFalse(self.stats.skipped('bad'))
+
+    def test_all_skipped(self):
+        for _ in range(resolver.MAX_FAILURES):
+            self.stats.record('a', False, 1.0)
+            self.stats.record('b', False, 1.0)
+        self.assertEqual(sorted(self.stats.order(['a', 'b'])), ['a', 'b'])
+
+    def test_saved(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'stats')
+        stats = resolver.Stats(path, clock=self.clock)
+        stats.record('a', True, 0.5)
+        stats.save()
+        self.assertEqual(resolver.Stats(path).get('a')['latency'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import hmac
+import base64
+import socket
+import struct
+import hashlib
+import unittest
+
+import dnsquery
+import rfc2136
+
+from test_dnsquery import StubServer
+
+
+SECRET = base64.b64encode(b'0123456789abcdef0123456789abcdef')
+NOW = 1700000000
+
+
+def rr(name, rtype, rclass, ttl, rdata=b''):
+    return (dnsquery.encode_name(name) +
+            struct.pack('!HHLH', rtype, rclass, ttl, len(rdata)) + rdata)
+
+
+def tsig_variables(name, signed, error=0):
+    """TSIG variables as in RFC 8945 section 4.3.3, built independently"""
+    return (dnsquery.encode_name(name) + struct.pack('!HL', 255, 0) +
+            dnsquery.encode_name('hmac-sha256') +
+            struct.pack('!HLHHH', 0, signed, 300, error, 0))
+
+
+def tsig_record(name, signed, mac, qid, error=0):
+    rdata = (dnsquery.encode_name('hmac-sha256') +
+             struct.pack('!HLHH', 0, signed, 300, len(mac)) + mac +
+             struct.pack('!HHH', qid, error, 0))
+    return rr(name, 250, 255, 0, rdata)
+
+
+class UpdateServer(StubServer):
+    """StubServer that also answers UPDATE messages, with rcodes in turn
+
+    Every UPDATE received is appended to updates.
+    """
+    def __init__(self, zone, rcodes):
+        self.rcodes = list(rcodes)
+        self.updates = []
+        super(UpdateServer, self).__init__(zone)
+
+    def reply(self, data):
+        if (struct.unpack('!H', data[2:4])[0] >> 11) & 0xF != rfc2136.UPDATE:
+            return super(UpdateServer, self).reply(data)
+        self.updates.append(data)
+        end = dnsquery.decode_name(data, 12)[1] + 4
+        return (data[:2] + struct.pack('!HHHHH', 0x8000 | rfc2136.UPDATE << 11 |
+                                       self.rcodes.pop(0), 1, 0, 0, 0) + data[12:end])
+
+
+class KeyTest(unittest.TestCase):
+    def setUp(self):
+        self.key = rfc2136.Key('DDNS-Key.', SECRET, clock=lambda: NOW + 0.7)
+        self.message = rfc2136.build_update(0x1234, 'example.com', [
+            ('home.example.com', dnsquery.A, [], '192.0.2.1')])
+
+    def test_sign(self):
+        signed, mac = self.key.sign(self.message)
+        expected = hmac.new(base64.b64decode(SECRET),
+                            self.message + tsig_variables('ddns-key', NOW),
+                            hashlib.sha256).digest()
+        self.assertEqual(mac, expected)
+        self.assertEqual(signed, self.message[:10] + struct.pack('!H', 1) +
+                         self.message[12:] + tsig_record('ddns-key', NOW, mac, 0x1234))
+
+    def reply(self, request_mac, error=0):
+        unsigned = (struct.pack('!HHHHHH', 0x1234, 0xA800, 1, 0, 0, 0) +
+                    dnsquery.encode_name('example.com') + struct.pack('!HH', 6, 1))
+        mac = hmac.new(base64.b64decode(SECRET),
+                       struct.pack('!H', len(request_mac)) + request_mac + unsigned +
+                       tsig_variables('ddns-key', NOW + 1, error),
+                       hashlib.sha256).digest()
+        return (unsigned[:10] + struct.pack('!H', 1) + unsigned[12:] +
+                tsig_record('ddns-key', NOW + 1, mac, 0x1234, error))
+
+    def test_verify(self):
+        _, mac = self.key.sign(self.message)
+        reply = self.reply(mac)
+        self.assertEqual(self.key.verify(reply, mac), 0)
+
+        tampered = reply[:3] + b'\x05' + reply[4:]  # rcode REFUSED
+        self.assertRaises(rfc2136.UpdateError, self.key.verify, tampered, mac)
+        self.assertRaises(rfc2136.UpdateError, self.key.verify, reply, b'x' * 32)
+        other = rfc2136.Key('other-key', SECRET)
+        self.assertRaises(rfc2136.UpdateError, other.verify, reply, mac)
+
+    def test_verify_unsigned(self):
+        self.assertRaises(rfc2136.UpdateError, self.key.verify, self.message, b'')
+
+    def test_tsig_offset(self):
+        signed, _ = self.key.sign(self.message)
+        self.assertEqual(rfc2136.tsig_offset(signed), len(self.message))
+        self.assertIsNone(rfc2136.tsig_offset(self.message))
+        # An additional record that is not a TSIG one
+        extra = (self.message[:10] + struct.pack('!H', 1) + self.message[12:] +
+                 rr('x.example.com', dnsquery.A, dnsquery.IN, 60, b'\x00' * 4))
+        self.assertIsNone(rfc2136.tsig_offset(extra))
+
+
+class BuildUpdateTest(unittest.TestCase):
+    def test_sections(self):
+        ip6 = socket.inet_pton(socket.AF_INET6, '2001:db8::1')
+        message = rfc2136.build_update(0x1234, 'example.com', [
+            ('a.example.com', dnsquery.A, ['192.0.2.1', '192.0.2.9'], '192.0.2.2'),
+            ('b.example.com', dnsquery.AAAA, [], '2001:db8::1'),
+        ], ttl=120)
+        self.assertEqual(message, b''.join([
+            struct.pack('!HHHHHH', 0x1234, 0x2800, 1, 3, 4, 0),
+            dnsquery.encode_name('example.com'), struct.pack('!HH', 6, 1),
+            # prerequisites: the exact records seen, or none at all
+            rr('a.example.com', 1, 1, 0, socket.inet_aton('192.0.2.1')),
+            rr('a.example.com', 1, 1, 0, socket.inet_aton('192.0.2.9')),
+            rr('b.example.com', 28, 254, 0),
+            # updates: delete the RRset, add the new address
+            rr('a.example.com', 1, 255, 0),
+            rr('a.example.com', 1, 1, 120, socket.inet_aton('192.0.2.2')),
+            rr('b.example.com', 28, 255, 0),
+            rr('b.example.com', 28, 1, 120, ip6),
+        ]))
+
+
+class UpdateTest(unittest.TestCase):
+    def server(self, *rcodes):
+        self.stub = UpdateServer({
+            ('home.example.com', dnsquery.A): (
+                [('home.example.com', dnsquery.A, 60, socket.inet_aton('192.0.2.1'))], []),
+        }, rcodes)
+        self.addCleanup(self.stub.close)
+        return self.stub.address
+
+    def update(self, server, ip):
+        return rfc2136.update(server, ['home.example.com'], ip, zone='example.com',
+                              timeout=1)
+
+    def test_good(self):
+        server = self.server(0)
+        self.assertEqual(self.update(server, '192.0.2.2'),
+                         [('home.example.com', 'good 192.0.2.2')])
+        self.assertEqual(len(self.stub.updates), 1)
+
+    def test_nochg(self):
+        server = self.server()
+        self.assertEqual(self.update(server, '192.0.2.1'),
+                         [('home.example.com', 'nochg 192.0.2.1')])
+        self.assertEqual(self.stub.updates, [])
+
+    def test_retry_after_prereq_failed(self):
+        server = self.server(8, 0)  # NXRRSET, then NOERROR
+        self.assertEqual(self.update(server, '192.0.2.2'),
+                         [('home.example.com', 'good 192.0.2.2')])
+        self.assertEqual(len(self.stub.updates), 2)
+        # records were read again before retrying
+        self.assertEqual(self.stub.queries.count(('home.example.com', dnsquery.A)), 2)
+
+    def test_retries_exhausted(self):
+        server = self.server(7, 7)  # YXRRSET
+        self.assertEqual(self.update(server, '192.0.2.2'),
+                         [('home.example.com', 'YXRRSET')])
+        self.assertEqual(len(self.stub.updates), rfc2136.ATTEMPTS)
+
+    def test_other_error_not_retried(self):
+        server = self.server(5)  # REFUSED
+        self.assertEqual(self.update(server, '192.0.2.2'),
+                         [('home.example.com', 'REFUSED')])
+        self.assertEqual(len(self.stub.updates), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import random
+import unittest
+
+import scheduler
+
+
+class FakeClock(object):
+    """Clock that only moves when slept on"""
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+        return False
+
+
+class SchedulerTest(unittest.TestCase):
+    def scheduler(self, rand=lambda: 0.5, **kwargs):
+        self.clock = FakeClock()
+        return scheduler.Scheduler(minimum=30, maximum=1800, clock=self.clock,
+                                   rand=rand, sleep=self.clock.sleep, **kwargs)
+
+    def test_backoff(self):
+        schedule = self.scheduler()
+        intervals = []
+        for _ in range(10):
+            start = self.clock()
+            schedule.record()
+            schedule.wait()
+            intervals.append(self.clock() - start)
+        self.assertEqual(intervals, [60, 120, 240, 480, 960, 1800, 1800, 1800, 1800, 1800])
+
+    def test_reset(self):
+        for outcome in (dict(changed=True), dict(failed=True)):
+            schedule = self.scheduler()
+            for _ in range(6):
+                schedule.record()
+            self.assertEqual(schedule.interval, 1800)
+            self.assertEqual(schedule.record(**outcome), self.clock() + 30)
+            self.assertEqual(schedule.record(), self.clock() + 60)
+
+    def test_first_poll_right_away(self):
+        schedule = self.scheduler()
+        schedule.wait()
+        self.assertEqual(self.clock.slept, [0])
+
+    def test_overdue(self):
+        schedule = self.scheduler()
+        schedule.record()
+        self.clock.now += 3600
+        schedule.wait()
+        self.assertEqual(self.clock.slept, [0])
+
+    def test_jitter_bounds(self):
+        for value in (0.0, 1.0):
+            schedule = self.scheduler(rand=lambda: value, jitter=0.1)
+            delay = schedule.record(failed=True) - self.clock()
+            self.assertAlmostEqual(delay, 30 * (0.9 if value == 0 else 1.1))
+
+        rand = random.Random(42).random
+        schedule = self.scheduler(rand=rand, jitter=0.1)
+        delays = set()
+        for _ in range(1000):
+            interval = schedule.interval
+            delay = schedule.record() - self.clock()
+            self.assertTrue(0.9 * schedule.interval <= delay <= 1.1 * schedule.interval,
+                            (interval, delay))
+            self.assertGreaterEqual(delay, 0.9 * 30)
+            self.assertLessEqual(delay, 1.1 * 1800)
+            delays.add(delay)
+        self.assertGreater(len(delays), 1)
+
+    def test_no_jitter(self):
+        schedule = self.scheduler(rand=random.random, jitter=0)
+        self.assertEqual(schedule.record(failed=True), self.clock() + 30)
+
+    def test_wake(self):
+        schedule = scheduler.Scheduler(minimum=30)
+        schedule.record()
+        schedule.wake()
+        self.assertTrue(schedule.wait())
+        self.assertFalse(schedule.wakeup.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,291 @@
+import os
+import sys
+import gzip
+import base64
+import shutil
+import socket
+import tempfile
+import unittest
+import threading
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest("sendmail requires Python 2")
+
+import StringIO
+import SocketServer
+
+import sendmail
+
+
+class SMTPServer(object):
+    """Local stand-in for an SMTP server
+
+    Messages are appended to messages as (sender, recipients, data), data
+    still dot-stuffed as received. Each connection is appended to sessions
+    as the list of commands it got.
+    """
+    def __init__(self):
+        self.messages = []
+        self.sessions = []
+        self.drop_after_noop = False
+        self.connections = []
+        site = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line + '\r\n')
+                self.wfile.flush()
+
+            def handle(self):
+                site.connections.append(self.request)
+                commands = []
+                site.sessions.append(commands)
+                sender, recipients = None, []
+                self.reply('220 stand-in ESMTP')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.strip().split(' ', 1)[0].upper()
+                    commands.append(command)
+                    if command in ('EHLO', 'HELO'):
+                        self.reply('250 stand-in')
+                    elif command == 'MAIL':
+                        sender, recipients = line.strip()[10:], []
+                        self.reply('250 OK')
+                    elif command == 'RCPT':
+                        recipients.append(line.strip()[8:])
+                        self.reply('250 OK')
+                    elif command == 'DATA':
+                        self.reply('354 go ahead')
+                        data = []
+                        for line in iter(self.rfile.readline, ''):
+                            if line == '.\r\n':
+                                break
+                            data.append(line)
+                        site.messages.append((sender, recipients, ''.join(data)))
+                        self.reply('250 queued')
+                    elif command == 'NOOP':
+                        self.reply('250 OK')
+                        if site.drop_after_noop:
+                            site.drop_after_noop = False
+                            return
+                    elif command == 'RSET':
+                        self.reply('250 OK')
+                    elif command == 'QUIT':
+                        self.reply('221 bye')
+                        return
+                    else:
+                        self.reply('502 not implemented')
+
+        class Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.mailhub = '127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def drop(self):
+        """Close every open connection, as a server timing out idle ones"""
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def close(self):
+        self.drop()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MailerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.server = SMTPServer()
+        self.addCleanup(self.server.close)
+        self.conf = os.path.join(self.dir, 'ssmtp.conf')
+        self.configure(self.server.mailhub)
+        self.mailer = sendmail.Mailer(files=[self.conf], timeout=5)
+        self.addCleanup(self.mailer.close)
+
+    def configure(self, mailhub, mtime=None):
+        with open(self.conf, 'w') as f:
+            f.write("mailhub=%s\nhostname=example.com\n" % mailhub)
+        if mtime:
+            os.utime(self.conf, (mtime, mtime))
+
+    def send(self, subject):
+        return self.mailer.send('me', 'you@example.com', subject, "text")
+
+    def test_session_reused(self):
+        self.assertEqual(self.send("first"), {})
+        self.assertEqual(self.send("second"), {})
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(self.server.messages[0][:2],
+                         ('<me@example.com>', ['<you@example.com>']))
+        # one session, checked with NOOP before the second message
+        self.assertEqual(self.server.sessions, [
+            ['EHLO', 'MAIL', 'RCPT', 'DATA', 'NOOP', 'MAIL', 'RCPT', 'DATA']])
+
+    def test_close(self):
+        self.send("first")
+        self.mailer.close()
+        self.mailer.close()
+        self.assertEqual(self.server.sessions[0][-1], 'QUIT')
+
+    def test_reconnect_after_drop(self):
+        self.send("first")
+        self.server.drop()
+        self.send("second")
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(len(self.server.sessions), 2)
+        self.assertEqual(self.server.sessions[1], ['EHLO', 'MAIL', 'RCPT', 'DATA'])
+
+    def test_reconnect_after_noop(self):
+        # Dropped between the NOOP check and the message
+        self.send("first")
+        self.server.drop_after_noop = True
+        self.send("second")
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(self.server.sessions[0][-1], 'NOOP')
+        self.assertEqual(self.server.sessions[1], ['EHLO', 'MAIL', 'RCPT', 'DATA'])
+
+    def test_config_cached(self):
+        self.configure(self.server.mailhub, mtime=1000)
+        config = self.mailer.config
+        self.assertEqual(config['hostname'], 'example.com')
+        self.send("first")
+
+        # Same mtime: not parsed again, and the session is kept
+        self.configure('192.0.2.1', mtime=1000)
+        self.assertIs(self.mailer.config, config)
+        self.send("second")
+        self.assertEqual(len(self.server.sessions), 1)
+
+        # Changed: parsed again, and the session with old settings closed
+        self.configure(self.server.mailhub, mtime=2000)
+        self.assertIsNot(self.mailer.config, config)
+        self.assertEqual(self.server.sessions[0][-1], 'QUIT')
+        self.send("third")
+        self.assertEqual(len(self.server.sessions), 2)
+
+    def test_send_many(self):
+        errors = self.mailer.send_many([
+            ('me', 'you@example.com', "first", "text", []),
+            ('me', 'you@example.com', "missing", "text", [os.path.join(self.dir, 'nope')]),
+            ('me', 'you@example.com', "third", "text", []),
+        ])
+        self.assertEqual(errors[0], None)
+        self.assertIsInstance(errors[1], IOError)
+        self.assertEqual(errors[2], None)
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(len(self.server.sessions), 1)
+
+
+class MessageTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def path(self, data, name='file.log'):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def content(self, attachment):
+        fp, skipped = attachment.open()
+        try:
+            return ''.join(attachment.chunks(fp, skipped))
+        finally:
+            fp.close()
+
+    def test_base64_lines(self):
+        data = os.urandom(1000)
+        # chunks not aligned to the 57 bytes of a line
+        chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+        lines = list(sendmail.base64_lines(chunks))
+        self.assertTrue(all(len(_) <= 76 + 2 and _.endswith('\r\n') for _ in lines))
+        self.assertEqual(len(lines[0]), 76 + 2)
+        self.assertEqual(''.join(lines), base64.encodestring(data).replace('\n', '\r\n'))
+        self.assertEqual(list(sendmail.base64_lines([])), [])
+
+    def test_tail(self):
+        data = ''.join("line %d\n" % _ for _ in range(100))
+        attachment = sendmail.Attachment(self.path(data), tail=50)
+        content = self.content(attachment)
+        kept = data[-50:].split('\n', 1)[1]  # from the next line boundary
+        self.assertEqual(content, "[... %d bytes skipped ...]\n%s"
+                         % (len(data) - len(kept), kept))
+        # Small files are whole
+        self.assertEqual(self.content(sendmail.Attachment(self.path(data), tail=5000)), data)
+
+    def test_gzip(self):
+        data = ''.join("line %d\n" % _ for _ in range(10000))
+        attachment = sendmail.Attachment(self.path(data), compress=True)
+        self.assertEqual(attachment.name, 'file.log.gz')
+        self.assertEqual(attachment.ctype, 'application/gzip')
+        content = self.content(attachment)
+        self.assertLess(len(content), len(data))
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO.StringIO(content)).read(), data)
+
+    def test_missing_attachment(self):
+        self.assertRaises(IOError, sendmail.message, 'me', 'you@example.com',
+                          attachments=[self.path('x'), os.path.join(self.dir, 'nope')])
+
+    def test_large_attachment(self):
+        # Streamed in several chunks, the same as encoded in memory
+        data = os.urandom(3 * sendmail.CHUNK_SIZE + 1000)
+        path = self.path(data, 'big.bin')
+        _, _, lines = sendmail.message('me', 'you@example.com', "big", "text",
+                                       path, hostname='example.com')
+        msg = ''.join(lines)
+        start = msg.index('filename="big.bin"\r\n\r\n') + len('filename="big.bin"\r\n\r\n')
+        end = msg.index('--', start)
+        self.assertEqual(msg[start:end], base64.encodestring(data).replace('\n', '\r\n'))
+
+
+class DataTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.server = SMTPServer()
+        self.addCleanup(self.server.close)
+        conf = os.path.join(self.dir, 'ssmtp.conf')
+        with open(conf, 'w') as f:
+            f.write("mailhub=%s\n" % self.server.mailhub)
+        self.mailer = sendmail.Mailer(files=[conf], timeout=5)
+        self.addCleanup(self.mailer.close)
+
+    def test_dot_stuffing(self):
+        text = ".\n..two\n.starts\nmiddle . dot\n"
+        _, _, lines = sendmail.message('me', 'you@example.com', "dots", text,
+                                       hostname='example.com')
+        lines = list(lines)
+        self.mailer.deliver('me@example.com', ['you@example.com'], iter(lines))
+        data = self.server.messages[0][2]
+        self.assertIn('\r\n..\r\n...two\r\n..starts\r\nmiddle . dot\r\n', data)
+        unstuffed = ''.join(_[1:] if _.startswith('.') else _
+                            for _ in data.splitlines(True))
+        self.assertEqual(unstuffed, ''.join(lines))
+
+    def test_large_message(self):
+        # Sent in several chunks, received as built in memory
+        path = os.path.join(self.dir, 'big.log')
+        with open(path, 'wb') as f:
+            f.write(''.join("line %d\n" % _ for _ in range(50000)))
+        _, _, lines = sendmail.message('me', 'you@example.com', "big", "text",
+                                       path, hostname='example.com')
+        lines = list(lines)
+        self.assertGreater(len(''.join(lines)), 2 * sendmail.CHUNK_SIZE)
+        self.mailer.deliver('me@example.com', ['you@example.com'], iter(lines))
+        self.assertEqual(self.server.messages[0][2], ''.join(lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
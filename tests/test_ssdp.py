@@ -0,0 +1,111 @@
+import time
+import socket
+import unittest
+import threading
+
+import ssdp
+
+
+GATEWAY = "urn:schemas-upnp-org:service:WANIPConnection:1"
+
+
+def reply(st, location, status="200 OK"):
+    return ('HTTP/1.1 %s\r\n'
+            'CACHE-CONTROL: max-age=1800\r\n'
+            'LOCATION: %s\r\n'
+            'SERVER: Linux UPnP/1.0\r\n'
+            'ST: %s\r\n'
+            'USN: uuid:0::%s\r\n'
+            '\r\n' % (status, location, st, st)).encode('ascii')
+
+
+def noise(count):
+    """Return count replies from every media server, printer and TV around"""
+    kinds = ("urn:schemas-upnp-org:device:MediaServer:1",
+             "urn:schemas-upnp-org:service:ContentDirectory:1",
+             "upnp:rootdevice")
+    datagrams = []
+    for i in range(count):
+        if i % 10 == 0:
+            datagrams.append(b'\x00garbage\xff' * 3)
+        elif i % 10 == 1:
+            datagrams.append(reply(GATEWAY, "http://192.0.2.1/", "404 Not Found"))
+        else:
+            datagrams.append(reply(kinds[i % 3], "http://192.0.2.%d/dev.xml" % (i % 250)))
+    return datagrams
+
+
+class FakeResponder(object):
+    """Answers each M-SEARCH on a local UDP socket with a burst of datagrams
+
+    respond(st) returns the datagrams to send back for search target st.
+    Every search target asked is appended to searches.
+    """
+    def __init__(self, respond):
+        self.respond = respond
+        self.searches = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except socket.error:
+                return
+            st = ssdp.parse_headers(b'HTTP/1.1 200 OK\r\n' +
+                                    data.split(b'\r\n', 1)[1]).get('st')
+            self.searches.append(st)
+            try:
+                for datagram in self.respond(st):
+                    self.sock.sendto(datagram, addr)
+            except socket.error:  # closed while still flooding
+                return
+
+    def close(self):
+        self.sock.close()
+
+
+class ParseHeadersTest(unittest.TestCase):
+    def test_headers(self):
+        headers = ssdp.parse_headers(reply(GATEWAY, "http://192.0.2.1:5000/igd.xml"))
+        self.assertEqual(headers['st'], GATEWAY)
+        self.assertEqual(headers['location'], "http://192.0.2.1:5000/igd.xml")
+        self.assertEqual(headers['cache-control'], "max-age=1800")
+
+    def test_not_ok(self):
+        self.assertIsNone(ssdp.parse_headers(reply(GATEWAY, "http://x/", "404 Not Found")))
+        self.assertIsNone(ssdp.parse_headers(b'NOTIFY * HTTP/1.1\r\n\r\n'))
+        self.assertIsNone(ssdp.parse_headers(b''))
+
+
+class DiscoverTest(unittest.TestCase):
+    def tearDown(self):
+        self.responder.close()
+
+    def test_flood(self):
+        def respond(st):
+            if st == GATEWAY:
+                return noise(300) + [reply(GATEWAY, "http://192.0.2.1/igd.xml")]
+            return noise(100)
+        self.responder = FakeResponder(respond)
+        start = time.time()
+        headers = ssdp.discover(timeout=5, addr=self.responder.address)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(headers['location'], "http://192.0.2.1/igd.xml")
+        self.assertEqual(sorted(self.responder.searches), sorted(ssdp.WAN_SERVICES))
+
+    def test_deadline(self):
+        self.responder = FakeResponder(lambda st: noise(300))
+        start = time.time()
+        self.assertIsNone(ssdp.discover(timeout=0.5, addr=self.responder.address))
+        self.assertGreaterEqual(time.time() - start, 0.5)
+        self.assertLess(time.time() - start, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import sys
+import time
+import unittest
+
+import ssdp
+if sys.version_info[0] > 2:
+    import ssdp3
+
+from test_ssdp import GATEWAY, FakeResponder, noise, reply
+
+
+LOOPBACK = [('lo', '127.0.0.1')]
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "ssdp3 requires Python 3")
+class DiscoverTest(unittest.TestCase):
+    def tearDown(self):
+        self.responder.close()
+
+    def discover(self, **kwargs):
+        start = time.time()
+        responses = ssdp3.discover(interfaces=LOOPBACK, addr=self.responder.address,
+                                   **kwargs)
+        return responses, time.time() - start
+
+    def test_dedup(self):
+        def respond(st):
+            answers = [reply(st, "http://192.0.2.1/igd.xml")] * 50
+            return noise(200) + answers if st == GATEWAY else answers
+        self.responder = FakeResponder(respond)
+        responses, elapsed = self.discover(timeout=0.5)
+        self.assertEqual(sorted(_.headers['st'] for _ in responses),
+                         sorted(ssdp.WAN_SERVICES))
+        self.assertEqual(set(_.address for _ in responses), {'127.0.0.1'})
+        self.assertEqual(set(_.interface for _ in responses), {'lo'})
+
+    def test_limit(self):
+        def respond(st):
+            return [datagram for i in range(100)
+                    for datagram in (noise(1)[0],
+                                     reply(st, "http://192.0.2.%d/igd.xml" % i))]
+        self.responder = FakeResponder(respond)
+        responses, elapsed = self.discover(timeout=5, limit=5)
+        self.assertEqual(len(responses), 5)
+        self.assertLess(elapsed, 2)
+
+    def test_first(self):
+        self.responder = FakeResponder(
+            lambda st: noise(300) + [reply(st, "http://192.0.2.1/igd.xml")])
+        responses, elapsed = self.discover(timeout=5, first=True)
+        self.assertGreaterEqual(len(responses), 1)
+        self.assertLess(elapsed, 2)
+
+    def test_deadline(self):
+        self.responder = FakeResponder(lambda st: noise(300))
+        responses, elapsed = self.discover(timeout=0.5)
+        self.assertEqual(responses, [])
+        self.assertGreaterEqual(elapsed, 0.5)
+        self.assertLess(elapsed, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import state
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.state = state.State(os.path.join(self.dir, 'state.db'), clock=self.clock)
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.dir)
+
+
+class HistoryTest(StateTestCase):
+    def test_record(self):
+        self.assertIsNone(self.state.current())
+        self.assertTrue(self.state.record('192.0.2.1'))
+        self.clock.now += 10
+        self.assertFalse(self.state.record('192.0.2.1'))
+        self.assertTrue(self.state.record('192.0.2.2'))
+        self.assertEqual(self.state.current(), '192.0.2.2')
+        self.assertEqual(self.state.history(), [(1010.0, '192.0.2.2'),
+                                                (1000.0, '192.0.2.1')])
+        self.assertEqual(self.state.history(1), [(1010.0, '192.0.2.2')])
+
+    def test_persisted(self):
+        self.state.record('192.0.2.1')
+        self.state.mark_synced('email', '192.0.2.1')
+        self.state.close()
+        self.state = state.State(os.path.join(self.dir, 'state.db'))
+        self.assertEqual(self.state.current(), '192.0.2.1')
+        self.assertEqual(self.state.synced('email'), '192.0.2.1')
+
+    def test_sync(self):
+        self.assertIsNone(self.state.synced('noip'))
+        self.state.mark_synced('noip', '192.0.2.1')
+        self.state.mark_synced('email', '192.0.2.1')
+        self.state.mark_synced('noip', '192.0.2.2')
+        self.assertEqual(self.state.synced('noip'), '192.0.2.2')
+        self.assertEqual(self.state.outdated(['noip', 'email', 'new'], '192.0.2.2'),
+                         ['email', 'new'])
+
+
+class ObserveTest(StateTestCase):
+    def test_no_debounce(self):
+        self.assertEqual(self.state.observe('192.0.2.1'), ['192.0.2.1'])
+
+    def test_current_settled(self):
+        self.state.record('192.0.2.1')
+        self.assertEqual(self.state.observe('192.0.2.1', settle_time=60), ['192.0.2.1'])
+
+    def test_settle_time(self):
+        self.assertIsNone(self.state.observe('192.0.2.1', settle_time=60))
+        self.clock.now += 59
+        self.assertIsNone(self.state.observe('192.0.2.1', settle_time=60))
+        self.clock.now += 1
+        self.assertEqual(self.state.observe('192.0.2.1', settle_time=60), ['192.0.2.1'])
+
+    def test_settle_polls(self):
+        for _ in range(2):
+            self.assertIsNone(self.state.observe('192.0.2.1', settle_polls=3))
+        self.assertEqual(self.state.observe('192.0.2.1', settle_polls=3), ['192.0.2.1'])
+
+    def test_whichever_first(self):
+        self.assertIsNone(self.state.observe('192.0.2.1', 60, 3))
+        self.clock.now += 60
+        self.assertEqual(self.state.observe('192.0.2.1', 60, 3), ['192.0.2.1'])
+
+    def test_flaps_coalesced(self):
+        self.state.record('192.0.2.1')
+        for ip in ('192.0.2.2', '192.0.2.3', '192.0.2.2'):
+            self.assertIsNone(self.state.observe(ip, settle_time=60))
+            self.clock.now += 30
+        # a new IP restarts the settle time
+        self.assertIsNone(self.state.observe('192.0.2.4', settle_time=60))
+        self.clock.now += 60
+        self.assertEqual(self.state.observe('192.0.2.4', settle_time=60),
+                         ['192.0.2.2', '192.0.2.3', '192.0.2.2', '192.0.2.4'])
+        # and the next sequence starts afresh
+        self.state.record('192.0.2.4')
+        self.assertEqual(self.state.observe('192.0.2.4', settle_time=60), ['192.0.2.4'])
+
+    def test_flap_back(self):
+        self.state.record('192.0.2.1')
+        self.assertIsNone(self.state.observe('192.0.2.2', settle_polls=2))
+        self.assertIsNone(self.state.observe('192.0.2.1', settle_polls=2))
+        self.assertEqual(self.state.observe('192.0.2.1', settle_polls=2),
+                         ['192.0.2.2', '192.0.2.1'])
+
+
+class OutboxTest(StateTestCase):
+    def outbox(self, rand=lambda: 0.5, size=state.OUTBOX_SIZE):
+        return state.Outbox(self.state.db, self.clock, rand, size)
+
+    def test_backoff(self):
+        outbox = self.outbox()
+        delays = [outbox.add('noip', '192.0.2.1', "down") - self.clock() for _ in range(12)]
+        self.assertEqual(delays[:4], [60, 120, 240, 480])
+        self.assertEqual(max(delays), state.RETRY_MAX)
+        self.assertEqual(delays[-1], state.RETRY_MAX)
+        self.assertEqual(outbox.entries(),
+                         [('noip', '192.0.2.1', 12, self.clock() + state.RETRY_MAX, "down")])
+
+    def test_new_ip_restarts(self):
+        outbox = self.outbox()
+        for _ in range(3):
+            outbox.add('noip', '192.0.2.1')
+        self.assertEqual(outbox.add('noip', '192.0.2.2') - self.clock(), 60)
+
+    def test_due(self):
+        outbox = self.outbox()
+        due = outbox.add('noip', '192.0.2.1')
+        self.assertFalse(outbox.due('noip', '192.0.2.1'))
+        self.assertTrue(outbox.due('noip', '192.0.2.2'))  # another IP
+        self.assertTrue(outbox.due('email', '192.0.2.1'))
+        self.clock.now = due
+        self.assertTrue(outbox.due('noip', '192.0.2.1'))
+        outbox.remove('noip')
+        self.assertEqual(outbox.entries(), [])
+
+    def test_jitter_bounds(self):
+        for value, factor in ((0.0, 0.8), (1.0, 1.2)):
+            outbox = self.outbox(rand=lambda: value)
+            outbox.remove('noip')
+            self.assertAlmostEqual(outbox.add('noip', '192.0.2.1') - self.clock(),
+                                   60 * factor)
+
+    def test_cap(self):
+        outbox = self.outbox(size=3)
+        for i in range(5):
+            outbox.add('target%d' % i, '192.0.2.1')
+            self.clock.now += 1
+        self.assertEqual(sorted(_[0] for _ in outbox.entries()),
+                         ['target2', 'target3', 'target4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
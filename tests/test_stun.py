@@ -0,0 +1,73 @@
+import socket
+import struct
+import unittest
+
+import stun
+
+
+TRANSACTION = b'0123456789ab'
+
+
+def attribute(attrtype, value):
+    return struct.pack('!HH', attrtype, len(value)) + value + b'\0' * (-len(value) % 4)
+
+
+def xor_mapped(ip, port=40000):
+    address = struct.unpack('!L', socket.inet_aton(ip))[0] ^ stun.MAGIC_COOKIE
+    return attribute(stun.XOR_MAPPED_ADDRESS,
+                     struct.pack('!BBHL', 0, 1, port ^ (stun.MAGIC_COOKIE >> 16), address))
+
+
+def xor_mapped6(ip, port=40000):
+    key = struct.pack('!L', stun.MAGIC_COOKIE) + TRANSACTION
+    address = socket.inet_pton(socket.AF_INET6, ip)
+    xored = b''.join(struct.pack('!B', a ^ b) for a, b in
+                     zip(bytearray(address), bytearray(key)))
+    return attribute(stun.XOR_MAPPED_ADDRESS,
+                     struct.pack('!BBH', 0, 2, port ^ (stun.MAGIC_COOKIE >> 16)) + xored)
+
+
+def mapped(ip, port=40000):
+    return attribute(stun.MAPPED_ADDRESS,
+                     struct.pack('!BBH', 0, 1, port) + socket.inet_aton(ip))
+
+
+def response(*attributes, **kwargs):
+    body = b''.join(attributes)
+    return (struct.pack('!HHL', kwargs.get('msgtype', stun.BINDING_SUCCESS), len(body),
+                        stun.MAGIC_COOKIE) + kwargs.get('transaction', TRANSACTION) + body)
+
+
+class ParseResponseTest(unittest.TestCase):
+    def parse(self, data):
+        return stun.parse_response(data, TRANSACTION)
+
+    def test_xor_mapped(self):
+        self.assertEqual(self.parse(response(xor_mapped('203.0.113.7'))), '203.0.113.7')
+
+    def test_mapped(self):
+        self.assertEqual(self.parse(response(mapped('203.0.113.8'))), '203.0.113.8')
+
+    def test_xor_mapped_preferred(self):
+        data = response(mapped('198.51.100.1'), attribute(0x8022, b'stub'),
+                        xor_mapped('203.0.113.7'))
+        self.assertEqual(self.parse(data), '203.0.113.7')
+
+    def test_ipv6_skipped(self):
+        data = response(xor_mapped6('2001:db8::7'), xor_mapped('203.0.113.7'))
+        self.assertEqual(self.parse(data), '203.0.113.7')
+        self.assertRaises(stun.StunError, self.parse, response(xor_mapped6('2001:db8::7')))
+
+    def test_no_address(self):
+        self.assertRaises(stun.StunError, self.parse, response(attribute(0x8022, b'stub')))
+
+    def test_not_ours(self):
+        data = response(xor_mapped('203.0.113.7'), transaction=b'x' * 12)
+        self.assertIsNone(self.parse(data))
+        data = response(xor_mapped('203.0.113.7'), msgtype=0x0111)  # error response
+        self.assertIsNone(self.parse(data))
+        self.assertIsNone(self.parse(response()[:19]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,61 +21,122 @@
 # Inspired by Nikos Fotoulis public domain code
 
 import sys
+import os
+import os.path as osp
 import re
 import socket
+import time
+import logging
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 
+import xdg.BaseDirectory as xdg
+
+import ssdp
 import urllib23
 
 
+CACHE_FILE = osp.join(xdg.xdg_cache_home, 'upnp.cache')
+CACHE_TTL = 24 * 60 * 60  # seconds
+
+log = logging.getLogger(__name__)
+
+
 class UpnpError(Exception):
     pass
 
 
-def external_ip():
+def search(regex, text):
+    match = regex.search(text)
+    if match:
+        return match.groups()[0].strip()
 
-    def search(regex, text):
-        match = regex.search(text)
-        if match:
-            return match.groups()[0].strip()
 
-    def get_tag(tag, text, alltags=False):
-        r = re.compile(r"<%s>(.+?)</%s>" % (tag, tag), re.IGNORECASE | re.DOTALL)
-        if alltags:
-            return r.findall(text)
-        else:
-            return search(r, text)
+def get_tag(tag, text, alltags=False):
+    r = re.compile(r"<%s>(.+?)</%s>" % (tag, tag), re.IGNORECASE | re.DOTALL)
+    if alltags:
+        return r.findall(text)
+    else:
+        return search(r, text)
+
+
+def discover(mx=2, timeout=5):
+    """Return (location, serviceType) of the first WAN*Connection found via SSDP"""
+    headers = ssdp.discover(mx=mx, timeout=timeout)
+    if not headers:
+        raise UpnpError("No UPnP gateway found")
+
+    return headers['location'], headers['st']
+
+
+def localname(tag):
+    """Strip the '{namespace}' prefix, if any, from an ElementTree tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_description(fp, services):
+    """Stream-parse a device description, return the first matching service
+
+    Return a dict of the <service> fields, with lowercase keys, for the
+    first service whose serviceType is in services and has a controlURL, or
+    None if no service matches. Parsing stops once it is found, so fp may
+    not be read to the end. Services in nested deviceLists are found,
+    namespaces are ignored, and 'urlbase' is set to <URLBase>, if any.
+
+    Finished elements are cleared as parsing goes, so memory use stays low
+    however large the description. This is not faster than matching the
+    whole text at once, and is slower when the service comes last.
+    """
+    urlbase = ""
+    for _, elem in ElementTree.iterparse(fp):
+        tag = localname(elem.tag)
+        if tag == 'URLBase':
+            urlbase = (elem.text or "").strip()
+        elif tag == 'service':
+            fields = dict((localname(child.tag).lower(), (child.text or "").strip())
+                          for child in elem)
+            if fields.get('servicetype') in services and fields.get('controlurl'):
+                fields['urlbase'] = urlbase
+                return fields
+            elem.clear()
+        elif tag in ('device', 'iconList'):
+            elem.clear()
+
+
+def get_service(location, services):
+    """Return the description fields of a service, with absolute URLs
+
+    See parse_description(). 'controlurl', 'eventsuburl' and 'scpdurl' are
+    resolved against URLBase, or against location if there is none.
+    """
+    res = urllib23.build_opener().open(location)
+    try:
+        fields = parse_description(res, services)
+    except ElementTree.ParseError as e:
+        raise UpnpError("Invalid description at %s: %s" % (location, e))
+    finally:
+        res.close()
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-    sock.settimeout(10)
+    if not fields:
+        raise UpnpError("No controlURL found for server: %s" % location)
 
-    data = 'M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\nMAN: "ssdp:discover"\r\nMX: 5\r\nST: ssdp:all\r\n\r\n'
-    sock.sendto(data, ("239.255.255.250", 1900))
+    URLBase = fields['urlbase'] or "http://%s" % urllib23.urlparse(location).netloc
+    for key in ('controlurl', 'eventsuburl', 'scpdurl'):
+        if fields.get(key):
+            fields[key] = urllib23.urljoin(URLBase, fields[key])
 
-    while True:
-        try:
-            data = sock.recv(2048)
-        except socket.timeout:
-            raise UpnpError("No UPnP gateway found")
+    return fields
 
-        service  = search(re.compile(r"^ST:\s*([^\s]+WAN(IP|PPP)Connection:\d+)\s*$",
-                                     re.IGNORECASE | re.MULTILINE), data)
-        location = search(re.compile(r"^Location:\s*([^\s]+)\s*$",
-                                     re.IGNORECASE | re.MULTILINE), data)
 
-        if location and service:
-            break
+def control_url(location, service):
+    """Return the absolute controlURL of service from location's description"""
+    return get_service(location, [service])['controlurl']
 
-    data = urllib23.build_opener().open(location).read()
-    URLBase = get_tag("URLBase", data) or "http://%s" % urllib23.urlparse(location).netloc
-    for serv in get_tag("service", data, alltags=True):
-        if get_tag("serviceType", serv) == service:
-            controlURL = get_tag("ControlURL", serv)
-            break
-    else:
-        raise UpnpError("No controlURL found for server: %s" % location)
 
-    url = urllib23.urljoin(URLBase, controlURL)
+def soap_external_ip(url, service):
+    """Ask the gateway control url for its external IP via SOAP"""
     action = "GetExternalIPAddress"
     data = """<?xml version="1.0"?>
     <s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
@@ -97,16 +158,74 @@ def external_ip():
     return ip
 
 
+def read_cache(ttl=CACHE_TTL):
+    """Return cached (location, service, controlURL), or None if absent or expired"""
+    try:
+        with open(CACHE_FILE) as f:
+            timestamp, location, service, url = f.readline().strip().split('\t')
+        if time.time() - float(timestamp) > ttl:
+            log.debug("Gateway cache expired: %s", CACHE_FILE)
+            return None
+    except (IOError, ValueError) as e:
+        log.debug("No usable gateway cache: %s", e)
+        return None
+
+    return location, service, url
+
+
+def save_cache(location, service, url):
+    try:
+        with open(CACHE_FILE, 'w') as f:
+            f.write("%s\t%s\t%s\t%s\n" % (time.time(), location, service, url))
+    except IOError as e:
+        log.warning(e)
+
+
+def clear_cache():
+    try:
+        os.remove(CACHE_FILE)
+    except OSError:
+        pass
+
+
+def external_ip(usecache=True):
+    """Return the external IP address reported by the UPnP gateway
+
+    The discovered gateway is cached for CACHE_TTL seconds, so warm runs
+    skip SSDP discovery and the description download altogether. The cache
+    is discarded and discovery runs again if the cached gateway fails.
+    """
+    if usecache:
+        gateway = read_cache()
+        if gateway:
+            location, service, url = gateway
+            log.debug("Using cached gateway %s", url)
+            try:
+                return soap_external_ip(url, service)
+            except (UpnpError, IOError, socket.error) as e:
+                log.debug("Cached gateway failed, rediscovering: %s", e)
+                clear_cache()
+
+    location, service = discover()
+    url = control_url(location, service)
+    ip = soap_external_ip(url, service)
+    if usecache:
+        save_cache(location, service, url)
+
+    return ip
+
+
 USAGE = """Find external IP address via UPnP
-Usage: python upnp.py
+Usage: python upnp.py [--no-cache]
 """
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    usecache = sys.argv[1:] != ['--no-cache']
+    if len(sys.argv) > 1 and usecache:
         print(USAGE)
         sys.exit()
 
     try:
-        print(external_ip())
+        print(external_ip(usecache))
         sys.exit(0)
     except Exception as e:
         print(e)
@@ -20,80 +20,137 @@
 # Inspired by Nikos Fotoulis public domain code
 
 import sys
+import os
+import os.path as osp
 import re
-import socket
+import time
+import logging
+import xml.etree.ElementTree as ElementTree
 
 import requests
+import xdg.BaseDirectory as xdg
+
+import ssdp
+import ssdp3
+
+
+CACHE_FILE = osp.join(xdg.xdg_cache_home, 'upnp.cache')
+CACHE_TTL = 24 * 60 * 60  # seconds
+
+log = logging.getLogger(__name__)
 
 
 class UpnpError(Exception):
     pass
 
 
-def external_ip():
-
-    def search(regex, text):
-        match = regex.search(text)
-        if match:
-            return match.groups()[0].strip()
+def search(regex, text):
+    match = regex.search(text)
+    if match:
+        return match.groups()[0].strip()
 
-    def get_tag(tag, text, alltags=False):
-        r = re.compile(fr"<{tag}>(.+?)</{tag}>", re.IGNORECASE | re.DOTALL)
-        if alltags:
-            return r.findall(text)
-        else:
-            return search(r, text)
 
-    def sockdata(data):
-        return bytes(re.sub('[\t ]*\r?\n[\t ]*', '\r\n', data.lstrip()), 'utf-8')
+def get_tag(tag, text, alltags=False):
+    r = re.compile(fr"<{tag}>(.+?)</{tag}>", re.IGNORECASE | re.DOTALL)
+    if alltags:
+        return r.findall(text)
+    else:
+        return search(r, text)
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-    sock.settimeout(10)
 
-    data = """
-        M-SEARCH * HTTP/1.1
-        HOST: 239.255.255.250:1900
-        MAN: "ssdp:discover"
-        MX: 5
-        ST: ssdp:all
+def discover(mx=2, timeout=5, allinterfaces=False):
+    """Return a list of (location, serviceType) WAN*Connection endpoints via SSDP
 
+    With allinterfaces, search from every local interface at once and return
+    all endpoints answering within timeout, in order of arrival.
     """
-    sock.sendto(sockdata(data), ("239.255.255.250", 1900))
+    if allinterfaces:
+        responses = ssdp3.discover(mx=mx, timeout=timeout)
+        for response in responses:
+            log.debug("Gateway %s answered on %s after %.3fs",
+                      response.address, response.interface, response.elapsed)
+        endpoints = [(_.headers['location'], _.headers['st']) for _ in responses]
+    else:
+        headers = ssdp.discover(mx=mx, timeout=timeout)
+        endpoints = [(headers['location'], headers['st'])] if headers else []
+
+    if not endpoints:
+        raise UpnpError("No UPnP gateway found")
+
+    return endpoints
+
+
+def localname(tag):
+    """Strip the '{namespace}' prefix, if any, from an ElementTree tag"""
+    return tag.rsplit('}', 1)[-1]
 
-    endpoints = []
-    while True:
+
+def parse_description(fp, services):
+    """Stream-parse a device description, return the first matching service
+
+    Return a dict of the <service> fields, with lowercase keys, for the
+    first service whose serviceType is in services and has a controlURL, or
+    None if no service matches. Parsing stops once it is found, so fp may
+    not be read to the end. Services in nested deviceLists are found,
+    namespaces are ignored, and 'urlbase' is set to <URLBase>, if any.
+
+    Finished elements are cleared as parsing goes, so memory use stays low
+    however large the description. This is not faster than matching the
+    whole text at once, and is slower when the service comes last.
+    """
+    urlbase = ""
+    for _, elem in ElementTree.iterparse(fp):
+        tag = localname(elem.tag)
+        if tag == 'URLBase':
+            urlbase = (elem.text or "").strip()
+        elif tag == 'service':
+            fields = {localname(child.tag).lower(): (child.text or "").strip()
+                      for child in elem}
+            if fields.get('servicetype') in services and fields.get('controlurl'):
+                fields['urlbase'] = urlbase
+                return fields
+            elem.clear()
+        elif tag in ('device', 'iconList'):
+            elem.clear()
+
+
+def get_service(location, services):
+    """Return the description fields of a service, with absolute URLs
+
+    See parse_description(). 'controlurl', 'eventsuburl' and 'scpdurl' are
+    resolved against URLBase, or against location if there is none.
+    """
+    with requests.get(location, stream=True) as res:
+        res.raw.decode_content = True
         try:
-            data = sock.recv(2048).decode()
-        except socket.timeout:
-            if endpoints:
-                break
-            raise UpnpError("No UPnP gateway found")
-
-        service  = search(re.compile(r"^ST:\s*([^\s]+WAN(IP|PPP)Connection:\d+)\s*$",
-                                     re.IGNORECASE | re.MULTILINE), data)
-        location = search(re.compile(r"^Location:\s*([^\s]+)\s*$",
-                                     re.IGNORECASE | re.MULTILINE), data)
-
-        if location and service:
-            endpoints.append((location, service))
-            if ':WANIPConnection:' in service:
-                break
-
-    controlURL = ""
-    for location, service in endpoints:
-        data = requests.get(location).text
-        URLBase = get_tag("URLBase", data) or ("http://" + requests.utils.urlparse(location).netloc)
-        for serv in get_tag("service", data, alltags=True):
-            if get_tag("serviceType", serv) == service:
-                controlURL = get_tag("ControlURL", serv)
-                break
-        if controlURL:
-            break
-    else:
+            fields = parse_description(res.raw, services)
+        except ElementTree.ParseError as e:
+            raise UpnpError(f"Invalid description at {location}: {e}")
+
+    if not fields:
         raise UpnpError(f"No controlURL found for server: {location}")
 
-    url = requests.compat.urljoin(URLBase, controlURL)
+    URLBase = fields['urlbase'] or ("http://" + requests.utils.urlparse(location).netloc)
+    for key in ('controlurl', 'eventsuburl', 'scpdurl'):
+        if fields.get(key):
+            fields[key] = requests.compat.urljoin(URLBase, fields[key])
+
+    return fields
+
+
+def control_url(endpoints):
+    """Return (location, service, controlURL) for the first usable endpoint"""
+    for location, service in endpoints:
+        try:
+            return location, service, get_service(location, [service])['controlurl']
+        except UpnpError as e:
+            log.debug(e)
+
+    raise UpnpError(f"No controlURL found for server: {location}")
+
+
+def soap_external_ip(url, service):
+    """Ask the gateway control url for its external IP via SOAP"""
     action = "GetExternalIPAddress"
     headers = {
         'content-type': 'text/xml; charset="utf-8"',
@@ -116,16 +173,75 @@ def external_ip():
     return ip
 
 
+def read_cache(ttl=CACHE_TTL):
+    """Return cached (location, service, controlURL), or None if absent or expired"""
+    try:
+        with open(CACHE_FILE) as f:
+            timestamp, location, service, url = f.readline().strip().split('\t')
+        if time.time() - float(timestamp) > ttl:
+            log.debug("Gateway cache expired: %s", CACHE_FILE)
+            return None
+    except (OSError, ValueError) as e:
+        log.debug("No usable gateway cache: %s", e)
+        return None
+
+    return location, service, url
+
+
+def save_cache(location, service, url):
+    try:
+        with open(CACHE_FILE, 'w') as f:
+            f.write(f"{time.time()}\t{location}\t{service}\t{url}\n")
+    except OSError as e:
+        log.warning(e)
+
+
+def clear_cache():
+    try:
+        os.remove(CACHE_FILE)
+    except OSError:
+        pass
+
+
+def external_ip(usecache=True, allinterfaces=False):
+    """Return the external IP address reported by the UPnP gateway
+
+    The discovered gateway is cached for CACHE_TTL seconds, so warm runs
+    skip SSDP discovery and the description download altogether. The cache
+    is discarded and discovery runs again if the cached gateway fails.
+    With allinterfaces, discovery searches from all local interfaces at once.
+    """
+    if usecache:
+        gateway = read_cache()
+        if gateway:
+            location, service, url = gateway
+            log.debug("Using cached gateway %s", url)
+            try:
+                return soap_external_ip(url, service)
+            except (UpnpError, OSError, requests.RequestException) as e:
+                log.debug("Cached gateway failed, rediscovering: %s", e)
+                clear_cache()
+
+    location, service, url = control_url(discover(allinterfaces=allinterfaces))
+    ip = soap_external_ip(url, service)
+    if usecache:
+        save_cache(location, service, url)
+
+    return ip
+
+
 USAGE = """Find external IP address via UPnP
-Usage: python3 upnp3.py
+Usage: python3 upnp3.py [--no-cache] [--all-interfaces]
 """
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    options = set(sys.argv[1:])
+    if options - {'--no-cache', '--all-interfaces'}:
         print(USAGE)
         sys.exit()
 
     try:
-        print(external_ip())
+        print(external_ip(usecache='--no-cache' not in options,
+                          allinterfaces='--all-interfaces' in options))
         sys.exit(0)
     except Exception as e:
         print(e)